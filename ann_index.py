@@ -0,0 +1,172 @@
+import argparse
+import math
+import os
+import time
+
+import faiss
+import numpy as np
+
+# Build parameters per index type; any of them can be overridden per call
+INDEX_TYPES = {
+    "flat": {},
+    "hnsw": {"m": 32, "ef_construction": 80, "ef_search": 64},
+    "ivf": {"nlist": None, "nprobe": 8},
+    "sq8": {},
+    "pq": {"m": 16, "nbits": 8},
+    "ivfpq": {"nlist": None, "nprobe": 8, "m": 16, "nbits": 8},
+}
+
+# Types whose stored vectors are lossy codes; reading them back only approximates the originals
+QUANTIZED_TYPES = ("sq8", "pq", "ivfpq")
+
+# Trained indexes need enough vectors to learn centroids; smaller corpora stay flat
+MIN_TRAIN_VECTORS = 1024
+
+
+def _default_nlist(n):
+    return max(1, min(4096, int(4 * math.sqrt(n))))
+
+
+def build_index(vectors, index_type="flat", **params):
+    """Build a FAISS index of ``index_type`` over ``vectors`` (n x dim, L2 metric)."""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}; choose from {', '.join(INDEX_TYPES)}")
+    params = {**INDEX_TYPES[index_type], **params}
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, dim = vectors.shape
+    if "m" in params and index_type != "hnsw" and dim % params["m"]:
+        raise ValueError(f"PQ sub-quantizers m={params['m']} must divide the dimension {dim}")
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params["m"])
+        index.hnsw.efConstruction = params["ef_construction"]
+        index.hnsw.efSearch = params["ef_search"]
+    elif index_type == "sq8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit)
+    elif index_type == "pq":
+        index = faiss.IndexPQ(dim, params["m"], params["nbits"])
+    else:
+        nlist = min(params["nlist"] or _default_nlist(n), n)
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, params["m"], params["nbits"])
+        index.nprobe = params["nprobe"]
+        # Lets the vectors be read back when the index is rebuilt
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def index_vectors(index):
+    """Read every vector back out of ``index`` (approximate for quantized indexes)."""
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def index_vector(index, position):
+    """Read the vector at ``position`` back out of ``index``.
+
+    ``reconstruct`` goes through an IVF index's direct map, which FAISS
+    doesn't update on later adds; ``reconstruct_n`` scans the lists instead.
+    """
+    return index.reconstruct_n(position, 1)[0]
+
+
+def index_memory_bytes(index):
+    return faiss.serialize_index(index).nbytes
+
+
+def recall_report(vectors, configs=None, k=4, queries=None, n_queries=200, seed=0):
+    """Measure recall@k and per-query latency of each index config against exact search.
+
+    ``configs`` is a list of ``(index_type, params)`` and defaults to every
+    type with its default parameters. Without explicit ``queries``, up to
+    ``n_queries`` vectors (at most a fifth of them) are held out of the
+    indexes and used as queries; a query that is itself indexed is always
+    its own nearest hit, which overstates recall. Configs that cannot be
+    trained on this few vectors are left out of the report.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    if configs is None:
+        configs = [(index_type, {}) for index_type in INDEX_TYPES]
+    if queries is None:
+        rng = np.random.default_rng(seed)
+        order = rng.permutation(len(vectors))
+        held_out = min(n_queries, max(1, len(vectors) // 5))
+        queries = vectors[order[:held_out]]
+        vectors = np.ascontiguousarray(vectors[np.sort(order[held_out:])])
+    queries = np.ascontiguousarray(queries, dtype="float32")
+    k = min(k, len(vectors))
+
+    _, truth = build_index(vectors, "flat").search(queries, k)
+
+    rows = []
+    for index_type, params in configs:
+        start = time.perf_counter()
+        try:
+            index = build_index(vectors, index_type, **params)
+        except RuntimeError:
+            continue
+        build_seconds = time.perf_counter() - start
+
+        latencies = []
+        found = []
+        for query in queries:
+            start = time.perf_counter()
+            _, ids = index.search(query[None, :], k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            found.append(ids[0])
+        recall = float(np.mean([
+            len(set(hits) & set(expected)) / k for hits, expected in zip(found, truth)
+        ]))
+        rows.append({
+            "index_type": index_type,
+            "params": {**INDEX_TYPES[index_type], **params},
+            "build_seconds": build_seconds,
+            "recall": recall,
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "memory_bytes": index_memory_bytes(index),
+        })
+    return rows
+
+
+def choose_index(rows, recall_target):
+    """Pick the smallest (then fastest) index in a ``recall_report`` that meets ``recall_target``."""
+    candidates = [row for row in rows if row["recall"] >= recall_target]
+    if not candidates:
+        return next(row for row in rows if row["index_type"] == "flat")
+    return min(candidates, key=lambda row: (row["memory_bytes"], row["p50_ms"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare FAISS index types on a saved Study-Buddy index"
+    )
+    parser.add_argument("index_dir", help="Folder holding an index.faiss saved by FAISS.save_local")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--recall", type=float, default=0.95, help="Recall target for the recommendation")
+    args = parser.parse_args()
+
+    vectors = index_vectors(faiss.read_index(os.path.join(args.index_dir, "index.faiss")))
+    rows = recall_report(vectors, k=args.k, n_queries=args.queries)
+    print(f"{len(vectors)} vectors, k={args.k}")
+    print(f"{'type':<8}{'recall':>8}{'p50 ms':>10}{'p95 ms':>10}{'build s':>10}{'memory MB':>12}")
+    for row in rows:
+        print(
+            f"{row['index_type']:<8}{row['recall']:>8.3f}{row['p50_ms']:>10.3f}"
+            f"{row['p95_ms']:>10.3f}{row['build_seconds']:>10.2f}"
+            f"{row['memory_bytes'] / 1024 ** 2:>12.2f}"
+        )
+    print(f"Recommended for recall >= {args.recall}: {choose_index(rows, args.recall)['index_type']}")
+
+
+if __name__ == "__main__":
+    main()
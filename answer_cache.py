@@ -0,0 +1,181 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from embedding_engine import get_embedding_engine
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# Also match differently worded questions over the same retrieved chunks
+ANSWER_CACHE_SEMANTIC = os.getenv("ANSWER_CACHE_SEMANTIC", "0") == "1"
+SEMANTIC_THRESHOLD = 0.92
+
+
+def normalize_question(question):
+    question = unicodedata.normalize("NFKC", question).lower()
+    question = re.sub(r"\s+", " ", question).strip()
+    return question.rstrip("?!. ")
+
+
+def chunk_id(doc):
+    """Content-derived chunk ID, stable across sessions that embedded the same file."""
+    return hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class AnswerCache:
+    """LRU + TTL cache of LLM answers shared by every session in the process.
+
+    An answer is keyed by the normalized question, the retrieved chunks, the
+    prompt template and the chat history the prompt was built with. In
+    semantic mode a miss falls back to the most similar cached question whose
+    context (chunks, template, history) is identical. Answers given without
+    retrieved chunks are not cached: nothing but the question would key them.
+    """
+
+    def __init__(self, max_entries=ANSWER_CACHE_SIZE, ttl_seconds=ANSWER_CACHE_TTL,
+                 embeddings=None,
+                 similarity_threshold=SEMANTIC_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # Semantic matching is on when an embeddings model is given
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()
+        # context key -> keys of entries answered over that context
+        self._by_context = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _keys(self, question, docs, template, chat_history):
+        context = json.dumps([
+            [chunk_id(doc) for doc in docs],
+            hashlib.sha1(template.encode("utf-8")).hexdigest(),
+            chat_history,
+        ])
+        context_key = hashlib.sha256(context.encode("utf-8")).hexdigest()
+        key = hashlib.sha256(
+            f"{context_key}\n{normalize_question(question)}".encode("utf-8")
+        ).hexdigest()
+        return key, context_key
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        siblings = self._by_context.get(entry["context_key"])
+        if siblings is not None:
+            siblings.discard(key)
+            if not siblings:
+                del self._by_context[entry["context_key"]]
+
+    def _live(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry["expires_at"] <= now:
+            self._drop(key)
+            self.expirations += 1
+            return None
+        return entry
+
+    def get(self, question, docs, template, chat_history=""):
+        """Return a cached answer or None; counts a hit or a miss either way."""
+        if not docs:
+            return None
+        key, context_key = self._keys(question, docs, template, chat_history)
+        now = time.time()
+        with self._lock:
+            entry = self._live(key, now)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["answer"]
+            candidates = list(self._by_context.get(context_key, ()))
+
+        if self.embeddings is not None and candidates:
+            vector = self.embeddings.embed_query(normalize_question(question))
+            with self._lock:
+                best_key, best_score = None, self.similarity_threshold
+                for candidate in candidates:
+                    entry = self._live(candidate, now)
+                    if entry is None or entry["vector"] is None:
+                        continue
+                    score = _cosine(vector, entry["vector"])
+                    if score >= best_score:
+                        best_key, best_score = candidate, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.hits += 1
+                    self.semantic_hits += 1
+                    return self._entries[best_key]["answer"]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, question, docs, template, answer, chat_history=""):
+        if not docs:
+            return
+        key, context_key = self._keys(question, docs, template, chat_history)
+        vector = None
+        if self.embeddings is not None:
+            vector = self.embeddings.embed_query(normalize_question(question))
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = {
+                "answer": answer,
+                "expires_at": time.time() + self.ttl_seconds,
+                "context_key": context_key,
+                "vector": vector,
+            }
+            self._by_context.setdefault(context_key, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_context.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """Return the process-wide answer cache, configured from the environment."""
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            embeddings = get_embedding_engine() if ANSWER_CACHE_SEMANTIC else None
+            _answer_cache = AnswerCache(embeddings=embeddings)
+        return _answer_cache
@@ -0,0 +1,183 @@
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from llm_scheduler import PRIORITY_BACKGROUND, LLMBusyError, estimate_tokens, get_llm_scheduler
+from pipeline import RAG_TEMPLATE, RETRIEVAL_K, StudyPipeline, retrieve_many
+from vector_index import INDEX_MMAP
+
+# LLM calls a batch keeps in flight (the shared scheduler's limits still apply)
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+# Questions embedded and searched together
+BATCH_SIZE = 64
+
+
+def read_questions(path):
+    """``{"id", "question", ...}`` rows from a JSONL or CSV file.
+
+    JSONL lines are objects with a ``question`` field or bare strings; CSV
+    files need a ``question`` column. Rows without an ``id`` are numbered by
+    their position in the file, so reruns over the same file line up.
+    """
+    rows = []
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            records = list(csv.DictReader(f))
+        else:
+            records = [json.loads(line) for line in f if line.strip()]
+    for number, record in enumerate(records, 1):
+        if isinstance(record, str):
+            record = {"question": record}
+        question = (record.get("question") or "").strip()
+        if not question:
+            continue
+        # An id of 0 or "" is still the input's own id
+        record_id = record["id"] if "id" in record else number
+        rows.append({**record, "id": str(record_id), "question": question})
+    return rows
+
+
+def completed_ids(output_path):
+    """IDs already answered in ``output_path``; a line cut off by an interruption is dropped."""
+    if not os.path.exists(output_path):
+        return set()
+    with open(output_path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+            data = data[:data.rfind(b"\n") + 1]
+    done = set()
+    for line in data.decode("utf-8").splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        # Failed questions are retried on the next run
+        if "error" not in record:
+            done.add(str(record["id"]))
+    return done
+
+
+def _sources(docs):
+    return [
+        {"source": doc.metadata.get("source", "unknown"), "page": doc.metadata.get("page")}
+        for doc in docs
+    ]
+
+
+def run_batch(pipeline, questions, output_path, concurrency=BATCH_CONCURRENCY,
+              batch_size=BATCH_SIZE, k=RETRIEVAL_K, on_result=None):
+    """Answer ``questions`` from ``pipeline``'s index, appending one JSON line per answer.
+
+    Questions already answered in ``output_path`` are skipped, so an
+    interrupted run picks up where it stopped; failed questions get a line
+    with an ``error`` and are retried next time. Each batch of ``batch_size``
+    questions is embedded and searched in one go; its LLM calls run on
+    ``concurrency`` threads while the next batch is retrieved. Lines are
+    written as answers arrive, with per-question timings. ``on_result``
+    is called with each record. Returns counts of ``answered``, ``failed``
+    and ``skipped`` questions.
+    """
+    done = completed_ids(output_path)
+    pending = [row for row in questions if row["id"] not in done]
+    counts = {"answered": 0, "failed": 0, "skipped": len(questions) - len(pending)}
+    llm = pipeline.llm
+    write_lock = threading.Lock()
+
+    def answer(row, docs, packed, retrieval_seconds):
+        start = time.perf_counter()
+        record = {"id": row["id"], "question": row["question"]}
+        prompt = RAG_TEMPLATE.format(context=packed["text"], chat_history="", question=row["question"])
+        try:
+            record["answer"] = get_llm_scheduler().call(
+                lambda: llm.invoke(prompt),
+                priority=PRIORITY_BACKGROUND,
+                prompt_tokens=estimate_tokens(prompt)
+            ).content
+        except LLMBusyError as e:
+            record["error"] = str(e)
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+        llm_seconds = time.perf_counter() - start
+        record["sources"] = _sources(docs)
+        record["timings"] = {
+            "retrieval_ms": round(retrieval_seconds * 1000, 2),
+            "llm_ms": round(llm_seconds * 1000, 2),
+            "total_ms": round((retrieval_seconds + llm_seconds) * 1000, 2),
+        }
+        with write_lock:
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            counts["failed" if "error" in record else "answered"] += 1
+        if on_result is not None:
+            on_result(record)
+
+    with open(output_path, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch-qa") as executor:
+        previous = []
+        try:
+            for start in range(0, len(pending), batch_size):
+                batch = pending[start:start + batch_size]
+                retrieval_start = time.perf_counter()
+                retrieved = retrieve_many(pipeline.doc_index, [row["question"] for row in batch], k)
+                # The batch's retrieval cost is shared evenly by its questions
+                retrieval_seconds = (time.perf_counter() - retrieval_start) / len(batch)
+                # Let the previous batch's answers finish before queueing more
+                wait(previous)
+                previous = [
+                    executor.submit(answer, row, docs, packed, retrieval_seconds)
+                    for row, (docs, packed) in zip(batch, retrieved)
+                ]
+            wait(previous)
+        finally:
+            # On an interruption, drop queued questions; they are answered on the next run
+            executor.shutdown(cancel_futures=True)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Answer a file of questions against a saved Study-Buddy index"
+    )
+    parser.add_argument("index", help="Folder written by `python pipeline.py build`")
+    parser.add_argument("questions", help="JSONL (question per line) or CSV with a 'question' column")
+    parser.add_argument("output", help="JSONL file answers are appended to; rerun to resume")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="LLM calls in flight")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Questions retrieved per batch")
+    parser.add_argument("--k", type=int, default=RETRIEVAL_K)
+    parser.add_argument("--mmap", action="store_true", default=INDEX_MMAP,
+                        help="Search the index from disk instead of loading it into memory")
+    args = parser.parse_args()
+
+    questions = read_questions(args.questions)
+    pipeline = StudyPipeline.load(args.index, index_cache=None, mmap=args.mmap)
+    start = time.perf_counter()
+    total = len(questions)
+
+    def report(record):
+        status = "failed" if "error" in record else f"{record['timings']['total_ms']:.0f} ms"
+        print(f"[{record['id']}] {status}", flush=True)
+
+    try:
+        counts = run_batch(
+            pipeline, questions, args.output, concurrency=args.concurrency,
+            batch_size=args.batch_size, k=args.k, on_result=report
+        )
+    except KeyboardInterrupt:
+        print(f"Interrupted; rerun the same command to resume from {args.output}")
+        raise SystemExit(130)
+    seconds = time.perf_counter() - start
+    print(
+        f"{counts['answered']} answered, {counts['failed']} failed, {counts['skipped']} already done "
+        f"of {total} in {seconds:.1f}s"
+    )
+    if counts["failed"]:
+        print("Rerun to retry the failed questions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+import argparse
+import ast
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+from fpdf import FPDF
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import HumanMessage
+
+from context_builder import pack_context
+from embedding_engine import DEFAULT_MODEL, get_embedding_engine
+from llm_scheduler import LLMScheduler, estimate_tokens
+from metrics import rss_bytes
+from pipeline import RAG_TEMPLATE
+from stub_llm import StubChatModel
+from vector_index import DocumentIndex
+
+DEFAULT_BASELINE = "benchmark_baseline.json"
+# Allowed slowdown (or throughput drop) against the baseline before the run fails
+DEFAULT_TOLERANCE = 0.25
+# Latency changes smaller than this are timer noise, whatever the percentage
+MIN_REGRESSION_MS = 1.0
+
+TOPICS = [
+    "graph", "tree", "heap", "hashing", "sorting", "recursion", "dynamic programming",
+    "greedy", "matrix", "probability", "entropy", "compiler", "parser", "scheduler",
+    "deadlock", "paging", "cache", "pipeline", "transistor", "fourier",
+]
+WORDS = [
+    "algorithm", "complexity", "theorem", "lemma", "proof", "definition", "example",
+    "property", "node", "edge", "vertex", "weight", "memory", "process", "thread",
+    "signal", "frequency", "register", "instruction", "bound", "optimal", "invariant",
+]
+# Metric name -> True when higher is better
+METRICS = {
+    "ingest_pages_per_second": True,
+    "ingest_chunks_per_second": True,
+    "ingest_peak_rss_mb": False,
+    "retrieval_p50_ms": False,
+    "retrieval_p95_ms": False,
+    "retrieval_p99_ms": False,
+    "chat_first_token_p50_ms": False,
+    "chat_first_token_p95_ms": False,
+    "chat_total_p50_ms": False,
+    "chat_total_p95_ms": False,
+    "chat_total_p99_ms": False,
+    "chat_turns_per_second": True,
+    "chat_peak_rss_mb": False,
+    "startup_import_ms": False,
+}
+# Loaded on first use of the feature that needs them; listed in the report if imported at startup
+HEAVY_MODULES = [
+    "langchain_groq", "langchain_huggingface", "sentence_transformers", "torch", "faiss",
+    "langchain_community", "langchain_text_splitters", "pypdf", "fpdf", "docx",
+]
+
+
+def _paragraph(rng, topic, words=120):
+    return " ".join(
+        topic if rng.random() < 0.08 else rng.choice(WORDS) for _ in range(words)
+    ) + "."
+
+
+def make_corpus(n_pdfs=4, pages_per_pdf=25, n_texts=2, seed=0):
+    """Deterministic ``(name, bytes)`` corpus of lecture-note-like PDFs and text files."""
+    rng = random.Random(seed)
+    files = []
+    for i in range(n_pdfs):
+        pdf = FPDF()
+        for page in range(pages_per_pdf):
+            topic = TOPICS[(i * pages_per_pdf + page) % len(TOPICS)]
+            pdf.add_page()
+            pdf.set_font("Arial", "B", 12)
+            pdf.cell(0, 8, f"Lecture {i + 1}.{page + 1}: {topic}", 0, 1)
+            pdf.set_font("Arial", "", 10)
+            for _ in range(4):
+                pdf.multi_cell(0, 5, _paragraph(rng, topic))
+        data = pdf.output(dest="S")
+        files.append((f"lecture_{i + 1}.pdf", data.encode("latin-1") if isinstance(data, str) else bytes(data)))
+    for i in range(n_texts):
+        text = "\n\n".join(_paragraph(rng, TOPICS[(i + j) % len(TOPICS)]) for j in range(80))
+        files.append((f"notes_{i + 1}.txt", text.encode("utf-8")))
+    return files
+
+
+def make_queries(n, seed=1):
+    rng = random.Random(seed)
+    return [
+        f"explain the {rng.choice(WORDS)} of {rng.choice(TOPICS)} with an {rng.choice(WORDS)} ({i})"
+        for i in range(n)
+    ]
+
+
+def percentiles(samples):
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    values = np.asarray(samples) * 1000
+    return {f"p{q}": float(np.percentile(values, q)) for q in (50, 95, 99)}
+
+
+class PeakRSS:
+    """Samples resident memory on a thread while the ``with`` block runs."""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = rss_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+
+def startup_modules(app=os.path.join(os.path.dirname(os.path.abspath(__file__)), "rag.py")):
+    """Modules the app script imports at the top level, i.e. before its first paint."""
+    with open(app, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            modules.append(node.module)
+    return modules
+
+
+def import_report(modules):
+    """Import ``modules`` in a fresh interpreter and return the cost per top-level import.
+
+    Uses ``python -X importtime``; returns ``{"total_ms", "modules": [(name, ms)], "heavy": [...]}``
+    with modules sorted by cumulative import time and ``heavy`` listing the
+    ``HEAVY_MODULES`` that got pulled in.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "; ".join(f"import {name}" for name in modules)],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing the app modules failed:\n{result.stderr[-2000:]}")
+    costs = []
+    loaded = set()
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].strip()
+        loaded.add(name.split(".")[0])
+        # Only the statement's own imports count; the rest is interpreter startup or nested
+        if parts[2][1:] == name and name in modules:
+            costs.append((name, int(parts[1]) / 1000))
+    costs.sort(key=lambda item: item[1], reverse=True)
+    return {
+        "total_ms": sum(ms for _, ms in costs),
+        "modules": costs,
+        "heavy": [name for name in HEAVY_MODULES if name in loaded],
+    }
+
+
+def print_import_report(report, top=15):
+    print(f"Startup imports: {report['total_ms']:.0f} ms")
+    for name, ms in report["modules"][:top]:
+        print(f"  {name:<40}{ms:>10.1f} ms")
+    print("Heavy modules loaded at startup: " + (", ".join(report["heavy"]) or "none"))
+
+
+def run_benchmark(files, queries, sessions=4, turns=5, embeddings="model", index_type="flat",
+                  first_token_seconds=0.05, tokens_per_second=400.0):
+    """Run ingest, retrieval and chat against ``files`` and return the metrics dict."""
+    if embeddings == "fake":
+        model = DeterministicFakeEmbedding(size=384)
+    else:
+        model = get_embedding_engine(DEFAULT_MODEL)
+        model.load()
+    # Start the parser pool and the model before anything is timed
+    DocumentIndex(model, DEFAULT_MODEL, index_cache=None).add_files([("warm-up.txt", b"warm up " * 200)])
+    doc_index = DocumentIndex(model, DEFAULT_MODEL, index_cache=None, index_type=index_type)
+
+    pages = {}
+    with PeakRSS() as ingest_rss:
+        start = time.perf_counter()
+        added = doc_index.add_files(
+            files, on_progress=lambda stage, done, total: pages.update({stage: (done, total)})
+        )
+        ingest_seconds = time.perf_counter() - start
+    chunks = sum(added.values())
+    total_pages = pages.get("pages", (0, 0))[1]
+
+    retrieval = []
+    for query in queries:
+        start = time.perf_counter()
+        doc_index.search(query, k=4)
+        retrieval.append(time.perf_counter() - start)
+
+    # Every session shares one stub model and scheduler, as sessions share them in the app
+    llm = StubChatModel(first_token_seconds=first_token_seconds, tokens_per_second=tokens_per_second)
+    scheduler = LLMScheduler(requests_per_minute=0, tokens_per_minute=0, max_concurrency=sessions)
+    first_tokens, totals = [], []
+    lock = threading.Lock()
+
+    def session(number):
+        for turn in range(turns):
+            question = queries[(number * turns + turn) % len(queries)] + f" [session {number}]"
+            start = time.perf_counter()
+            context = pack_context(doc_index.search(question, k=4))["text"]
+            prompt = RAG_TEMPLATE.format(context=context, chat_history="", question=question)
+            first = None
+            for _ in scheduler.stream(
+                lambda: (chunk.content for chunk in llm.stream([HumanMessage(content=prompt)])),
+                prompt_tokens=estimate_tokens(prompt),
+            ):
+                if first is None:
+                    first = time.perf_counter() - start
+            with lock:
+                first_tokens.append(first or 0.0)
+                totals.append(time.perf_counter() - start)
+
+    with PeakRSS() as chat_rss:
+        start = time.perf_counter()
+        threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        chat_seconds = time.perf_counter() - start
+
+    retrieval_ms = percentiles(retrieval)
+    first_ms = percentiles(first_tokens)
+    total_ms = percentiles(totals)
+    return {
+        "files": len(files),
+        "pages": total_pages,
+        "chunks": chunks,
+        "sessions": sessions,
+        "turns": len(totals),
+        "ingest_seconds": ingest_seconds,
+        "ingest_pages_per_second": total_pages / ingest_seconds,
+        "ingest_chunks_per_second": chunks / ingest_seconds,
+        "ingest_peak_rss_mb": ingest_rss.peak / 1024 ** 2,
+        "retrieval_p50_ms": retrieval_ms["p50"],
+        "retrieval_p95_ms": retrieval_ms["p95"],
+        "retrieval_p99_ms": retrieval_ms["p99"],
+        "chat_first_token_p50_ms": first_ms["p50"],
+        "chat_first_token_p95_ms": first_ms["p95"],
+        "chat_total_p50_ms": total_ms["p50"],
+        "chat_total_p95_ms": total_ms["p95"],
+        "chat_total_p99_ms": total_ms["p99"],
+        "chat_turns_per_second": len(totals) / chat_seconds,
+        "chat_peak_rss_mb": chat_rss.peak / 1024 ** 2,
+    }
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Return ``(metric, baseline, current)`` for every metric worse than baseline by more than ``tolerance``."""
+    regressions = []
+    for metric, higher_is_better in METRICS.items():
+        if metric not in baseline or metric not in results:
+            continue
+        expected, current = baseline[metric], results[metric]
+        if higher_is_better:
+            worse = current < expected * (1 - tolerance)
+        else:
+            slack = expected * tolerance
+            if metric.endswith("_ms"):
+                slack = max(slack, MIN_REGRESSION_MS)
+            worse = current > expected + slack
+        if worse:
+            regressions.append((metric, expected, current))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark ingestion, retrieval and chat latency on a synthetic corpus"
+    )
+    parser.add_argument("--pdfs", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=25, help="Pages per synthetic PDF")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--sessions", type=int, default=4, help="Concurrent chat sessions")
+    parser.add_argument("--turns", type=int, default=5, help="Chat turns per session")
+    parser.add_argument("--embeddings", choices=["model", "fake"], default="model",
+                        help="'fake' uses hash embeddings to time everything but the model")
+    parser.add_argument("--index-type", default="flat")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    parser.add_argument("--startup-only", action="store_true", help="Only report the app's import cost per module")
+    args = parser.parse_args()
+
+    startup = import_report(startup_modules())
+    print_import_report(startup)
+    if args.startup_only:
+        return
+    results = run_benchmark(
+        make_corpus(n_pdfs=args.pdfs, pages_per_pdf=args.pages),
+        make_queries(args.queries),
+        sessions=args.sessions,
+        turns=args.turns,
+        embeddings=args.embeddings,
+        index_type=args.index_type,
+    )
+    results["startup_import_ms"] = startup["total_ms"]
+    results["config"] = {key: value for key, value in vars(args).items()
+                         if key not in ("baseline", "save_baseline", "output", "tolerance", "startup_only")}
+
+    print(f"{results['files']} files, {results['pages']} pages, {results['chunks']} chunks, "
+          f"{results['sessions']} sessions x {args.turns} turns")
+    for metric in METRICS:
+        print(f"{metric:<28}{results[metric]:>12.2f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("config") != results["config"]:
+        print("Warning: baseline was recorded with different settings")
+    regressions = compare(results, baseline, args.tolerance)
+    for metric, expected, current in regressions:
+        print(f"REGRESSION {metric}: {current:.2f} vs baseline {expected:.2f}")
+    if regressions:
+        sys.exit(1)
+    print(f"No regressions beyond {args.tolerance:.0%} of baseline")
+
+
+if __name__ == "__main__":
+    main()
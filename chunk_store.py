@@ -0,0 +1,100 @@
+import json
+import sqlite3
+import threading
+
+from langchain_core.documents import Document
+
+CHUNKS_NAME = "chunks.sqlite"
+# Rows fetched per query when streaming the whole store
+SCAN_BATCH = 1000
+# Keeps ``IN (...)`` lists under SQLite's bound-parameter limit
+LOOKUP_BATCH = 500
+
+
+class ChunkStore:
+    """Read-only chunk text and metadata in SQLite, read per hit instead of held in memory.
+
+    Stands in for LangChain's ``InMemoryDocstore`` on indexes opened with
+    ``DocumentIndex.load(..., mmap=True)``. Rows are kept in FAISS position
+    order, so the same file also gives the position -> chunk ID map.
+    The store is read-only: ``DocumentIndex`` copies a mapped index into
+    memory before changing it.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        # One connection shared by the app's threads; lookups are short
+        self._connection = sqlite3.connect(
+            f"file:{self.path}?mode=ro", uri=True, check_same_thread=False
+        )
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def write(path, chunks):
+        """Create a store at ``path`` from ``(chunk ID, Document)`` pairs in FAISS position order."""
+        connection = sqlite3.connect(str(path))
+        try:
+            with connection:
+                connection.execute(
+                    "CREATE TABLE chunks (position INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE,"
+                    " content TEXT NOT NULL, metadata TEXT NOT NULL)"
+                )
+                connection.executemany(
+                    "INSERT INTO chunks VALUES (?, ?, ?, ?)",
+                    (
+                        (position, doc_id, doc.page_content, json.dumps(doc.metadata))
+                        for position, (doc_id, doc) in enumerate(chunks)
+                    )
+                )
+        finally:
+            connection.close()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._connection.execute(sql, params).fetchall()
+
+    def __len__(self):
+        return self._query("SELECT COUNT(*) FROM chunks")[0][0]
+
+    def ids(self):
+        """Chunk IDs in FAISS position order."""
+        return [doc_id for (doc_id,) in self._query("SELECT id FROM chunks ORDER BY position")]
+
+    def search(self, doc_id):
+        """The chunk stored under ``doc_id``, or a not-found message like ``InMemoryDocstore``."""
+        return self.get_many([doc_id]).get(doc_id, f"ID {doc_id} not found.")
+
+    def get_many(self, ids):
+        """``{chunk ID: Document}`` for those of ``ids`` in the store."""
+        ids = list(dict.fromkeys(ids))
+        docs = {}
+        for start in range(0, len(ids), LOOKUP_BATCH):
+            batch = ids[start:start + LOOKUP_BATCH]
+            rows = self._query(
+                f"SELECT id, content, metadata FROM chunks WHERE id IN ({','.join('?' * len(batch))})",
+                batch
+            )
+            for doc_id, content, metadata in rows:
+                docs[doc_id] = Document(id=doc_id, page_content=content, metadata=json.loads(metadata))
+        return docs
+
+    def iter_documents(self):
+        """Yield ``(chunk ID, Document)`` in position order without loading the whole store."""
+        position = -1
+        while True:
+            rows = self._query(
+                "SELECT position, id, content, metadata FROM chunks WHERE position > ?"
+                " ORDER BY position LIMIT ?",
+                (position, SCAN_BATCH)
+            )
+            if not rows:
+                return
+            for position, doc_id, content, metadata in rows:
+                yield doc_id, Document(id=doc_id, page_content=content, metadata=json.loads(metadata))
+
+    def text_bytes(self):
+        return self._query("SELECT COALESCE(SUM(LENGTH(content)), 0) FROM chunks")[0][0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,115 @@
+import logging
+import os
+import re
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Context sent to the LLM per turn, in approximate tokens (words and punctuation)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+# Shortest shared run of tokens treated as splitter overlap between two chunks
+MIN_OVERLAP_TOKENS = 8
+MAX_OVERLAP_TOKENS = 120
+# A chunk cut by the budget is still sent if at least this much of it fits
+MIN_PARTIAL_TOKENS = 64
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def tokenize(text):
+    """Return ``(tokens, spans)``: token strings and their character offsets in ``text``."""
+    tokens, spans = [], []
+    for match in TOKEN_PATTERN.finditer(text):
+        tokens.append(match.group())
+        spans.append(match.span())
+    return tokens, spans
+
+
+def count_tokens(text):
+    return sum(1 for _ in TOKEN_PATTERN.finditer(text))
+
+
+def _overlap(left, right):
+    """Length of the longest suffix of ``left`` that is also a prefix of ``right``."""
+    longest = min(len(left), len(right), MAX_OVERLAP_TOKENS)
+    for length in range(longest, MIN_OVERLAP_TOKENS - 1, -1):
+        if left[-length:] == right[:length]:
+            return length
+    return 0
+
+
+def _contains(outer, inner):
+    return " ".join(inner) in " ".join(outer)
+
+
+def source_label(doc):
+    label = Path(doc.metadata.get("source", "document")).name
+    if "page" in doc.metadata:
+        label += f", page {doc.metadata['page'] + 1}"
+    return label
+
+
+def pack_context(docs, budget_tokens=CONTEXT_TOKEN_BUDGET):
+    """Pack retrieved chunks (best first) into at most ``budget_tokens`` of prompt context.
+
+    Each chunk is tokenized once. Text it shares with an already packed chunk
+    from the same source (the splitter's overlap, or a duplicate) is cut,
+    and chunks are added in relevance order until the budget runs out, so
+    the lowest-ranked ones are trimmed or dropped first.
+
+    Returns a dict with the context ``text``, the ``sources`` actually sent
+    as ``(doc, excerpt)`` pairs numbered like the ``[Source i]`` labels in
+    the text, and the token counts before and after packing.
+    """
+    packed = []
+    tokens_retrieved = 0
+    remaining = budget_tokens
+    for doc in docs:
+        tokens, spans = tokenize(doc.page_content)
+        tokens_retrieved += len(tokens)
+        if remaining <= 0 or not tokens:
+            continue
+
+        start, stop = 0, len(tokens)
+        source = doc.metadata.get("source")
+        duplicate = False
+        for kept in packed:
+            if kept["source"] != source:
+                continue
+            if _contains(kept["tokens"], tokens[start:stop]):
+                duplicate = True
+                break
+            # Kept chunk runs into this one, or this one runs into the kept chunk
+            start += _overlap(kept["tokens"], tokens[start:stop])
+            stop -= _overlap(tokens[start:stop], kept["tokens"])
+        if duplicate or start >= stop:
+            continue
+
+        if stop - start > remaining:
+            if remaining < MIN_PARTIAL_TOKENS:
+                remaining = 0
+                continue
+            stop = start + remaining
+        packed.append({
+            "doc": doc,
+            "source": source,
+            "tokens": tokens[start:stop],
+            "excerpt": doc.page_content[spans[start][0]:spans[stop - 1][1]],
+        })
+        remaining -= stop - start
+
+    tokens_sent = sum(len(entry["tokens"]) for entry in packed)
+    text = "\n\n".join(
+        f"[Source {i}: {source_label(entry['doc'])}]\n{entry['excerpt']}"
+        for i, entry in enumerate(packed, 1)
+    )
+    logger.info(
+        "Packed %d of %d chunks into %d tokens (saved %d of %d)",
+        len(packed), len(docs), tokens_sent, tokens_retrieved - tokens_sent, tokens_retrieved
+    )
+    return {
+        "text": text,
+        "sources": [(entry["doc"], entry["excerpt"]) for entry in packed],
+        "tokens_retrieved": tokens_retrieved,
+        "tokens_sent": tokens_sent,
+    }
@@ -0,0 +1,164 @@
+import json
+import threading
+import time
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from index_cache import CACHE_ROOT
+from llm_scheduler import PRIORITY_BACKGROUND, estimate_tokens, get_llm_scheduler
+
+CONVERSATION_DIR = CACHE_ROOT / "conversations"
+# Messages kept verbatim for the {chat_history} slot, and their total size ceiling
+MEMORY_WINDOW_MESSAGES = 6
+MEMORY_MAX_CHARS = 12000
+SUMMARY_MAX_CHARS = 2000
+# Messages that left the window are folded into the summary once they add up to this much text
+SUMMARY_BATCH_CHARS = 4000
+CONVERSATION_RETENTION_DAYS = 7
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a student and a study assistant.
+Keep facts, definitions, names and open questions the student may refer back to. Stay under {max_words} words.
+
+Current summary:
+{summary}
+
+Messages to fold in:
+{messages}
+
+Updated summary:"""
+
+# Summaries run off the script thread so answering never waits on them
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="summarize")
+
+
+def format_messages(messages):
+    labels = {"user": "Human", "assistant": "Assistant"}
+    return "\n".join(f"{labels[message['role']]}: {message['content']}" for message in messages)
+
+
+def remove_stale_transcripts(root=CONVERSATION_DIR, max_age_days=CONVERSATION_RETENTION_DAYS):
+    cutoff = time.time() - max_age_days * 86400
+    for path in root.glob("*.jsonl"):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except OSError:
+            continue
+
+
+class ConversationStore:
+    """One session's conversation with a fixed in-memory footprint.
+
+    Every message is appended to a JSONL transcript on disk and read back a
+    page at a time for display. Only the last few turns stay in memory for
+    the prompt; older ones are folded into a rolling summary by the LLM on a
+    background thread. Turns that left the window stay in the prompt
+    verbatim until ``batch_chars`` of them have built up, so the summary
+    costs one LLM call per batch rather than one per turn.
+    """
+
+    def __init__(self, session_id, root=CONVERSATION_DIR, window_messages=MEMORY_WINDOW_MESSAGES,
+                 max_chars=MEMORY_MAX_CHARS, batch_chars=SUMMARY_BATCH_CHARS):
+        root.mkdir(parents=True, exist_ok=True)
+        self.path = root / f"{session_id}.jsonl"
+        self.window_messages = window_messages
+        self.max_chars = max_chars
+        self.batch_chars = batch_chars
+        self.summary = ""
+        self._recent = deque()
+        self._recent_chars = 0
+        # Messages out of the window and not yet in the summary, oldest first
+        self._pending = []
+        self._pending_chars = 0
+        self._summarizing = False
+        self._lock = threading.Lock()
+        # Byte offset of each transcript line, for paging without reading the whole file
+        self._offsets = array("Q")
+        self._size = 0
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def log(self, role, content):
+        """Append a message to the transcript shown to the user."""
+        line = (json.dumps({"role": role, "content": content, "time": time.time()}) + "\n").encode("utf-8")
+        with self._lock:
+            with open(self.path, "ab") as f:
+                f.write(line)
+            self._offsets.append(self._size)
+            self._size += len(line)
+
+    def page(self, start, stop=None):
+        """Read transcript messages ``start:stop`` back from disk."""
+        with self._lock:
+            offsets = self._offsets[start:stop]
+            end = self._offsets[stop] if stop is not None and stop < len(self._offsets) else self._size
+        if not offsets:
+            return []
+        with open(self.path, "rb") as f:
+            f.seek(offsets[0])
+            data = f.read(end - offsets[0])
+        return [json.loads(line) for line in data.decode("utf-8").splitlines()]
+
+    def remember(self, question, answer, llm=None):
+        """Add a completed turn to the prompt window, summarizing whatever falls out of it."""
+        with self._lock:
+            for message in ({"role": "user", "content": question},
+                            {"role": "assistant", "content": answer}):
+                self._recent.append(message)
+                self._recent_chars += len(message["content"])
+            while self._recent and (len(self._recent) > self.window_messages
+                                    or self._recent_chars > self.max_chars):
+                message = self._recent.popleft()
+                self._recent_chars -= len(message["content"])
+                self._pending.append(message)
+                self._pending_chars += len(message["content"])
+            if self._pending_chars < self.batch_chars or self._summarizing:
+                return
+            self._summarizing = True
+        _summary_executor.submit(self._summarize, llm)
+
+    def _summarize(self, llm):
+        while True:
+            with self._lock:
+                if self._pending_chars < self.batch_chars:
+                    self._summarizing = False
+                    return
+                # Left in _pending, and so in the prompt, until the new summary covers them
+                pending = list(self._pending)
+                summary = self.summary
+            try:
+                if llm is None:
+                    raise RuntimeError("no LLM configured")
+                prompt = SUMMARY_PROMPT.format(
+                    max_words=SUMMARY_MAX_CHARS // 6,
+                    summary=summary or "(none yet)",
+                    messages=format_messages(pending)
+                )
+                summary = get_llm_scheduler().call(
+                    lambda: llm.invoke(prompt),
+                    priority=PRIORITY_BACKGROUND,
+                    prompt_tokens=estimate_tokens(prompt),
+                    completion_tokens=SUMMARY_MAX_CHARS // 4
+                ).content.strip()
+            except Exception:
+                # Without a summary, keep the most recent text that fits
+                summary = f"{summary}\n{format_messages(pending)}".strip()
+            with self._lock:
+                self.summary = summary[-SUMMARY_MAX_CHARS:]
+                del self._pending[:len(pending)]
+                self._pending_chars -= sum(len(message["content"]) for message in pending)
+
+    def chat_history_text(self):
+        """Text for the prompt's {chat_history} slot: rolling summary plus the turns it doesn't cover."""
+        with self._lock:
+            recent = format_messages(list(self._pending) + list(self._recent))
+            summary = self.summary
+        if not summary:
+            return recent
+        return f"Summary of earlier conversation:\n{summary}\n\nRecent messages:\n{recent}"
+
+    def memory_chars(self):
+        with self._lock:
+            return self._recent_chars + len(self.summary) + self._pending_chars
@@ -0,0 +1,133 @@
+import hashlib
+import os
+import re
+import zlib
+
+# Drop chunks whose text repeats a chunk already indexed, merging their sources into it
+DEDUP = os.getenv("DEDUP", "1") == "1"
+# Estimated Jaccard similarity of word shingles at which two chunks count as duplicates
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+SHINGLE_WORDS = 5
+# MinHash signature of BANDS * ROWS values; chunks sharing any band are compared.
+# With 12 x 5, pairs at 0.8 similarity are compared over 99% of the time.
+BANDS = 12
+ROWS = 5
+# Largest prime below 2**32, so hashed values fit in uint32
+_PRIME = 4294967291
+
+# Any script's words, not only the Latin ones BM25's tokenizer keeps
+WORD_PATTERN = re.compile(r"\w+")
+
+_permutations = None
+
+
+def words_of(text):
+    return WORD_PATTERN.findall(text.casefold())
+
+
+def _hash_params():
+    global _permutations
+    if _permutations is None:
+        import numpy as np
+        rng = np.random.RandomState(1)
+        _permutations = (
+            rng.randint(1, _PRIME, BANDS * ROWS).astype(np.uint64),
+            rng.randint(0, _PRIME, BANDS * ROWS).astype(np.uint64),
+        )
+    return _permutations
+
+
+def minhash(words):
+    """MinHash signature (``BANDS * ROWS`` uint32 values) of ``words``' shingles."""
+    import numpy as np
+    shingles = {
+        " ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(len(words) - SHINGLE_WORDS + 1, 1))
+    }
+    hashes = np.fromiter(
+        (zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype=np.uint64, count=len(shingles)
+    )
+    a, b = _hash_params()
+    return ((hashes[:, None] * a + b) % _PRIME).min(axis=0).astype(np.uint32)
+
+
+class ChunkDeduplicator:
+    """Finds chunks that repeat one already indexed, exactly or nearly.
+
+    Exact repeats (ignoring case, punctuation and whitespace) are found by
+    hashing the chunk's words. Near repeats, such as the same slide
+    exported twice, are found with MinHash signatures bucketed by band
+    (locality-sensitive hashing) and confirmed when the signatures agree on
+    at least ``threshold`` of their values. A chunk with no words (only
+    symbols) is never matched or remembered.
+    """
+
+    def __init__(self, threshold=DEDUP_THRESHOLD):
+        self.threshold = threshold
+        # word hash -> chunk ID
+        self._exact = {}
+        # chunk ID -> (word hash, signature bytes)
+        self._chunks = {}
+        # band hash -> chunk IDs
+        self._buckets = {}
+
+    def __len__(self):
+        return len(self._chunks)
+
+    @staticmethod
+    def _bands(signature):
+        return [hash((band, signature[band * ROWS:(band + 1) * ROWS].tobytes())) for band in range(BANDS)]
+
+    def find(self, text):
+        """``(chunk ID, "exact" | "near")`` of an indexed chunk ``text`` repeats, or None."""
+        words = words_of(text)
+        if not words:
+            return None
+        match = self._exact.get(self._word_hash(words))
+        if match is not None:
+            return match, "exact"
+        if not self._buckets:
+            return None
+        import numpy as np
+        signature = minhash(words)
+        candidates = {doc_id for band in self._bands(signature) for doc_id in self._buckets.get(band, ())}
+        best, best_similarity = None, self.threshold
+        for doc_id in candidates:
+            other = np.frombuffer(self._chunks[doc_id][1], dtype=np.uint32)
+            similarity = float(np.mean(signature == other))
+            if similarity >= best_similarity:
+                best, best_similarity = doc_id, similarity
+        return (best, "near") if best is not None else None
+
+    @staticmethod
+    def _word_hash(words):
+        return hashlib.sha1(" ".join(words).encode("utf-8")).digest()
+
+    def add(self, doc_id, text):
+        words = words_of(text)
+        if not words:
+            return
+        word_hash = self._word_hash(words)
+        signature = minhash(words)
+        self._exact.setdefault(word_hash, doc_id)
+        self._chunks[doc_id] = (word_hash, signature.tobytes())
+        for band in self._bands(signature):
+            self._buckets.setdefault(band, []).append(doc_id)
+
+    def remove(self, doc_ids):
+        import numpy as np
+        for doc_id in doc_ids:
+            entry = self._chunks.pop(doc_id, None)
+            if entry is None:
+                continue
+            word_hash, signature = entry
+            if self._exact.get(word_hash) == doc_id:
+                del self._exact[word_hash]
+            for band in self._bands(np.frombuffer(signature, dtype=np.uint32)):
+                bucket = self._buckets[band]
+                bucket.remove(doc_id)
+                if not bucket:
+                    del self._buckets[band]
+
+    def memory_bytes(self):
+        # Signature plus word hash per chunk, and a bucket slot per band
+        return len(self._chunks) * (BANDS * ROWS * 4 + 20 + BANDS * 8)
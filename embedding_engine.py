@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+
+from metrics import rss_bytes
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# Query embeddings kept per model; repeated questions skip the encoder entirely
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+
+
+class EmbeddingEngine(Embeddings):
+    """One sentence-transformers model per server process, shared by every session.
+
+    The model is loaded lazily (or ahead of time through ``warm_up``) and all
+    encode calls are serialized, since the fast tokenizer is not safe to use
+    from several Streamlit script threads at once. Query embeddings are kept
+    in an LRU of ``query_cache_size`` entries.
+    """
+
+    def __init__(self, model_name=DEFAULT_MODEL, query_cache_size=QUERY_CACHE_SIZE):
+        self.model_name = model_name
+        self.query_cache_size = query_cache_size
+        self.query_cache_hits = 0
+        self.query_cache_misses = 0
+        self._query_cache = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        self.load_seconds = None
+        self.memory_bytes = None
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._warmup_lock = threading.Lock()
+        self._encode_lock = threading.Lock()
+        self._warmup_thread = None
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def load(self):
+        if self._model is not None:
+            return self._model
+        with self._load_lock:
+            if self._model is None:
+                rss_before = rss_bytes()
+                start = time.perf_counter()
+                # Imported here: it pulls in torch, which takes seconds
+                from langchain_huggingface import HuggingFaceEmbeddings
+                model = HuggingFaceEmbeddings(model_name=self.model_name)
+                # First encode allocates the runtime buffers; pay for it here
+                model.embed_query("warm-up")
+                self.load_seconds = time.perf_counter() - start
+                self.memory_bytes = max(rss_bytes() - rss_before, 0)
+                self._model = model
+        return self._model
+
+    def warm_up(self, background=True):
+        """Load the model now, optionally on a daemon thread so startup is not blocked."""
+        if self.loaded:
+            return
+        if not background:
+            self.load()
+            return
+        # Checked without a lock: the load holds _load_lock for its whole duration
+        if self._warmup_thread is not None:
+            return
+        with self._warmup_lock:
+            if self._warmup_thread is None:
+                self._warmup_thread = threading.Thread(
+                    target=self.load, name=f"warm-up {self.model_name}", daemon=True
+                )
+                self._warmup_thread.start()
+
+    def embed_documents(self, texts):
+        model = self.load()
+        with self._encode_lock:
+            return model.embed_documents(texts)
+
+    def embed_query(self, text):
+        with self._query_cache_lock:
+            vector = self._query_cache.get(text)
+            if vector is not None:
+                self._query_cache.move_to_end(text)
+                self.query_cache_hits += 1
+                return list(vector)
+        model = self.load()
+        with self._encode_lock:
+            vector = model.embed_query(text)
+        with self._query_cache_lock:
+            self.query_cache_misses += 1
+            self._query_cache[text] = vector
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return list(vector)
+
+    def embed_queries(self, texts):
+        """Embed many queries with one encoder call, reusing and filling the query cache."""
+        vectors = [None] * len(texts)
+        missing = {}
+        with self._query_cache_lock:
+            for i, text in enumerate(texts):
+                vector = self._query_cache.get(text)
+                if vector is not None:
+                    self._query_cache.move_to_end(text)
+                    self.query_cache_hits += 1
+                    vectors[i] = list(vector)
+                else:
+                    missing.setdefault(text, []).append(i)
+        if missing:
+            model = self.load()
+            with self._encode_lock:
+                encoded = model.embed_documents(list(missing))
+            with self._query_cache_lock:
+                for (text, positions), vector in zip(missing.items(), encoded):
+                    self.query_cache_misses += 1
+                    self._query_cache[text] = vector
+                    for i in positions:
+                        vectors[i] = list(vector)
+                while len(self._query_cache) > self.query_cache_size:
+                    self._query_cache.popitem(last=False)
+        return vectors
+
+    def stats(self):
+        return {
+            "model": self.model_name,
+            "loaded": self.loaded,
+            "loading": self._warmup_thread is not None and not self.loaded,
+            "load_seconds": self.load_seconds,
+            "memory_bytes": self.memory_bytes,
+            "query_cache_hits": self.query_cache_hits,
+            "query_cache_misses": self.query_cache_misses,
+        }
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_embedding_engine(model_name=DEFAULT_MODEL):
+    """Return the process-wide engine for ``model_name``, creating it on first use."""
+    with _engines_lock:
+        engine = _engines.get(model_name)
+        if engine is None:
+            engine = _engines[model_name] = EmbeddingEngine(model_name)
+        return engine
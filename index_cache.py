@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+# Bump when the on-disk layout or chunk metadata changes so stale entries are ignored
+CACHE_VERSION = 1
+
+# Root for everything the app keeps on disk between runs
+CACHE_ROOT = Path(os.getenv("STUDY_BUDDY_CACHE_DIR", Path.home() / ".cache" / "study-buddy"))
+DEFAULT_CACHE_DIR = CACHE_ROOT / "index"
+DEFAULT_MAX_BYTES = int(os.getenv("INDEX_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+
+class IndexCache:
+    """Content-addressed on-disk cache holding one FAISS index per uploaded file.
+
+    Entries are keyed by the file's bytes together with the embedding model and
+    splitter settings, so the same PDF uploaded again (under any name) loads its
+    saved vectors instead of being parsed, split and embedded a second time.
+    The cache is bounded by ``max_bytes`` and evicts least recently used entries.
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(data, model_name, chunk_size, chunk_overlap):
+        params = json.dumps(
+            {
+                "version": CACHE_VERSION,
+                "model": model_name,
+                "chunk_size": chunk_size,
+                "chunk_overlap": chunk_overlap,
+            },
+            sort_keys=True,
+        )
+        digest = hashlib.sha256(data)
+        digest.update(params.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return self.root / key
+
+    def get(self, key, embeddings):
+        """Return the cached vector store for ``key`` or None on a miss."""
+        path = self._entry_path(key)
+        if not (path / "index.faiss").exists():
+            return None
+        from langchain_community.vectorstores import FAISS
+        try:
+            vectorstore = FAISS.load_local(
+                str(path), embeddings, allow_dangerous_deserialization=True
+            )
+        except Exception:
+            # A half-written or corrupt entry is treated as a miss and dropped
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+        now = time.time()
+        os.utime(path, (now, now))
+        return vectorstore
+
+    def put(self, key, vectorstore, meta=None):
+        path = self._entry_path(key)
+        if path.exists():
+            return
+        tmp_path = self.root / f".tmp-{key}-{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        vectorstore.save_local(str(tmp_path))
+        with open(tmp_path / "meta.json", "w") as f:
+            json.dump({"created": time.time(), **(meta or {})}, f)
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            # Another session stored the same entry first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        self.evict()
+
+    @staticmethod
+    def _entry_size(path):
+        return sum(f.stat().st_size for f in path.iterdir() if f.is_file())
+
+    def entries(self):
+        """Return ``(path, size, last_used)`` for every complete entry."""
+        result = []
+        for path in self.root.iterdir():
+            if path.name.startswith(".") or not path.is_dir():
+                continue
+            try:
+                result.append((path, self._entry_size(path), path.stat().st_mtime))
+            except OSError:
+                continue
+        return result
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in ``max_bytes``."""
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        for path, _, _ in self.entries():
+            shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,114 @@
+import threading
+import time
+import weakref
+
+
+class IndexRegistry:
+    """Process-wide table of document indexes shared between sessions.
+
+    Indexes are keyed by ``DocumentIndex.set_key()``, a hash of the document
+    set, so every session that uploads the same files searches one copy of the
+    vectors instead of building its own. A shared index is treated as read
+    only; a session that wants to change its documents works on a clone.
+    Each entry counts the leases each session holds on it and is dropped,
+    freeing its memory, when the last one is released.
+    """
+
+    def __init__(self):
+        # key -> {"index": DocumentIndex, "sessions": {session id: leases}, "created": time}
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry["index"] if entry is not None else None
+
+    def attach(self, key, session_id, doc_index=None):
+        """Share the index registered under ``key`` with ``session_id``.
+
+        If none is registered yet, ``doc_index`` becomes the shared copy.
+        Returns the shared index, or None when there is nothing to attach to.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if doc_index is None:
+                    return None
+                entry = self._entries[key] = {
+                    "index": doc_index, "sessions": {}, "created": time.time()
+                }
+            entry["sessions"][session_id] = entry["sessions"].get(session_id, 0) + 1
+            return entry["index"]
+
+    def detach(self, key, session_id):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            leases = entry["sessions"].pop(session_id, 0) - 1
+            # A session re-leasing the key it already holds keeps its newer lease
+            if leases > 0:
+                entry["sessions"][session_id] = leases
+            if entry["sessions"]:
+                return
+            del self._entries[key]
+        # Frees what the index holds outside memory, e.g. a mapped index's chunk store
+        entry["index"].close()
+
+    def lease(self, key, session_id, doc_index=None):
+        """Attach and return an ``IndexLease`` holding the reference, or None."""
+        shared = self.attach(key, session_id, doc_index)
+        if shared is None:
+            return None
+        return IndexLease(self, key, session_id, shared)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        """One row per shared index: key, sessions, files, chunks and approximate memory."""
+        with self._lock:
+            entries = [(key, dict(entry)) for key, entry in self._entries.items()]
+        rows = []
+        for key, entry in entries:
+            counts = entry["index"].chunk_counts()
+            rows.append({
+                "key": key[:12],
+                "sessions": len(entry["sessions"]),
+                "files": len(counts),
+                "chunks": sum(counts.values()),
+                "memory_bytes": entry["index"].memory_bytes(),
+                "age_seconds": time.time() - entry["created"],
+            })
+        return rows
+
+
+class IndexLease:
+    """A session's reference to a shared index.
+
+    Released explicitly when the session switches documents, or when the
+    lease is garbage collected with the session's state.
+    """
+
+    def __init__(self, registry, key, session_id, doc_index):
+        self.key = key
+        self.doc_index = doc_index
+        self._finalizer = weakref.finalize(self, registry.detach, key, session_id)
+
+    def release(self):
+        self._finalizer()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_index_registry():
+    """Return the process-wide index registry."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = IndexRegistry()
+        return _registry
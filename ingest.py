@@ -0,0 +1,212 @@
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+# pypdf and the LangChain splitters are imported where used, keeping app startup cheap
+
+CHUNK_SIZE = 3000
+CHUNK_OVERLAP = 200
+
+# Parallel parsing: worker processes (0 or 1 parses in-process) and pages per PDF task
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = 16
+# Leading bytes checked before a file that isn't valid UTF-8 is read as text anyway
+TEXT_SNIFF_BYTES = 8192
+
+
+class UnreadableFileError(ValueError):
+    """An uploaded file that is neither a PDF nor text."""
+
+
+def is_pdf(name):
+    return name.lower().endswith(".pdf")
+
+
+def _looks_like_text(data):
+    """True unless the start of ``data`` has NUL bytes or is mostly control or invalid UTF-8 bytes."""
+    sample = data[:TEXT_SNIFF_BYTES]
+    if b"\0" in sample:
+        return False
+    text = sample.decode("utf-8", errors="replace")
+    suspect = sum(1 for char in text if char == "\ufffd" or (char < " " and char not in "\t\n\r\f"))
+    return suspect <= len(text) * 0.05
+
+
+def _decode_text(name, data):
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        if _looks_like_text(data):
+            # Mostly UTF-8 with a few stray bytes; keep the text and mark the rest
+            return data.decode("utf-8", errors="replace")
+        raise UnreadableFileError(f"{name} is not a PDF or a UTF-8 text file") from None
+
+
+def _pdf_page_count(data):
+    from pypdf import PdfReader
+    return len(PdfReader(io.BytesIO(data)).pages)
+
+
+def _parse_task(name, data, start=None, stop=None):
+    """Parse one file, or pages ``start:stop`` of a PDF, straight from memory."""
+    from langchain_core.documents import Document
+    from pypdf import PdfReader
+
+    if not is_pdf(name):
+        return [Document(page_content=_decode_text(name, data), metadata={"source": name})]
+
+    return _pdf_pages(name, PdfReader(io.BytesIO(data)), start, stop)
+
+
+def _parse_pdf_file(name, path, start, stop):
+    """Parse pages ``start:stop`` of the PDF saved at ``path``, reading only what they need."""
+    from pypdf import PdfReader
+
+    with open(path, "rb") as stream:
+        return _pdf_pages(name, PdfReader(stream), start, stop)
+
+
+def _pdf_pages(name, reader, start, stop):
+    from langchain_core.documents import Document
+
+    pages = range(len(reader.pages))[start:stop]
+    return [
+        Document(
+            page_content=reader.pages[page].extract_text(),
+            metadata={"source": name, "page": page}
+        )
+        for page in pages
+    ]
+
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    """Process pool shared by every session, recreated only when its size changes."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # Spawn rather than fork: the server process runs threads and torch
+            _pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            _pool_workers = workers
+        return _pool
+
+
+def plan_parse_tasks(files, pages_per_task=PDF_PAGES_PER_TASK):
+    """Cut ``(name, data)`` pairs into parse tasks of at most ``pages_per_task`` pages.
+
+    Returns ``(tasks, total_pages)``; text files count as a single page.
+    Raises ``UnreadableFileError`` for a file that isn't a PDF or text,
+    before any file is parsed.
+    """
+    tasks = []
+    total_pages = 0
+    for index, (name, data) in enumerate(files):
+        if is_pdf(name):
+            page_count = _pdf_page_count(data)
+            for start in range(0, page_count, pages_per_task):
+                tasks.append((index, name, data, start, start + pages_per_task))
+            total_pages += page_count
+        else:
+            # A binary file fails the run here, before anything is indexed
+            _decode_text(name, data)
+            tasks.append((index, name, data, None, None))
+            total_pages += 1
+    return tasks, total_pages
+
+
+def iter_parsed(tasks, workers=None, prefetch=None):
+    """Yield ``(file index, page Document)`` for each task in order.
+
+    With more than one worker the tasks run on the process pool, but only
+    ``prefetch`` of them (default twice the worker count) are in flight at a
+    time, so parsed pages never pile up ahead of the consumer.
+    """
+    workers = INGEST_WORKERS if workers is None else workers
+    if workers <= 1 or len(tasks) <= 1:
+        for index, name, data, start, stop in tasks:
+            for doc in _parse_task(name, data, start, stop):
+                yield index, doc
+        return
+
+    pool = _get_pool(workers)
+    prefetch = prefetch or workers * 2
+    # A PDF's page-range tasks read it from one temporary file instead of
+    # each pickling the whole file to a worker
+    spill_dir = None
+    spilled = {}
+    tasks_left = Counter(task[0] for task in tasks)
+
+    def submit(index, name, data, start, stop):
+        nonlocal spill_dir
+        if start is None:
+            return pool.submit(_parse_task, name, data, start, stop)
+        if index not in spilled:
+            spill_dir = spill_dir or tempfile.mkdtemp(prefix="ingest-")
+            path = os.path.join(spill_dir, f"{index}.pdf")
+            with open(path, "wb") as spill:
+                spill.write(data)
+            spilled[index] = path
+        return pool.submit(_parse_pdf_file, name, spilled[index], start, stop)
+
+    in_flight = deque()
+    remaining = iter(tasks)
+    try:
+        for task in remaining:
+            in_flight.append((task[0], submit(*task)))
+            if len(in_flight) >= prefetch:
+                break
+        while in_flight:
+            index, future = in_flight.popleft()
+            for task in remaining:
+                in_flight.append((task[0], submit(*task)))
+                break
+            docs = future.result()
+            tasks_left[index] -= 1
+            if not tasks_left[index] and index in spilled:
+                os.remove(spilled.pop(index))
+            for doc in docs:
+                yield index, doc
+    finally:
+        # Consumer stopped early (cancelled or failed); drop work that hasn't started
+        for _, future in in_flight:
+            future.cancel()
+        if spill_dir is not None:
+            # A task still running may hold its file open, which Windows won't delete
+            shutil.rmtree(spill_dir, ignore_errors=True)
+
+
+def parse_files(files, workers=None, pages_per_task=PDF_PAGES_PER_TASK):
+    """Parse ``(name, data)`` pairs, spreading files and PDF page ranges over a process pool.
+
+    Returns one list of page Documents per input file, in input order with
+    pages ascending, regardless of which worker finished first.
+    """
+    files = list(files)
+    tasks, _ = plan_parse_tasks(files, pages_per_task)
+    results = [[] for _ in files]
+    for index, doc in iter_parsed(tasks, workers):
+        results[index].append(doc)
+    return results
+
+
+def split_documents(documents):
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        length_function=len
+    )
+    return text_splitter.split_documents(documents)
@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import tracing
+
+# Ingestion jobs run at once across all sessions; later ones wait as "queued"
+INGEST_JOBS = int(os.getenv("INGEST_JOBS", "2"))
+# Finished jobs no session collected (e.g. the tab was closed) are dropped after this many seconds
+INGEST_JOB_TTL = float(os.getenv("INGEST_JOB_TTL", "600"))
+
+
+class IngestJob:
+    """One background ``add_files`` run over a session's copy of its index.
+
+    Progress is written by the worker thread and read by the session's
+    status polling, so everything the UI reads is a plain value swapped
+    under ``_lock``. When the job ends (done, cancelled or failed) the
+    session swaps ``doc_index`` for the job's index in a single step.
+    """
+
+    def __init__(self, doc_index, files):
+        self.id = uuid.uuid4().hex
+        self.doc_index = doc_index
+        self.files = files
+        self.status = "queued"
+        self.added = {}
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.trace = None
+        self._progress = {}
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        """Stop after the current batch; files indexed so far are kept."""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def finished_running(self):
+        return self.status in ("done", "cancelled", "failed")
+
+    def _report(self, stage, done, total):
+        with self._lock:
+            self._progress[stage] = (done, total)
+
+    def progress(self):
+        """``{stage: (done, total)}`` for the stages reported so far."""
+        with self._lock:
+            return dict(self._progress)
+
+    def run(self):
+        self.started = time.time()
+        self.status = "running"
+        with tracing("ingest", files=len(self.files)) as trace:
+            try:
+                if not self.cancelled:
+                    self.added = self.doc_index.add_files(
+                        self.files, on_progress=self._report, should_stop=self._cancelled.is_set
+                    )
+            except Exception as exc:
+                self.error = str(exc)
+                trace.attrs["error"] = type(exc).__name__
+                status = "failed"
+            else:
+                trace.attrs["chunks"] = sum(self.added.values())
+                status = "cancelled" if self.cancelled else "done"
+        self.trace = trace.record
+        # The uploaded bytes are no longer needed once indexed
+        self.files = None
+        self.finished = time.time()
+        # Set last: the session collects the job as soon as it sees a final status
+        self.status = status
+
+
+class IngestWorker:
+    """Process-wide pool running ingestion jobs off the sessions' script threads.
+
+    A finished job holds its index until the session collects it; jobs left
+    uncollected for ``job_ttl`` seconds are dropped so abandoned sessions
+    don't keep their index copies alive.
+    """
+
+    def __init__(self, max_jobs=INGEST_JOBS, job_ttl=INGEST_JOB_TTL):
+        self._executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="ingest")
+        self.job_ttl = job_ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _evict_expired(self):
+        # Called with _lock held
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_running and now - job.finished >= self.job_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(self, doc_index, files):
+        """Start indexing ``files`` into ``doc_index`` and return the job."""
+        job = IngestJob(doc_index, files)
+        with self._lock:
+            self._evict_expired()
+            self._jobs[job.id] = job
+        self._executor.submit(job.run)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            self._evict_expired()
+            return self._jobs.get(job_id)
+
+    def collect(self, job_id):
+        """Forget a finished job and return it (None if unknown or still running)."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or not job.finished_running:
+                return None
+            return self._jobs.pop(job_id)
+
+    def stats(self):
+        with self._lock:
+            self._evict_expired()
+            statuses = [job.status for job in self._jobs.values()]
+        return {status: statuses.count(status) for status in ("queued", "running")}
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_ingest_worker():
+    """Return the process-wide ingestion worker."""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = IngestWorker()
+        return _worker
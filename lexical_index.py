@@ -0,0 +1,126 @@
+import heapq
+import math
+import re
+from array import array
+from collections import Counter, defaultdict
+
+# Keeps course codes, section numbers and dotted names together: cs-301, 4.2, o(n_log_n)
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._/-][a-z0-9]+)*")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class LexicalIndex:
+    """In-memory BM25 inverted index over chunk text.
+
+    Each term's postings are two parallel ``array`` columns (chunk number,
+    term frequency), which costs 6 bytes per posting instead of a Python
+    object per entry. Removed chunks are tombstoned and the postings are
+    compacted once tombstones outnumber live chunks.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        # term -> (array of chunk numbers, array of term frequencies)
+        self._postings = {}
+        # chunk number -> docstore id, or None once removed
+        self._doc_ids = []
+        self._numbers = {}
+        self._lengths = array("I")
+        self._live = 0
+        self._deleted = 0
+        self._total_length = 0
+
+    def __len__(self):
+        return self._live
+
+    def add(self, doc_id, text):
+        terms = Counter(tokenize(text))
+        length = sum(terms.values())
+        number = len(self._doc_ids)
+        self._doc_ids.append(doc_id)
+        self._numbers[doc_id] = number
+        self._lengths.append(length)
+        self._live += 1
+        self._total_length += length
+        for term, tf in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array("I"), array("H"))
+            postings[0].append(number)
+            postings[1].append(min(tf, 0xFFFF))
+
+    def add_many(self, doc_ids, texts):
+        for doc_id, text in zip(doc_ids, texts):
+            self.add(doc_id, text)
+
+    def remove(self, doc_ids):
+        for doc_id in doc_ids:
+            number = self._numbers.pop(doc_id, None)
+            if number is None:
+                continue
+            self._doc_ids[number] = None
+            self._live -= 1
+            self._deleted += 1
+            self._total_length -= self._lengths[number]
+        if self._deleted > self._live:
+            self._compact()
+
+    def _compact(self):
+        renumber = {}
+        doc_ids = []
+        lengths = array("I")
+        for number, doc_id in enumerate(self._doc_ids):
+            if doc_id is not None:
+                renumber[number] = len(doc_ids)
+                doc_ids.append(doc_id)
+                lengths.append(self._lengths[number])
+
+        postings = {}
+        for term, (numbers, tfs) in self._postings.items():
+            kept_numbers, kept_tfs = array("I"), array("H")
+            for number, tf in zip(numbers, tfs):
+                new_number = renumber.get(number)
+                if new_number is not None:
+                    kept_numbers.append(new_number)
+                    kept_tfs.append(tf)
+            if kept_numbers:
+                postings[term] = (kept_numbers, kept_tfs)
+
+        self._postings = postings
+        self._doc_ids = doc_ids
+        self._numbers = {doc_id: number for number, doc_id in enumerate(doc_ids)}
+        self._lengths = lengths
+        self._deleted = 0
+
+    def search(self, query, k=4):
+        """Return up to ``k`` ``(docstore id, BM25 score)`` pairs, best first."""
+        if not self._live:
+            return []
+        avg_length = self._total_length / self._live or 1.0
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            numbers, tfs = postings
+            # Document frequency still counts tombstones until the next compaction
+            df = len(numbers)
+            idf = math.log(1 + (self._live - df + 0.5) / (df + 0.5))
+            for number, tf in zip(numbers, tfs):
+                if self._doc_ids[number] is None:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[number] / avg_length)
+                scores[number] += idf * tf * (self.k1 + 1) / (tf + norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self._doc_ids[number], score) for number, score in best]
+
+    def memory_bytes(self):
+        postings = sum(
+            numbers.itemsize * len(numbers) + tfs.itemsize * len(tfs)
+            for numbers, tfs in self._postings.values()
+        )
+        return postings + self._lengths.itemsize * len(self._lengths)
@@ -0,0 +1,292 @@
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+
+from metrics import registry, stage
+
+# Shared limits for every LLM call in the process (defaults fit Groq's free tier)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "30"))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "12000"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+# Longest a call waits for its turn before the user is told to try again
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "60"))
+RETRY_BASE_SECONDS = 1.0
+RETRY_MAX_SECONDS = 30.0
+# Completion tokens reserved up front; corrected once the real output length is known
+DEFAULT_COMPLETION_TOKENS = 512
+
+# Lower runs first
+PRIORITY_CHAT = 0
+PRIORITY_QUESTION_PAPER = 1
+PRIORITY_BACKGROUND = 2
+
+
+class LLMBusyError(RuntimeError):
+    """The provider stayed rate limited, or the queue was too long, for this call."""
+
+
+def estimate_tokens(text):
+    """Rough token count for rate limiting (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+def is_rate_limit(exc):
+    return getattr(exc, "status_code", None) == 429 or type(exc).__name__ == "RateLimitError"
+
+
+def is_retryable(exc):
+    if is_rate_limit(exc):
+        return True
+    status = getattr(exc, "status_code", None)
+    if status is not None:
+        return status >= 500
+    return any(word in type(exc).__name__ for word in ("Timeout", "Connection"))
+
+
+def retry_after_seconds(exc):
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Refills ``per_minute`` units per minute up to a burst of ``per_minute``.
+
+    Not thread safe on its own; the scheduler only touches it under its lock.
+    A limit of 0 or less means unlimited.
+    """
+
+    def __init__(self, per_minute, clock=time.monotonic):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.clock = clock
+        self.level = per_minute
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_seconds(self, amount):
+        if self.capacity <= 0:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        if self.capacity > 0:
+            self._refill()
+            self.level -= min(amount, self.capacity)
+
+    def give(self, amount):
+        """Return (or, with a negative amount, charge) units after the fact."""
+        if self.capacity > 0:
+            self._refill()
+            self.level = min(self.capacity, self.level + amount)
+
+    def drain(self):
+        if self.capacity > 0:
+            self.level = min(self.level, 0.0)
+            self.updated = self.clock()
+
+
+class LLMScheduler:
+    """Admission control in front of every LLM call in the process.
+
+    A call waits until it is the highest-priority waiter (first come, first
+    served within a priority), a concurrency slot is free, and both the
+    requests-per-minute and tokens-per-minute buckets can cover it. Calls
+    that fail with a rate limit or a transient provider error are retried
+    with full-jitter exponential backoff, honouring ``Retry-After``; a rate
+    limit also pauses admission for every other caller for that long.
+    """
+
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY,
+                 requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=LLM_TOKENS_PER_MINUTE, max_retries=LLM_MAX_RETRIES,
+                 queue_timeout=LLM_QUEUE_TIMEOUT, retry_base=RETRY_BASE_SECONDS,
+                 retry_max=RETRY_MAX_SECONDS):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.queue_timeout = queue_timeout
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._tickets = itertools.count()
+        self._active = 0
+        self._paused_until = 0.0
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.total_wait_seconds = 0.0
+
+    def _acquire(self, priority, tokens):
+        ticket = (priority, next(self._tickets))
+        start = time.monotonic()
+        deadline = start + self.queue_timeout
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    remaining = deadline - now
+                    wait = remaining
+                    if self._waiting[0] == ticket and self._active < self.max_concurrency:
+                        wait = max(
+                            self._paused_until - now,
+                            self._requests.wait_seconds(1),
+                            self._tokens.wait_seconds(tokens),
+                        )
+                        if wait <= 0:
+                            self._requests.take(1)
+                            self._tokens.take(tokens)
+                            self._active += 1
+                            self.total_wait_seconds += now - start
+                            return
+                    # Give up early when the limits won't clear before the deadline
+                    if remaining <= 0 or wait > remaining:
+                        self.failed += 1
+                        raise LLMBusyError("The AI service is busy right now. Please try again in a moment.")
+                    self._cond.wait(wait)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def _release(self, reserved_tokens, used_tokens):
+        with self._cond:
+            self._active -= 1
+            self._tokens.give(reserved_tokens - used_tokens)
+            self._cond.notify_all()
+
+    def _retry_delay(self, exc, attempt):
+        """Seconds to back off before retrying, or None when ``exc`` should be raised."""
+        if not is_retryable(exc):
+            return None
+        delay = random.uniform(0, min(self.retry_max, self.retry_base * 2 ** attempt))
+        retry_after = retry_after_seconds(exc)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        with self._cond:
+            if is_rate_limit(exc):
+                self.rate_limited += 1
+                # The provider's window is full: stop admitting anyone until it clears
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                self._requests.drain()
+        if attempt >= self.max_retries or delay > self.queue_timeout:
+            return None
+        with self._cond:
+            self.retries += 1
+        return delay
+
+    def _give_up(self, exc):
+        with self._cond:
+            self.failed += 1
+        if is_rate_limit(exc):
+            raise LLMBusyError(
+                "The AI service is rate limiting requests right now. Please try again in a moment."
+            ) from exc
+        raise exc
+
+    def call(self, fn, priority=PRIORITY_CHAT, prompt_tokens=0,
+             completion_tokens=DEFAULT_COMPLETION_TOKENS):
+        """Run ``fn()`` (e.g. ``lambda: llm.invoke(...)``) once admitted, retrying it on failure."""
+        reserved = prompt_tokens + completion_tokens
+        for attempt in itertools.count():
+            with stage("llm_queue"):
+                self._acquire(priority, reserved)
+            used = reserved
+            try:
+                with stage("llm", tokens_in=prompt_tokens) as llm_stage:
+                    result = fn()
+                    content = getattr(result, "content", None)
+                    if isinstance(content, str):
+                        used = prompt_tokens + estimate_tokens(content)
+                        llm_stage["tokens_out"] = used - prompt_tokens
+            except Exception as exc:
+                delay = self._retry_delay(exc, attempt)
+                if delay is None:
+                    self._give_up(exc)
+            else:
+                self._count_tokens(prompt_tokens, used - prompt_tokens)
+                return result
+            finally:
+                self._release(reserved, used)
+            time.sleep(delay)
+
+    def stream(self, make_stream, priority=PRIORITY_CHAT, prompt_tokens=0,
+               completion_tokens=DEFAULT_COMPLETION_TOKENS):
+        """Yield from ``make_stream()`` once admitted; the slot is held until the stream ends.
+
+        A failure before the first token is retried with a fresh stream. Once
+        tokens have been shown to the user the error is raised as is.
+        """
+        reserved = prompt_tokens + completion_tokens
+        for attempt in itertools.count():
+            with stage("llm_queue"):
+                self._acquire(priority, reserved)
+            chars = 0
+            try:
+                with stage("llm", tokens_in=prompt_tokens) as llm_stage:
+                    start = time.perf_counter()
+                    for token in make_stream():
+                        if not chars:
+                            llm_stage["first_token_seconds"] = time.perf_counter() - start
+                        chars += len(token)
+                        yield token
+                    llm_stage["tokens_out"] = chars // 4 + 1 if chars else 0
+            except Exception as exc:
+                delay = None if chars else self._retry_delay(exc, attempt)
+                if delay is None:
+                    self._give_up(exc)
+            else:
+                self._count_tokens(prompt_tokens, chars // 4 + 1 if chars else 0)
+                return
+            finally:
+                self._release(reserved, prompt_tokens + (chars // 4 + 1 if chars else 0))
+            time.sleep(delay)
+
+    def _count_tokens(self, tokens_in, tokens_out):
+        with self._cond:
+            self.completed += 1
+        registry.inc("study_buddy_llm_tokens_total", tokens_in, direction="in")
+        registry.inc("study_buddy_llm_tokens_total", tokens_out, direction="out")
+
+    def stats(self):
+        with self._cond:
+            admitted = self.completed + self.failed
+            return {
+                "active": self._active,
+                "waiting": len(self._waiting),
+                "completed": self.completed,
+                "failed": self.failed,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "avg_wait_ms": self.total_wait_seconds / admitted * 1000 if admitted else 0.0,
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_llm_scheduler():
+    """Return the process-wide LLM scheduler, configured from the environment."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler()
+        return _scheduler
@@ -0,0 +1,270 @@
+import contextlib
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Serve Prometheus metrics on this port (off when unset)
+METRICS_PORT = os.getenv("METRICS_PORT")
+# Append one JSON line per finished request to this file (off when unset)
+METRICS_LOG = os.getenv("METRICS_LOG")
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PROFILE_TOP_FUNCTIONS = 30
+
+logger = logging.getLogger("study_buddy.metrics")
+if METRICS_LOG:
+    _handler = logging.FileHandler(METRICS_LOG)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+
+def rss_bytes():
+    """Best-effort resident set size of this process in bytes."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is not None:
+        # ru_maxrss is a peak, reported in KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    return 0
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+class MetricsRegistry:
+    """Process-wide counters and histograms, rendered in the Prometheus text format."""
+
+    def __init__(self, buckets=HISTOGRAM_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        # (name, labels) -> [count per bucket..., +Inf count, sum]
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[len(self.buckets)] += 1
+            histogram[-1] += value
+
+    def render(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, list(value)) for key, value in self._histograms.items())
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            for bound, count in zip(self.buckets, histogram):
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+            count = histogram[len(self.buckets)]
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram[-1]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        lines.append(f"study_buddy_process_resident_memory_bytes {rss_bytes()}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class Trace:
+    """Per-stage timings for one request: a chat turn, a question paper or an ingestion job.
+
+    Stages with the same name accumulate (e.g. one ``embed`` entry for all
+    batches). Each stage records wall time, call count, the change in
+    resident memory and any numeric attributes such as tokens or chunks.
+    """
+
+    def __init__(self, kind, **attrs):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.attrs = dict(attrs)
+        self.stages = {}
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self._rss_start = rss_bytes()
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, rss_delta=0, **attrs):
+        with self._lock:
+            entry = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0, "rss_delta_bytes": 0})
+            entry["seconds"] += seconds
+            entry["calls"] += 1
+            entry["rss_delta_bytes"] += rss_delta
+            for key, value in attrs.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    entry[key] = entry.get(key, 0) + value
+                else:
+                    entry[key] = value
+        registry.observe("study_buddy_stage_seconds", seconds, kind=self.kind, stage=name)
+
+    def finish(self, **attrs):
+        """Close the trace, log it as JSON and return it as a dict."""
+        self.attrs.update(attrs)
+        seconds = time.perf_counter() - self._start
+        record = {
+            "trace_id": self.id,
+            "kind": self.kind,
+            "started": self.started,
+            "seconds": seconds,
+            "rss_delta_bytes": rss_bytes() - self._rss_start,
+            **self.attrs,
+            "stages": self.stages,
+        }
+        registry.observe("study_buddy_request_seconds", seconds, kind=self.kind)
+        registry.inc("study_buddy_requests_total", kind=self.kind,
+                     status="error" if "error" in self.attrs else "ok")
+        logger.info(json.dumps(record, default=str))
+        return record
+
+
+_local = threading.local()
+
+
+def current_trace():
+    return getattr(_local, "trace", None)
+
+
+@contextlib.contextmanager
+def tracing(kind, **attrs):
+    """Collect stages recorded on this thread into a new ``Trace``.
+
+    The finished record is available as ``trace.record`` after the block.
+    """
+    trace = Trace(kind, **attrs)
+    previous = current_trace()
+    _local.trace = trace
+    try:
+        yield trace
+    except Exception as exc:
+        trace.attrs["error"] = type(exc).__name__
+        raise
+    finally:
+        _local.trace = previous
+        trace.record = trace.finish()
+
+
+@contextlib.contextmanager
+def stage(name, **attrs):
+    """Time a block as stage ``name`` of the current trace; yields a dict for extra attributes."""
+    extra = dict(attrs)
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    try:
+        yield extra
+    finally:
+        seconds = time.perf_counter() - start
+        trace = current_trace()
+        if trace is not None:
+            trace.add(name, seconds, rss_bytes() - rss_before, **extra)
+        else:
+            registry.observe("study_buddy_stage_seconds", seconds, kind="none", stage=name)
+
+
+def timed_iter(iterable, name):
+    """Yield from ``iterable``, counting the time spent waiting on each item as stage ``name``."""
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+@contextlib.contextmanager
+def profiled():
+    """Profile the block on this thread; yields a dict that gets the ``text`` report and raw ``stats``."""
+    result = {}
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield result
+    finally:
+        profiler.disable()
+        out = io.StringIO()
+        stats = pstats.Stats(profiler, stream=out)
+        stats.sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+        result["text"] = out.getvalue()
+        result["stats"] = stats
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serve ``/metrics`` on ``port`` from a daemon thread, once per process."""
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer(("0.0.0.0", int(port)), _MetricsHandler)
+            except OSError:
+                # Another process (e.g. a second app instance) already serves it
+                return None
+            threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+        return _server
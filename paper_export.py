@@ -0,0 +1,189 @@
+import hashlib
+import io
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from docx import Document
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.shared import Inches, Pt, RGBColor
+from fpdf import FPDF
+
+# Rendered files kept per (paper, format, date), so reruns and repeat downloads don't rebuild them
+EXPORT_CACHE_SIZE = 32
+
+QUESTION_LINE = re.compile(r'^\d+[\.)]\s')
+SUBPART_LINE = re.compile(r'^[a-z\)ivx]+[\)]\s')
+
+
+def parse_paper(text):
+    """Split a question paper into ``(kind, line)`` blocks shared by every renderer.
+
+    ``kind`` is ``heading`` (all caps, SECTION or PART lines), ``question``
+    (``1.`` or ``1)``), ``subpart`` (``a)``, ``ii)``), ``text`` or ``blank``.
+    """
+    blocks = []
+    for line in text.split('\n'):
+        stripped = line.strip()
+        if not stripped:
+            kind = "blank"
+        elif stripped.isupper() or stripped.startswith('SECTION') or stripped.startswith('PART'):
+            kind = "heading"
+        elif QUESTION_LINE.match(stripped):
+            kind = "question"
+        elif SUBPART_LINE.match(stripped.lower()):
+            kind = "subpart"
+        else:
+            kind = "text"
+        blocks.append((kind, line))
+    return tuple(blocks)
+
+
+class QuestionPaperPDF(FPDF):
+    def __init__(self):
+        super().__init__()
+        self.add_page()
+
+    def header(self):
+        self.set_font('Arial', 'B', 16)
+        self.cell(0, 10, 'IIIT Sri City', 0, 1, 'C')
+        self.set_font('Arial', 'B', 14)
+        self.cell(0, 10, 'Question Paper', 0, 1, 'C')
+        self.ln(5)
+
+    def add_block(self, kind, line):
+        # Core PDF fonts only cover latin-1
+        line = line.encode('latin-1', 'replace').decode('latin-1')
+        if kind == "blank":
+            self.ln(6)
+        elif kind == "heading":
+            self.set_font('Arial', 'B', 12)
+            self.multi_cell(0, 7, line)
+        elif kind == "question":
+            self.set_font('Arial', 'B', 11)
+            self.multi_cell(0, 6, line)
+        elif kind == "subpart":
+            self.set_font('Arial', '', 11)
+            self.set_x(self.l_margin + 10)
+            self.multi_cell(0, 6, line.strip())
+        else:
+            self.set_font('Arial', '', 11)
+            self.multi_cell(0, 6, line)
+
+
+def render_pdf(blocks, generated_on):
+    pdf = QuestionPaperPDF()
+    pdf.set_author('IIITSC Study-Buddy')
+    pdf.set_title('Generated Question Paper')
+    pdf.set_font('Arial', 'I', 10)
+    pdf.cell(0, 10, f'Generated on: {generated_on}', 0, 1, 'R')
+    pdf.ln(5)
+    for kind, line in blocks:
+        pdf.add_block(kind, line)
+    data = pdf.output(dest='S')
+    # fpdf returns a latin-1 str, fpdf2 a bytearray
+    return data.encode('latin-1') if isinstance(data, str) else bytes(data)
+
+
+def render_docx(blocks, generated_on):
+    """Professionally formatted DOCX question paper"""
+    doc = Document()
+
+    # Set document margins
+    for section in doc.sections:
+        section.top_margin = Inches(1)
+        section.bottom_margin = Inches(1)
+        section.left_margin = Inches(1)
+        section.right_margin = Inches(1)
+
+    # Add header - Institution name
+    header = doc.add_paragraph()
+    header.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    run = header.add_run('IIIT Sri City')
+    run.font.size = Pt(18)
+    run.font.bold = True
+    run.font.color.rgb = RGBColor(0, 122, 255)
+
+    # Add title
+    title = doc.add_paragraph()
+    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    run = title.add_run('Question Paper')
+    run.font.size = Pt(16)
+    run.font.bold = True
+
+    # Add date
+    date_para = doc.add_paragraph()
+    date_para.alignment = WD_ALIGN_PARAGRAPH.RIGHT
+    run = date_para.add_run(f'Generated on: {generated_on}')
+    run.font.size = Pt(10)
+    run.font.italic = True
+    run.font.color.rgb = RGBColor(128, 128, 128)
+
+    # Add a line separator
+    doc.add_paragraph('_' * 80)
+
+    for kind, line in blocks:
+        if kind == "blank":
+            continue
+        para = doc.add_paragraph()
+        run = para.add_run(line)
+        if kind == "heading":
+            run.font.size = Pt(14)
+            run.font.bold = True
+            run.font.color.rgb = RGBColor(0, 0, 0)
+            para.alignment = WD_ALIGN_PARAGRAPH.LEFT
+        elif kind == "question":
+            run.font.size = Pt(12)
+            run.font.bold = True
+            para.space_before = Pt(6)
+            para.space_after = Pt(3)
+        elif kind == "subpart":
+            para.paragraph_format.left_indent = Inches(0.5)
+            run.font.size = Pt(11)
+        else:
+            run.font.size = Pt(11)
+
+    # Add footer
+    doc.add_paragraph()
+    footer = doc.add_paragraph()
+    footer.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    run = footer.add_run('Generated by Study-Buddy AI Assistant')
+    run.font.size = Pt(9)
+    run.font.italic = True
+    run.font.color.rgb = RGBColor(128, 128, 128)
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+RENDERERS = {"pdf": render_pdf, "docx": render_docx}
+
+_parsed = OrderedDict()
+_rendered = OrderedDict()
+_export_lock = threading.Lock()
+
+
+def _cached(cache, key, build):
+    with _export_lock:
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+    value = build()
+    with _export_lock:
+        cache[key] = value
+        while len(cache) > EXPORT_CACHE_SIZE:
+            cache.popitem(last=False)
+    return value
+
+
+def export_paper(text, fmt):
+    """Return the question paper as ``pdf`` or ``docx`` bytes, rendered in memory on first use."""
+    digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    generated_on = datetime.now().strftime("%B %d, %Y")
+    blocks = _cached(_parsed, digest, lambda: parse_paper(text))
+    return _cached(
+        _rendered, (digest, fmt, generated_on),
+        lambda: RENDERERS[fmt](blocks, generated_on)
+    )
@@ -0,0 +1,336 @@
+import argparse
+import os
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from context_builder import pack_context
+from embedding_engine import DEFAULT_MODEL, get_embedding_engine
+from index_cache import IndexCache
+from llm_scheduler import PRIORITY_CHAT, estimate_tokens, get_llm_scheduler
+from metrics import stage, tracing
+from question_paper import generate_question_paper
+from reranker import get_reranker
+from vector_index import INDEX_MMAP, DocumentIndex, read_manifest
+
+load_dotenv()
+
+# Embedding model used for document search
+EMBEDDING_MODEL = DEFAULT_MODEL
+CHAT_MODEL = "llama-3.3-70b-versatile"
+
+# Answer with a local stub model instead of Groq (for load tests and offline development)
+LLM_STUB = os.getenv("LLM_STUB", "0") == "1"
+
+# FAISS index type for new indexes: flat, hnsw, ivf, sq8, pq or ivfpq (see ann_index.py)
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat")
+
+SOURCE_SUFFIXES = (".pdf", ".txt")
+# Bulk ingestion reads and indexes a directory in groups of files up to this size
+INGEST_GROUP_BYTES = 256 * 1024 * 1024
+RETRIEVAL_K = 4
+
+RAG_TEMPLATE = """You are a helpful AI assistant for IIIT Sri City students. 
+Answer the question using the context from documents if relevant, otherwise use your general knowledge.
+Be friendly, professional, and detailed.
+
+Context from documents:
+{context}
+
+Chat History:
+{chat_history}
+
+Current Question: {question}
+
+Answer:"""
+
+# Single-prompt question paper, used when QUESTION_PAPER_MODE is "single"
+QUESTION_PAPER_TEMPLATE = """You are an expert educator. Generate a comprehensive question paper based on the user's request.
+Include various types of questions (MCQ, short answer, long answer) with clear instructions.
+Format it professionally with proper numbering and sections.
+
+User Request: {question}
+
+Context from documents (if available):
+{context}
+
+Generate a well-structured question paper:"""
+
+QUESTION_PAPER_KEYWORDS = [
+    'generate question paper', 'create question paper', 'make question paper',
+    'generate questions', 'create exam', 'make test', 'question paper',
+    'generate test', 'create test paper', 'quiz paper', 'exam paper'
+]
+
+
+def detect_question_paper_request(prompt):
+    prompt_lower = prompt.lower()
+    return any(keyword in prompt_lower for keyword in QUESTION_PAPER_KEYWORDS)
+
+
+def make_llm(api_key=None, stub=LLM_STUB):
+    """Chat model; retries are left to the shared LLM scheduler"""
+    # Imported on first use; the Groq client and LangChain's chat models are slow to import
+    if stub:
+        from stub_llm import StubChatModel
+        return StubChatModel()
+    from langchain_groq import ChatGroq
+    return ChatGroq(
+        model=CHAT_MODEL,
+        groq_api_key=api_key or os.getenv("GROQ_API_KEY"),
+        temperature=0.7,
+        max_retries=0
+    )
+
+
+def new_document_index(index_type=VECTOR_INDEX_TYPE, index_cache=True, model_name=EMBEDDING_MODEL):
+    """Empty ``DocumentIndex`` on the shared embedding engine and reranker.
+
+    ``index_cache`` is an ``IndexCache``, True for the default one, or None
+    to skip the per-file cache.
+    """
+    return DocumentIndex(
+        get_embedding_engine(model_name),
+        model_name,
+        index_cache=IndexCache() if index_cache is True else index_cache,
+        index_type=index_type,
+        reranker=get_reranker()
+    )
+
+
+def load_document_index(path, index_cache=True, mmap=INDEX_MMAP):
+    """Load an index saved by ``DocumentIndex.save`` (e.g. by ``pipeline.py build``).
+
+    With ``mmap`` it is searched from disk; see ``DocumentIndex.load``.
+    """
+    manifest = read_manifest(path)
+    return DocumentIndex.load(
+        path,
+        get_embedding_engine(manifest["model"]),
+        index_cache=IndexCache() if index_cache is True else index_cache,
+        reranker=get_reranker(),
+        mmap=mmap
+    )
+
+
+def find_source_files(root):
+    """``(name, path)`` for every PDF and text file under ``root``, named by relative path."""
+    root = Path(root)
+    paths = sorted(
+        path for path in root.rglob("*")
+        if path.is_file() and path.suffix.lower() in SOURCE_SUFFIXES
+        and not any(part.startswith(".") for part in path.relative_to(root).parts)
+    )
+    return [(path.relative_to(root).as_posix(), path) for path in paths]
+
+
+def _file_groups(sources, max_bytes):
+    group, size = [], 0
+    for name, path in sources:
+        file_size = path.stat().st_size
+        if group and size + file_size > max_bytes:
+            yield group
+            group, size = [], 0
+        group.append((name, path))
+        size += file_size
+    if group:
+        yield group
+
+
+def ingest_directory(doc_index, root, prune=False, max_group_bytes=INGEST_GROUP_BYTES,
+                     on_progress=None, should_stop=None):
+    """Index every PDF and text file under ``root`` into ``doc_index``.
+
+    Files are read and indexed in groups of up to ``max_group_bytes`` so a
+    large tree never sits in memory at once. Files already in the index
+    with unchanged content are skipped. With ``prune``, files indexed
+    earlier but no longer under ``root`` are removed. ``on_progress`` and
+    ``should_stop`` are passed to ``add_files``. Returns chunks added per
+    file name.
+    """
+    sources = find_source_files(root)
+    if prune:
+        present = {name for name, _ in sources}
+        for name in list(doc_index.chunk_counts()):
+            if name not in present:
+                doc_index.remove_source(name)
+    added = {}
+    for group in _file_groups(sources, max_group_bytes):
+        if should_stop is not None and should_stop():
+            break
+        files = [(name, path.read_bytes()) for name, path in group]
+        added.update(doc_index.add_files(files, on_progress=on_progress, should_stop=should_stop))
+    return added
+
+
+def retrieve(doc_index, question, k=RETRIEVAL_K):
+    """Top-k chunks for ``question`` and the packed context built from them."""
+    with stage("retrieve"):
+        docs = doc_index.search(question, k=k) if doc_index.vectorstore is not None else []
+    with stage("pack") as pack_stage:
+        packed = pack_context(docs)
+        pack_stage.update(
+            chunks=len(packed["sources"]),
+            tokens_retrieved=packed["tokens_retrieved"],
+            tokens_sent=packed["tokens_sent"]
+        )
+    return docs, packed
+
+
+def retrieve_many(doc_index, questions, k=RETRIEVAL_K):
+    """``retrieve`` for many questions, embedding and searching them as one batch."""
+    with stage("retrieve", questions=len(questions)):
+        found = doc_index.search_many(questions, k=k)
+    with stage("pack"):
+        return [(docs, pack_context(docs)) for docs in found]
+
+
+def stream_llm(llm, prompt, priority=PRIORITY_CHAT, **kwargs):
+    """Stream the reply to ``prompt`` as text through the shared LLM scheduler."""
+    from langchain_core.messages import HumanMessage
+    return get_llm_scheduler().stream(
+        lambda: (chunk.content for chunk in llm.stream([HumanMessage(content=prompt)])),
+        priority=priority,
+        prompt_tokens=estimate_tokens(prompt),
+        **kwargs
+    )
+
+
+class StudyPipeline:
+    """The app's load -> split -> embed -> index -> retrieve -> answer pipeline, without the UI.
+
+    Wraps a ``DocumentIndex`` and a chat model so scripts and scheduled jobs
+    can build, save and query the same indexes the Streamlit app serves.
+    """
+
+    def __init__(self, doc_index=None, llm=None):
+        self.doc_index = doc_index if doc_index is not None else new_document_index()
+        self._llm = llm
+
+    @classmethod
+    def load(cls, path, llm=None, index_cache=True, mmap=INDEX_MMAP):
+        return cls(load_document_index(path, index_cache=index_cache, mmap=mmap), llm)
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            self._llm = make_llm()
+        return self._llm
+
+    def ingest_files(self, files, **kwargs):
+        """Index ``(name, data)`` pairs; see ``DocumentIndex.add_files``."""
+        return self.doc_index.add_files(files, **kwargs)
+
+    def ingest_directory(self, root, **kwargs):
+        return ingest_directory(self.doc_index, root, **kwargs)
+
+    def save(self, path):
+        self.doc_index.save(path)
+
+    def retrieve(self, question, k=RETRIEVAL_K):
+        return retrieve(self.doc_index, question, k)
+
+    def answer(self, question, chat_history="", k=RETRIEVAL_K, priority=PRIORITY_CHAT):
+        """Answer ``question`` from the indexed documents.
+
+        Returns a dict with the ``answer`` text and the ``docs`` retrieved
+        for it. Question paper requests are answered with a generated paper.
+        """
+        if detect_question_paper_request(question):
+            paper = generate_question_paper(
+                question, self.llm, retriever=self.doc_index.as_retriever(search_kwargs={"k": k})
+            )
+            return {"answer": paper["text"], "docs": [doc for docs in paper["docs"] for doc in docs]}
+        docs, packed = self.retrieve(question, k)
+        prompt = RAG_TEMPLATE.format(context=packed["text"], chat_history=chat_history, question=question)
+        answer = "".join(stream_llm(self.llm, prompt, priority=priority))
+        return {"answer": answer, "docs": docs}
+
+
+def _print_progress(stage_name, done, total):
+    if stage_name == "files":
+        print(f"  indexed {done}/{total} files", flush=True)
+
+
+def build(args):
+    if args.update and os.path.exists(os.path.join(args.output, "manifest.json")):
+        # Loaded into memory: it is about to be changed
+        pipeline = StudyPipeline.load(args.output, index_cache=None if args.no_cache else True, mmap=False)
+        print(f"Updating {args.output} ({sum(pipeline.doc_index.chunk_counts().values())} chunks)")
+    else:
+        pipeline = StudyPipeline(new_document_index(
+            index_type=args.index_type, index_cache=None if args.no_cache else True
+        ))
+    sources = find_source_files(args.source)
+    if not sources:
+        print(f"No PDF or text files under {args.source}")
+        sys.exit(1)
+    print(f"Ingesting {len(sources)} files from {args.source}")
+    with tracing("bulk_ingest", files=len(sources)) as trace:
+        added = pipeline.ingest_directory(
+            args.source, prune=args.update, max_group_bytes=args.group_mb * 1024 * 1024,
+            on_progress=_print_progress
+        )
+    if pipeline.doc_index.vectorstore is None:
+        print("No text could be extracted; nothing saved")
+        sys.exit(1)
+    pipeline.save(args.output)
+
+    counts = pipeline.doc_index.chunk_counts()
+    print(
+        f"Saved {len(counts)} files, {sum(counts.values())} chunks to {args.output} "
+        f"({sum(1 for chunks in added.values() if chunks)} newly indexed, "
+        f"{trace.record['seconds']:.1f}s)"
+    )
+    for name, entry in trace.record["stages"].items():
+        print(f"  {name:<12}{entry['seconds']:>10.2f}s")
+    dedup = pipeline.doc_index.dedup_report()
+    if dedup["duplicates"]:
+        print(
+            f"Merged {dedup['duplicates']} duplicate chunks ({dedup['exact']} exact, {dedup['near']} near), "
+            f"saving ~{dedup['embed_seconds_saved']:.1f}s of embedding and "
+            f"~{dedup['index_bytes_saved'] / 1024 ** 2:.1f} MB of index"
+        )
+
+
+def ask(args):
+    pipeline = StudyPipeline.load(args.index, index_cache=None, mmap=args.mmap)
+    result = pipeline.answer(args.question, k=args.k)
+    print(result["answer"])
+    if args.sources:
+        for doc in result["docs"]:
+            page = doc.metadata.get("page")
+            print(f"- {doc.metadata.get('source', 'unknown')}" + (f" (page {page + 1})" if page is not None else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and query Study-Buddy document indexes without the UI")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = commands.add_parser("build", help="Index every PDF and text file under a directory")
+    build_parser.add_argument("source", help="Directory of course material (searched recursively)")
+    build_parser.add_argument("output", help="Folder to save the index to (load it in the app with PREBUILT_INDEX)")
+    build_parser.add_argument("--index-type", default=VECTOR_INDEX_TYPE)
+    build_parser.add_argument("--update", action="store_true",
+                              help="Start from the index already in OUTPUT: re-index changed files, drop deleted ones")
+    build_parser.add_argument("--group-mb", type=int, default=INGEST_GROUP_BYTES // 1024 ** 2,
+                              help="Megabytes of files read into memory per batch")
+    build_parser.add_argument("--no-cache", action="store_true", help="Don't read or fill the per-file index cache")
+    build_parser.set_defaults(run=build)
+
+    ask_parser = commands.add_parser("ask", help="Answer one question from a saved index")
+    ask_parser.add_argument("index", help="Folder written by the build command")
+    ask_parser.add_argument("question")
+    ask_parser.add_argument("--k", type=int, default=RETRIEVAL_K)
+    ask_parser.add_argument("--sources", action="store_true", help="List the chunks' source files")
+    ask_parser.add_argument("--mmap", action="store_true", default=INDEX_MMAP,
+                            help="Search the index from disk instead of loading it into memory")
+    ask_parser.set_defaults(run=ask)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
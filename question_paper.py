@@ -0,0 +1,229 @@
+import queue
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from context_builder import pack_context
+from llm_scheduler import PRIORITY_QUESTION_PAPER, estimate_tokens, get_llm_scheduler
+
+# Default paper layout; counts can be overridden in the request ("15 MCQs and 2 long questions")
+SECTIONS = (
+    {
+        "key": "mcq",
+        "title": "Multiple Choice Questions",
+        "kind": "multiple choice",
+        "count": 10,
+        "marks": 1,
+        "instructions": "Give four options for each question on separate lines as a) to d).",
+        "focus": "definitions, facts and key terms",
+    },
+    {
+        "key": "short",
+        "title": "Short Answer Questions",
+        "kind": "short answer",
+        "count": 5,
+        "marks": 5,
+        "instructions": "Each question should be answerable in one paragraph.",
+        "focus": "concepts, comparisons and brief explanations",
+    },
+    {
+        "key": "long",
+        "title": "Long Answer Questions",
+        "kind": "long answer",
+        "count": 3,
+        "marks": 10,
+        "instructions": "Each question should need a detailed answer; split it into a) and b) parts where useful.",
+        "focus": "processes, derivations, applications and analysis",
+    },
+)
+# Completion tokens reserved per question when asking the scheduler for a slot
+TOKENS_PER_QUESTION = 80
+
+SECTION_TEMPLATE = """You are an expert educator writing one section of a question paper.
+
+User Request: {question}
+
+Write exactly {count} {kind} questions worth {marks} marks each.
+{instructions}
+Number the questions 1 to {count}, each starting on a new line as "1. ". Do not write a section heading, answers or any other text.
+
+Context from documents (if available):
+{context}
+
+Questions:"""
+
+# How a request names each section: "MCQs", "short questions", "long-answer questions"
+SECTION_NOUNS = {
+    "mcq": r"mcqs?|multiple[- ]choice(?:[- ]questions?)?",
+    "short": r"short[- ](?:answer[- ]?)?(?:questions?|answers?)",
+    "long": r"long[- ](?:answer[- ]?)?(?:questions?|answers?)",
+}
+NAME_PATTERNS = {
+    key: re.compile(rf"\b(?:{noun})\b", re.IGNORECASE) for key, noun in SECTION_NOUNS.items()
+}
+# A count only when it directly precedes the section's noun: "15 MCQs", "2 long questions"
+COUNT_PATTERNS = {
+    key: re.compile(rf"\b(\d+)\s*(?:{noun})\b", re.IGNORECASE) for key, noun in SECTION_NOUNS.items()
+}
+QUESTION_LINE = re.compile(r"^\s*(?:\*\*)?(?:Q(?:uestion)?\.?\s*)?\d+\s*[.):]\s*(?:\*\*)?\s*(.*)$")
+HEADING_LINE = re.compile(r"^\s*(?:#+\s*)?(?:\*\*)?\s*(?:SECTION|PART)\b", re.IGNORECASE)
+
+
+def plan_sections(request):
+    """Sections for ``request`` with any question counts it asks for.
+
+    Only the sections the request names are planned ("10 MCQs on graphs"
+    is MCQs only); a request naming none gets the default layout.
+    """
+    sections = []
+    named = []
+    for section in SECTIONS:
+        section = dict(section)
+        match = COUNT_PATTERNS[section["key"]].search(request)
+        if match:
+            section["count"] = int(match.group(1))
+        if section["count"] > 0:
+            sections.append(section)
+            if NAME_PATTERNS[section["key"]].search(request):
+                named.append(section)
+    return named or sections
+
+
+def _section_prompt(request, section, context):
+    return SECTION_TEMPLATE.format(
+        question=request,
+        count=section["count"],
+        kind=section["kind"],
+        marks=section["marks"],
+        instructions=section["instructions"],
+        context=context,
+    )
+
+
+def _questions(text, limit):
+    """Split model output into questions (each a list of lines), dropping headings and extras."""
+    questions = []
+    for line in text.splitlines():
+        if not line.strip() or HEADING_LINE.match(line):
+            continue
+        match = QUESTION_LINE.match(line)
+        if match:
+            questions.append([match.group(1).strip()])
+        elif questions:
+            questions[-1].append(line.strip())
+    return questions[:limit]
+
+
+def merge_sections(sections, outputs):
+    """Join section outputs into one paper numbered 1..N across sections.
+
+    The result uses the ``SECTION`` headings and ``1.`` / ``a)`` lines that
+    the PDF and DOCX exporters already format. Sections with no questions
+    are left out.
+    """
+    kept = [(section, questions) for section, questions in zip(sections, outputs) if questions]
+    total_marks = sum(len(questions) * section["marks"] for section, questions in kept)
+    lines = [f"Total Marks: {total_marks}", ""]
+    number = 0
+    for letter, (section, questions) in zip("ABCDEFGHIJ", kept):
+        count = len(questions)
+        lines.append(
+            f"SECTION {letter} - {section['title']} "
+            f"({count} x {section['marks']} = {count * section['marks']} marks)"
+        )
+        for question in questions:
+            number += 1
+            lines.append(f"{number}. {question[0]}")
+            lines.extend(f"   {line}" for line in question[1:])
+        lines.append("")
+    return "\n".join(lines).rstrip()
+
+
+def generate_question_paper(request, llm, retriever=None, cache=None, on_section=None,
+                            on_token=None, sections=None):
+    """Write a question paper section by section, generating the sections concurrently.
+
+    Each section retrieves its own context (the request plus the kind of
+    material that section tests) and is streamed through the shared LLM
+    scheduler. When ``cache`` (an ``AnswerCache``) is given, sections are
+    cached individually. ``sections`` defaults to ``plan_sections(request)``.
+    ``on_token(section number, text)`` and ``on_section(report)`` are called
+    from the calling thread as each section streams and finishes; a report
+    whose ``questions`` is 0 is a section the model's output had none for,
+    and it is left out of the paper.
+
+    Returns a dict with the merged ``text``, the ``docs`` each section used,
+    per-section ``sections`` reports and ``total_seconds``.
+    """
+    start = time.perf_counter()
+    sections = plan_sections(request) if sections is None else sections
+    outputs = [None] * len(sections)
+    docs = [[] for _ in sections]
+    reports = [None] * len(sections)
+    # Tokens from the section threads, handed to on_token on the calling thread
+    tokens = queue.SimpleQueue()
+
+    def write_section(i):
+        section = sections[i]
+        section_start = time.perf_counter()
+        if retriever is not None:
+            docs[i] = retriever.invoke(f"{request} {section['focus']}")
+        retrieval_seconds = time.perf_counter() - section_start
+
+        question = f"{request}\n{section['key']} x{section['count']}"
+        text = cache.get(question, docs[i], SECTION_TEMPLATE) if cache is not None else None
+        cached = text is not None
+        if cached:
+            tokens.put((i, text))
+        else:
+            prompt = _section_prompt(request, section, pack_context(docs[i])["text"])
+            parts = []
+            for token in get_llm_scheduler().stream(
+                lambda: (chunk.content for chunk in llm.stream(prompt)),
+                priority=PRIORITY_QUESTION_PAPER,
+                prompt_tokens=estimate_tokens(prompt),
+                completion_tokens=section["count"] * TOKENS_PER_QUESTION,
+            ):
+                parts.append(token)
+                tokens.put((i, token))
+            text = "".join(parts)
+            if cache is not None:
+                cache.put(question, docs[i], SECTION_TEMPLATE, text)
+        outputs[i] = _questions(text, section["count"])
+        return {
+            "index": i,
+            "title": section["title"],
+            "questions": len(outputs[i]),
+            "requested": section["count"],
+            "cached": cached,
+            "retrieval_seconds": retrieval_seconds,
+            "seconds": time.perf_counter() - section_start,
+        }
+
+    def drain():
+        while True:
+            try:
+                i, token = tokens.get_nowait()
+            except queue.Empty:
+                return
+            if on_token is not None:
+                on_token(i, token)
+
+    with ThreadPoolExecutor(max_workers=len(sections) or 1, thread_name_prefix="question-paper") as executor:
+        pending = {executor.submit(write_section, i) for i in range(len(sections))}
+        while pending:
+            done, pending = wait(pending, timeout=0.05, return_when=FIRST_COMPLETED)
+            # A finished section queued all of its tokens before returning
+            drain()
+            for future in done:
+                report = future.result()
+                reports[report["index"]] = report
+                if on_section is not None:
+                    on_section(report)
+
+    return {
+        "text": merge_sections(sections, outputs),
+        "docs": docs,
+        "sections": reports,
+        "total_seconds": time.perf_counter() - start,
+    }
@@ -1,27 +1,46 @@
 import streamlit as st
 import os
+import re
 from pathlib import Path
 from dotenv import load_dotenv
-from langchain_groq import ChatGroq
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader, TextLoader
-from langchain_community.vectorstores import FAISS
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.messages import HumanMessage, AIMessage
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.output_parsers import StrOutputParser
-import tempfile
-from fpdf import FPDF
 from datetime import datetime
-import re
-from docx import Document
-from docx.shared import Pt, Inches, RGBColor
-from docx.enum.text import WD_ALIGN_PARAGRAPH
+from collections import deque
+import contextlib
+import time
+import itertools
+import uuid
+from embedding_engine import get_embedding_engine
+from vector_index import read_manifest
+from index_registry import get_index_registry
+from ingest_jobs import get_ingest_worker
+from answer_cache import get_answer_cache
+from reranker import get_reranker
+from conversation import ConversationStore, remove_stale_transcripts
+from llm_scheduler import (
+    PRIORITY_CHAT, PRIORITY_QUESTION_PAPER, LLMBusyError, get_llm_scheduler
+)
+from question_paper import generate_question_paper, plan_sections
+from metrics import current_trace, profiled, registry, start_metrics_server, tracing
+from pipeline import (
+    EMBEDDING_MODEL, QUESTION_PAPER_TEMPLATE, RAG_TEMPLATE, detect_question_paper_request,
+    load_document_index, make_llm, new_document_index, retrieve, stream_llm
+)
 
 # Load environment variables
 load_dotenv()
 
+# Course index built offline with `python pipeline.py build`; every new session starts on it
+PREBUILT_INDEX = os.getenv("PREBUILT_INDEX")
+
+# "sections" writes MCQ, short and long answer sections concurrently; "single" uses one prompt
+QUESTION_PAPER_MODE = os.getenv("QUESTION_PAPER_MODE", "sections")
+
+# Show per-request stage timings and the profiler (also on with ?debug=1)
+DEBUG_PANEL = os.getenv("DEBUG_PANEL", "0") == "1"
+
+# Prometheus metrics on METRICS_PORT, if set
+start_metrics_server()
+
 # Page configuration
 st.set_page_config(
     page_title="Study-Buddy",
@@ -30,455 +49,218 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+@st.cache_resource
+def load_css():
+    """Apple-inspired stylesheet, read and minified once per server process"""
+    css = re.sub(r"/\*.*?\*/", "", (Path(__file__).parent / "style.css").read_text(), flags=re.S)
+    return re.sub(r"\s*([{};,])\s*", r"\1", " ".join(css.split()))
+
 # Apple-inspired CSS
-st.markdown("""
-    <style>
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
-    
-    * {
-        font-family: 'Inter', -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;
-    }
-    
-    .main {
-        background: linear-gradient(135deg, #0a0a0a 0%, #1a1a1a 100%);
-        padding: 0;
-    }
-    
-    .stApp {
-        background: transparent;
-    }
-    
-    /* Hero Section */
-    .hero-section {
-        text-align: center;
-        padding: 8rem 2rem 4rem 2rem;
-        background: linear-gradient(180deg, rgba(0,0,0,0) 0%, rgba(0,122,255,0.1) 100%);
-        border-radius: 0 0 50px 50px;
-        margin-bottom: 3rem;
-    }
-    
-    .hero-title {
-        font-size: 4.5rem;
-        font-weight: 700;
-        background: linear-gradient(135deg, #ffffff 0%, #007AFF 100%);
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        background-clip: text;
-        margin-bottom: 1rem;
-        letter-spacing: -0.02em;
-        line-height: 1.1;
-    }
-    
-    .hero-subtitle {
-        font-size: 1.5rem;
-        color: #86868b;
-        font-weight: 400;
-        margin-bottom: 3rem;
-        letter-spacing: -0.01em;
-    }
-    
-    /* Feature Cards */
-    .feature-card {
-        background: rgba(255, 255, 255, 0.05);
-        backdrop-filter: blur(20px);
-        -webkit-backdrop-filter: blur(20px);
-        border: 1px solid rgba(255, 255, 255, 0.1);
-        border-radius: 24px;
-        padding: 2.5rem;
-        margin-bottom: 1.5rem;
-        transition: all 0.3s cubic-bezier(0.4, 0, 0.2, 1);
-        box-shadow: 0 4px 24px rgba(0, 0, 0, 0.3);
-    }
-    
-    .feature-card:hover {
-        transform: translateY(-8px);
-        box-shadow: 0 12px 40px rgba(0, 122, 255, 0.3);
-        border-color: rgba(0, 122, 255, 0.3);
-    }
-    
-    .feature-icon {
-        font-size: 3rem;
-        margin-bottom: 1rem;
-        display: block;
-    }
-    
-    .feature-title {
-        font-size: 1.5rem;
-        font-weight: 600;
-        color: #ffffff;
-        margin-bottom: 0.75rem;
-    }
-    
-    .feature-desc {
-        font-size: 1.05rem;
-        color: #86868b;
-        line-height: 1.6;
-    }
-    
-    /* Chat Interface */
-    .chat-container {
-        background: rgba(255, 255, 255, 0.03);
-        backdrop-filter: blur(30px);
-        border-radius: 30px;
-        padding: 2rem;
-        margin: 2rem auto;
-        max-width: 900px;
-        border: 1px solid rgba(255, 255, 255, 0.08);
-        box-shadow: 0 8px 32px rgba(0, 0, 0, 0.4);
-    }
-    
-    .stChatMessage {
-        background: rgba(255, 255, 255, 0.05) !important;
-        border: 1px solid rgba(255, 255, 255, 0.1) !important;
-        border-radius: 18px !important;
-        padding: 1.25rem !important;
-        margin-bottom: 1rem !important;
-        backdrop-filter: blur(10px);
-    }
-    
-    .stChatMessage[data-testid="user-message"] {
-        background: linear-gradient(135deg, rgba(0, 122, 255, 0.15) 0%, rgba(0, 122, 255, 0.05) 100%) !important;
-        border-color: rgba(0, 122, 255, 0.3) !important;
-    }
-    
-    .stChatMessage[data-testid="assistant-message"] {
-        background: rgba(255, 255, 255, 0.03) !important;
-    }
-    
-    /* Buttons */
-    .stButton > button {
-        background: linear-gradient(135deg, #007AFF 0%, #0051D5 100%);
-        color: white;
-        border: none;
-        border-radius: 14px;
-        padding: 0.875rem 2rem;
-        font-weight: 600;
-        font-size: 1.05rem;
-        letter-spacing: 0.01em;
-        transition: all 0.3s cubic-bezier(0.4, 0, 0.2, 1);
-        box-shadow: 0 4px 16px rgba(0, 122, 255, 0.4);
-    }
-    
-    .stButton > button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 8px 24px rgba(0, 122, 255, 0.5);
-        background: linear-gradient(135deg, #0051D5 0%, #003DA5 100%);
-    }
-    
-    /* Input Fields */
-    .stTextInput > div > div > input,
-    .stChatInput > div > div > input {
-        background: rgba(255, 255, 255, 0.05) !important;
-        border: 1px solid rgba(255, 255, 255, 0.15) !important;
-        border-radius: 12px !important;
-        color: #ffffff !important;
-        padding: 0.875rem 1.25rem !important;
-        font-size: 1rem !important;
-        backdrop-filter: blur(10px);
-    }
-    
-    .stTextInput > div > div > input:focus,
-    .stChatInput > div > div > input:focus {
-        border-color: rgba(0, 122, 255, 0.5) !important;
-        box-shadow: 0 0 0 3px rgba(0, 122, 255, 0.1) !important;
-    }
-    
-    /* Upload Section */
-    .upload-section {
-        background: linear-gradient(135deg, rgba(0, 122, 255, 0.1) 0%, rgba(88, 86, 214, 0.1) 100%);
-        border: 2px dashed rgba(0, 122, 255, 0.3);
-        border-radius: 24px;
-        padding: 3rem;
-        text-align: center;
-        margin: 2rem 0;
-        transition: all 0.3s ease;
-    }
-    
-    .upload-section:hover {
-        border-color: rgba(0, 122, 255, 0.6);
-        background: linear-gradient(135deg, rgba(0, 122, 255, 0.15) 0%, rgba(88, 86, 214, 0.15) 100%);
-    }
-    
-    /* Status Badge */
-    .status-badge {
-        display: inline-block;
-        padding: 0.5rem 1.25rem;
-        border-radius: 20px;
-        font-size: 0.95rem;
-        font-weight: 600;
-        letter-spacing: 0.02em;
-    }
-    
-    .status-active {
-        background: rgba(52, 199, 89, 0.15);
-        color: #34C759;
-        border: 1px solid rgba(52, 199, 89, 0.3);
-    }
-    
-    .status-inactive {
-        background: rgba(255, 59, 48, 0.15);
-        color: #FF3B30;
-        border: 1px solid rgba(255, 59, 48, 0.3);
-    }
-    
-    /* Expandable Sections */
-    .streamlit-expanderHeader {
-        background: rgba(255, 255, 255, 0.05) !important;
-        border-radius: 12px !important;
-        color: #ffffff !important;
-        font-weight: 500 !important;
-        border: 1px solid rgba(255, 255, 255, 0.1) !important;
-    }
-    
-    .streamlit-expanderContent {
-        background: rgba(255, 255, 255, 0.02) !important;
-        border-radius: 0 0 12px 12px !important;
-        border: 1px solid rgba(255, 255, 255, 0.1) !important;
-        border-top: none !important;
-    }
-    
-    /* File Uploader */
-    .stFileUploader {
-        background: transparent !important;
-    }
-    
-    .stFileUploader > div {
-        background: rgba(255, 255, 255, 0.05) !important;
-        border: 2px dashed rgba(255, 255, 255, 0.2) !important;
-        border-radius: 16px !important;
-        padding: 2rem !important;
-    }
-    
-    /* Download Button */
-    .stDownloadButton > button {
-        background: linear-gradient(135deg, #34C759 0%, #30B350 100%) !important;
-        box-shadow: 0 4px 16px rgba(52, 199, 89, 0.4) !important;
-    }
-    
-    .stDownloadButton > button:hover {
-        background: linear-gradient(135deg, #30B350 0%, #28A745 100%) !important;
-        box-shadow: 0 8px 24px rgba(52, 199, 89, 0.5) !important;
-    }
-    
-    /* Metrics */
-    .stMetric {
-        background: rgba(255, 255, 255, 0.05);
-        padding: 1.5rem;
-        border-radius: 16px;
-        border: 1px solid rgba(255, 255, 255, 0.1);
-    }
-    
-    .stMetric label {
-        color: #86868b !important;
-        font-size: 0.95rem !important;
-    }
-    
-    .stMetric [data-testid="stMetricValue"] {
-        color: #ffffff !important;
-        font-size: 1.75rem !important;
-    }
-    
-    /* Scrollbar */
-    ::-webkit-scrollbar {
-        width: 10px;
-        height: 10px;
-    }
-    
-    ::-webkit-scrollbar-track {
-        background: rgba(255, 255, 255, 0.05);
-        border-radius: 10px;
-    }
-    
-    ::-webkit-scrollbar-thumb {
-        background: rgba(255, 255, 255, 0.2);
-        border-radius: 10px;
-    }
-    
-    ::-webkit-scrollbar-thumb:hover {
-        background: rgba(0, 122, 255, 0.5);
-    }
-    
-    /* Alert/Info boxes */
-    .stAlert {
-        background: rgba(255, 255, 255, 0.05) !important;
-        border: 1px solid rgba(255, 255, 255, 0.1) !important;
-        border-radius: 16px !important;
-        backdrop-filter: blur(10px);
-    }
-    
-    /* Text colors */
-    p, span, div, label {
-        color: #f5f5f7 !important;
-    }
-    
-    h1, h2, h3, h4, h5, h6 {
-        color: #ffffff !important;
-    }
-    
-    /* Sidebar */
-    [data-testid="stSidebar"] {
-        background: rgba(0, 0, 0, 0.8) !important;
-        backdrop-filter: blur(40px);
-        border-right: 1px solid rgba(255, 255, 255, 0.1);
-    }
-    
-    [data-testid="stSidebar"] .stMarkdown {
-        color: #f5f5f7 !important;
-    }
-    </style>
-""", unsafe_allow_html=True)
+st.markdown(f"<style>{load_css()}</style>", unsafe_allow_html=True)
 
 # Initialize session state
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+if "conversation" not in st.session_state:
+    remove_stale_transcripts()
+    st.session_state.conversation = ConversationStore(st.session_state.session_id)
+if "display_count" not in st.session_state:
+    st.session_state.display_count = 20
 if "vectorstore" not in st.session_state:
     st.session_state.vectorstore = None
 if "retriever" not in st.session_state:
     st.session_state.retriever = None
 if "llm" not in st.session_state:
     st.session_state.llm = None
-if "processed_files" not in st.session_state:
-    st.session_state.processed_files = []
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
+if "doc_index" not in st.session_state:
+    st.session_state.doc_index = new_document_index()
+if "index_lease" not in st.session_state:
+    # Set while doc_index is a read-only index shared with other sessions
+    st.session_state.index_lease = None
 if "show_chat" not in st.session_state:
     st.session_state.show_chat = False
+if "ingest_job_id" not in st.session_state:
+    # Background ingestion job building the session's next index, if any
+    st.session_state.ingest_job_id = None
+if "turn_timings" not in st.session_state:
+    # Timings of the session's recent turns only, like the traces below
+    st.session_state.turn_timings = deque(maxlen=20)
+if "traces" not in st.session_state:
+    # Stage breakdowns of this session's recent requests, for the debug panel
+    st.session_state.traces = deque(maxlen=20)
+    st.session_state.profile_next = False
+    st.session_state.last_profile = None
 
-# PDF Generation Class
-class QuestionPaperPDF(FPDF):
-    def __init__(self):
-        super().__init__()
-        self.add_page()
-        
-    def header(self):
-        self.set_font('Arial', 'B', 16)
-        self.cell(0, 10, 'IIIT Sri City', 0, 1, 'C')
-        self.set_font('Arial', 'B', 14)
-        self.cell(0, 10, 'Question Paper', 0, 1, 'C')
-        self.ln(5)
-    
-    def add_question_paper_content(self, content):
-        self.set_font('Arial', '', 11)
-        content = content.encode('latin-1', 'replace').decode('latin-1')
-        self.multi_cell(0, 6, content)
-
-def detect_question_paper_request(prompt):
-    keywords = [
-        'generate question paper', 'create question paper', 'make question paper',
-        'generate questions', 'create exam', 'make test', 'question paper',
-        'generate test', 'create test paper', 'quiz paper', 'exam paper'
-    ]
-    prompt_lower = prompt.lower()
-    return any(keyword in prompt_lower for keyword in keywords)
-
-def generate_question_paper_pdf(content, filename="question_paper.pdf"):
-    pdf = QuestionPaperPDF()
-    pdf.set_author('IIITSC Study-Buddy')
-    pdf.set_title('Generated Question Paper')
-    pdf.set_font('Arial', 'I', 10)
-    pdf.cell(0, 10, f'Generated on: {datetime.now().strftime("%B %d, %Y")}', 0, 1, 'R')
-    pdf.ln(5)
-    pdf.add_question_paper_content(content)
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-    pdf.output(temp_file.name)
-    return temp_file.name
-
-def generate_question_paper_docx(content, filename="question_paper.docx"):
-    """Generate a professionally formatted DOCX file for question papers"""
-    doc = Document()
-    
-    # Set document margins
-    sections = doc.sections
-    for section in sections:
-        section.top_margin = Inches(1)
-        section.bottom_margin = Inches(1)
-        section.left_margin = Inches(1)
-        section.right_margin = Inches(1)
-    
-    # Add header - Institution name
-    header = doc.add_paragraph()
-    header.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    run = header.add_run('IIIT Sri City')
-    run.font.size = Pt(18)
-    run.font.bold = True
-    run.font.color.rgb = RGBColor(0, 122, 255)
-    
-    # Add title
-    title = doc.add_paragraph()
-    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    run = title.add_run('Question Paper')
-    run.font.size = Pt(16)
-    run.font.bold = True
-    
-    # Add date
-    date_para = doc.add_paragraph()
-    date_para.alignment = WD_ALIGN_PARAGRAPH.RIGHT
-    run = date_para.add_run(f'Generated on: {datetime.now().strftime("%B %d, %Y")}')
-    run.font.size = Pt(10)
-    run.font.italic = True
-    run.font.color.rgb = RGBColor(128, 128, 128)
-    
-    # Add a line separator
-    doc.add_paragraph('_' * 80)
-    
-    # Process and add content
-    lines = content.split('\n')
-    for line in lines:
-        if line.strip():
-            para = doc.add_paragraph()
-            
-            # Detect headings (lines that are all caps or start with specific patterns)
-            if line.strip().isupper() or line.strip().startswith('SECTION') or line.strip().startswith('PART'):
-                run = para.add_run(line)
-                run.font.size = Pt(14)
-                run.font.bold = True
-                run.font.color.rgb = RGBColor(0, 0, 0)
-                para.alignment = WD_ALIGN_PARAGRAPH.LEFT
-            
-            # Detect question numbers (lines starting with digits followed by . or ))
-            elif re.match(r'^\d+[\.)]\s', line.strip()):
-                run = para.add_run(line)
-                run.font.size = Pt(12)
-                run.font.bold = True
-                para.space_before = Pt(6)
-                para.space_after = Pt(3)
-            
-            # Detect sub-parts (a), b), i), ii), etc.)
-            elif re.match(r'^[a-z\)ivx]+[\)]\s', line.strip().lower()):
-                para.paragraph_format.left_indent = Inches(0.5)
-                run = para.add_run(line)
-                run.font.size = Pt(11)
-            
-            # Regular content
-            else:
-                run = para.add_run(line)
-                run.font.size = Pt(11)
-    
-    # Add footer
-    doc.add_paragraph()
-    footer = doc.add_paragraph()
-    footer.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    run = footer.add_run('Generated by Study-Buddy AI Assistant')
-    run.font.size = Pt(9)
-    run.font.italic = True
-    run.font.color.rgb = RGBColor(128, 128, 128)
-    
-    # Save to temporary file
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.docx')
-    doc.save(temp_file.name)
-    return temp_file.name
-
-def format_chat_history(chat_history):
-    formatted = []
-    for msg in chat_history:
-        if isinstance(msg, HumanMessage):
-            formatted.append(f"Human: {msg.content}")
-        elif isinstance(msg, AIMessage):
-            formatted.append(f"Assistant: {msg.content}")
-    return "\n".join(formatted)
-
-def format_docs(docs):
-    return "\n\n".join(doc.page_content for doc in docs)
+@st.cache_resource
+def warm_up_models():
+    """Start loading the embedding model and reranker once per process"""
+    get_embedding_engine(EMBEDDING_MODEL).warm_up()
+    if get_reranker() is not None:
+        get_reranker().warm_up()
+    return True
+
+def sync_retriever():
+    """Point the session's vectorstore/retriever at the live document index"""
+    doc_index = st.session_state.doc_index
+    st.session_state.vectorstore = doc_index.vectorstore
+    st.session_state.retriever = doc_index.as_retriever(search_kwargs={"k": 4})
+
+def attach_shared_index(key, doc_index=None):
+    """Switch the session to the shared index for ``key`` (registering ``doc_index`` if new)"""
+    if st.session_state.index_lease is not None and st.session_state.index_lease.key == key:
+        lease = st.session_state.index_lease
+    else:
+        lease = get_index_registry().lease(key, st.session_state.session_id, doc_index)
+    if lease is None:
+        return False
+    if doc_index is not None and lease.doc_index is not doc_index:
+        # Another session registered the same index first; let go of this copy's mapped files
+        doc_index.close()
+    if lease is st.session_state.index_lease:
+        return True
+    if st.session_state.index_lease is not None:
+        st.session_state.index_lease.release()
+    st.session_state.index_lease = lease
+    st.session_state.doc_index = lease.doc_index
+    sync_retriever()
+    return True
+
+def attach_prebuilt_index(path):
+    """Start the session on the saved course index at ``path``, loading it once per process"""
+    key = read_manifest(path)["set_key"]
+    if key is None:
+        return False
+    return attach_shared_index(key) or attach_shared_index(key, load_document_index(path))
+
+def use_private_index():
+    """Give the session its own copy of a shared index before changing its documents"""
+    lease = st.session_state.index_lease
+    if lease is None:
+        return st.session_state.doc_index
+    st.session_state.doc_index = lease.doc_index.clone()
+    st.session_state.index_lease = None
+    lease.release()
+    return st.session_state.doc_index
+
+def publish_index():
+    """Share the session's finished index, or swap to an identical one someone else built"""
+    key = st.session_state.doc_index.set_key()
+    if key is not None and st.session_state.index_lease is None:
+        attach_shared_index(key, st.session_state.doc_index)
+
+def swap_in_index(doc_index):
+    """Replace the session's index (and vectorstore/retriever) with ``doc_index`` in one step"""
+    lease = st.session_state.index_lease
+    st.session_state.doc_index = doc_index
+    st.session_state.index_lease = None
+    if lease is not None:
+        lease.release()
+    publish_index()
+    sync_retriever()
+
+def collect_ingest_job():
+    """Swap in the index of a finished ingestion job; returns ``(level, message)`` to show, or None"""
+    job = get_ingest_worker().collect(st.session_state.ingest_job_id)
+    if job is None:
+        if get_ingest_worker().get(st.session_state.ingest_job_id) is None:
+            # The job is gone (e.g. the server restarted); keep the current index
+            st.session_state.ingest_job_id = None
+        return None
+    st.session_state.ingest_job_id = None
+    if job.trace is not None:
+        st.session_state.traces.append(job.trace)
+    if job.status == "failed":
+        return "error", f"❌ Error: {job.error}"
+    if job.doc_index.vectorstore is None:
+        if job.status == "cancelled":
+            return "info", "⏹️ Processing stopped before any chunks were indexed."
+        return "error", "❌ Error: No text could be extracted from the uploaded files"
+    
+    swap_in_index(job.doc_index)
+    st.session_state.show_chat = True
+    if job.status == "cancelled":
+        kept = sum(st.session_state.doc_index.chunk_counts().values())
+        return "info", f"⏹️ Processing stopped. Kept {kept} chunks that were already indexed."
+    new_files = sum(1 for chunks in job.added.values() if chunks)
+    return "success", f"✅ Successfully processed {len(job.added)} documents ({new_files} newly indexed)!"
+
+@st.fragment(run_every=1.0)
+def show_ingest_job(job_id):
+    """Poll the background job; the rest of the page (including chat) stays usable meanwhile"""
+    job = get_ingest_worker().get(job_id)
+    if job is None or job.finished_running:
+        # Rerun the whole app so the finished index is swapped in
+        st.rerun()
+    progress = job.progress()
+    if job.status == "queued":
+        st.progress(0.0, text="⏳ Waiting for a free ingestion worker...")
+    else:
+        pages_done, pages_total = progress.get("pages", (0, 0))
+        files_done, files_total = progress.get("files", (0, 0))
+        chunks_done, _ = progress.get("chunks", (0, None))
+        st.progress(pages_done / max(pages_total, 1), text=f"📖 Read {pages_done}/{pages_total} pages")
+        st.progress(
+            files_done / max(files_total, 1),
+            text=f"🧬 Indexed {files_done}/{files_total} files · {chunks_done} chunks embedded"
+        )
+    if job.cancelled:
+        st.caption("Stopping after the current batch...")
+    elif st.button("⏹️ Cancel", use_container_width=True):
+        job.cancel()
+
+def stream_answer(token_stream, kind):
+    """Stream LLM tokens into the current chat message and record the turn's timings"""
+    start = time.perf_counter()
+    tokens = iter(token_stream)
+    # Keep the spinner up only until the first token arrives
+    with st.spinner("Thinking..."):
+        first_token = next(tokens, "")
+    first_token_seconds = time.perf_counter() - start
+    answer = st.write_stream(itertools.chain([first_token], tokens))
+    total_seconds = time.perf_counter() - start
+    
+    st.session_state.turn_timings.append({
+        "kind": kind,
+        "first_token_seconds": first_token_seconds,
+        "total_seconds": total_seconds
+    })
+    st.caption(f"⚡ First token in {first_token_seconds:.2f}s · {total_seconds:.2f}s total")
+    return answer
+
+def paper_download(text, fmt):
+    """Question paper file for a download button; fpdf and python-docx load on the first download"""
+    from paper_export import export_paper
+    return export_paper(text, fmt)
+
+def answer_from_cache_or_llm(question, kind, template, docs, chat_history_text, token_stream):
+    """Serve the answer from the shared answer cache, or stream it from the LLM and cache it"""
+    if not docs:
+        # Only answers grounded in retrieved chunks are shared
+        return stream_answer(token_stream, kind)
+    answer_cache = get_answer_cache()
+    answer = answer_cache.get(question, docs, template, chat_history_text)
+    if current_trace() is not None:
+        current_trace().attrs["answer_cache"] = "miss" if answer is None else "hit"
+    if answer is not None:
+        st.markdown(answer)
+        st.caption("⚡ Answered from cache")
+        return answer
+    
+    answer = stream_answer(token_stream, kind)
+    answer_cache.put(question, docs, template, answer, chat_history_text)
+    return answer
+
+if PREBUILT_INDEX and "prebuilt_index" not in st.session_state:
+    try:
+        st.session_state.prebuilt_index = attach_prebuilt_index(PREBUILT_INDEX)
+    except (OSError, ValueError) as e:
+        st.session_state.prebuilt_index = False
+        st.warning(f"⚠️ Could not load the course index at {PREBUILT_INDEX}: {e}")
+    if st.session_state.prebuilt_index:
+        st.session_state.show_chat = True
+
+# Finished ingestion jobs are swapped in before anything reads the index
+ingest_notice = collect_ingest_job() if st.session_state.ingest_job_id else None
 
 # Hero Section
 st.markdown("""
@@ -545,12 +327,43 @@ with st.expander("⚙️ Configuration", expanded=not st.session_state.llm):
             if api_key:
                 os.environ["GROQ_API_KEY"] = api_key
                 if not st.session_state.llm:
-                    st.session_state.llm = ChatGroq(
-                        model="llama-3.3-70b-versatile",
-                        groq_api_key=api_key,
-                        temperature=0.7
-                    )
+                    st.session_state.llm = make_llm(api_key)
                     st.success("✓ API Key configured successfully!")
+    
+    with api_col2:
+        engine_stats = get_embedding_engine(EMBEDDING_MODEL).stats()
+        if engine_stats["loaded"]:
+            st.caption(
+                f"🧬 Embeddings ready · loaded in {engine_stats['load_seconds']:.1f}s · "
+                f"~{engine_stats['memory_bytes'] / 1024 ** 2:.0f} MB"
+            )
+        elif engine_stats["loading"]:
+            st.caption("🧬 Loading embedding model...")
+        else:
+            st.caption("🧬 Embedding model loads when you add documents")
+        
+        cache_stats = get_answer_cache().stats()
+        st.caption(
+            f"💾 Answer cache: {cache_stats['hits']} hits · {cache_stats['misses']} misses · "
+            f"{cache_stats['entries']} stored"
+        )
+        doc_index = st.session_state.doc_index
+        st.caption(
+            f"🔎 Retrieval cache: {doc_index.result_cache_hits} hits · "
+            f"{doc_index.result_cache_misses} misses · "
+            f"{engine_stats['query_cache_hits']} query embeddings reused"
+        )
+        llm_stats = get_llm_scheduler().stats()
+        st.caption(
+            f"🚦 LLM queue: {llm_stats['active']} running · {llm_stats['waiting']} waiting · "
+            f"{llm_stats['rate_limited']} rate limited · {llm_stats['avg_wait_ms']:.0f} ms avg wait"
+        )
+        if get_reranker() is not None:
+            rerank_stats = get_reranker().stats()
+            st.caption(
+                f"🎯 Reranker: +{rerank_stats['avg_ms']:.0f} ms avg · "
+                f"{rerank_stats['fallbacks']}/{rerank_stats['calls']} fell back to retrieval order"
+            )
 
 # Upload Section
 st.markdown("""
@@ -567,79 +380,101 @@ uploaded_files = st.file_uploader(
     label_visibility="collapsed"
 )
 
-if uploaded_files:
+# Load the embedding model (and reranker, if enabled) in the background once documents are in play
+if uploaded_files or st.session_state.doc_index.vectorstore is not None:
+    warm_up_models()
+
+if st.session_state.ingest_job_id:
+    # Questions are answered from the current index until the new one is swapped in
+    show_ingest_job(st.session_state.ingest_job_id)
+elif uploaded_files:
     process_col1, process_col2, process_col3 = st.columns([1, 2, 1])
     with process_col2:
         if st.button("🚀 Process Documents", type="primary", use_container_width=True):
             if not os.getenv("GROQ_API_KEY"):
                 st.error("⚠️ Please enter your Groq API Key first!")
             else:
-                with st.spinner("Processing your documents..."):
-                    try:
-                        all_documents = []
-                        
-                        for uploaded_file in uploaded_files:
-                            with tempfile.NamedTemporaryFile(delete=False, suffix=Path(uploaded_file.name).suffix) as tmp_file:
-                                tmp_file.write(uploaded_file.getvalue())
-                                tmp_path = tmp_file.name
-                            
-                            if uploaded_file.name.endswith('.pdf'):
-                                loader = PyPDFLoader(tmp_path)
-                            else:
-                                loader = TextLoader(tmp_path)
-                            
-                            documents = loader.load()
-                            all_documents.extend(documents)
-                            os.unlink(tmp_path)
-                        
-                        text_splitter = RecursiveCharacterTextSplitter(
-                            chunk_size=3000,
-                            chunk_overlap=200,
-                            length_function=len
-                        )
-                        splits = text_splitter.split_documents(all_documents)
-                        
-                        embeddings = HuggingFaceEmbeddings(
-                            model_name="sentence-transformers/all-MiniLM-L6-v2"
-                        )
-                        
-                        st.session_state.vectorstore = FAISS.from_documents(
-                            documents=splits,
-                            embedding=embeddings
-                        )
-                        
-                        st.session_state.retriever = st.session_state.vectorstore.as_retriever(
-                            search_kwargs={"k": 4}
-                        )
-                        
-                        if not st.session_state.llm:
-                            st.session_state.llm = ChatGroq(
-                                model="llama-3.3-70b-versatile",
-                                groq_api_key=os.getenv("GROQ_API_KEY"),
-                                temperature=0.7
-                            )
-                        
-                        st.session_state.processed_files = [f.name for f in uploaded_files]
-                        st.session_state.show_chat = True
-                        st.success(f"✅ Successfully processed {len(uploaded_files)} documents!")
-                        st.rerun()
-                        
-                    except Exception as e:
-                        st.error(f"❌ Error: {str(e)}")
+                if not st.session_state.llm:
+                    st.session_state.llm = make_llm(os.getenv("GROQ_API_KEY"))
+                
+                files = [(uploaded_file.name, uploaded_file.getvalue()) for uploaded_file in uploaded_files]
+                shared_key = st.session_state.doc_index.planned_set_key(files)
+                if shared_key is not None and attach_shared_index(shared_key):
+                    # Another session already indexed exactly these documents
+                    st.session_state.show_chat = True
+                    ingest_notice = ("success", f"✅ Successfully processed {len(files)} documents (0 newly indexed)!")
+                else:
+                    # Build on a copy so the session keeps chatting against the current index
+                    job = get_ingest_worker().submit(st.session_state.doc_index.clone(), files)
+                    st.session_state.ingest_job_id = job.id
+                    st.rerun()
+
+if ingest_notice is not None:
+    level, message = ingest_notice
+    getattr(st, level)(message)
 
 # Show processed files
-if st.session_state.processed_files:
+chunk_counts = st.session_state.doc_index.chunk_counts()
+if chunk_counts:
     with st.expander("📄 Processed Documents"):
-        for i, filename in enumerate(st.session_state.processed_files, 1):
-            st.markdown(f"**{i}.** {filename}")
+        dedup = st.session_state.doc_index.dedup_report()
+        if dedup["duplicates"]:
+            st.caption(
+                f"♻️ {dedup['duplicates']} duplicate chunks merged ({dedup['exact']} exact, {dedup['near']} near) · "
+                f"saved ~{dedup['embed_seconds_saved']:.1f}s of embedding and "
+                f"~{dedup['index_bytes_saved'] / 1024 ** 2:.1f} MB of index"
+            )
+        for i, (filename, chunks) in enumerate(chunk_counts.items(), 1):
+            doc_col1, doc_col2 = st.columns([4, 1])
+            with doc_col1:
+                st.markdown(f"**{i}.** {filename} · {chunks} chunks")
+            with doc_col2:
+                # Disabled while a job builds on a copy that would drop the removal
+                if st.button("🗑️ Remove", key=f"remove_{filename}",
+                             disabled=bool(st.session_state.ingest_job_id)):
+                    use_private_index().remove_source(filename)
+                    publish_index()
+                    sync_retriever()
+                    st.rerun()
+
+# Shared index overview for whoever runs the deployment (open the app with ?admin=1)
+if st.query_params.get("admin") == "1":
+    with st.expander("🛠️ Shared Indexes"):
+        rows = get_index_registry().stats()
+        st.caption(
+            f"{len(rows)} indexes · {sum(row['sessions'] for row in rows)} sessions attached · "
+            f"~{sum(row['memory_bytes'] for row in rows) / 1024 ** 2:.1f} MB"
+        )
+        if rows:
+            st.dataframe(
+                [
+                    {
+                        "index": row["key"],
+                        "sessions": row["sessions"],
+                        "files": row["files"],
+                        "chunks": row["chunks"],
+                        "memory (MB)": round(row["memory_bytes"] / 1024 ** 2, 2),
+                    }
+                    for row in rows
+                ],
+                use_container_width=True
+            )
 
 # Chat Interface
-if st.session_state.show_chat or st.session_state.messages:
+conversation = st.session_state.conversation
+if st.session_state.show_chat or len(conversation):
     st.markdown("<br><br>", unsafe_allow_html=True)
     st.markdown('<div class="chat-container">', unsafe_allow_html=True)
     
+    # Page the most recent messages back in from the on-disk transcript
+    first_shown = max(0, len(conversation) - st.session_state.display_count)
+    if first_shown:
+        if st.button(f"⬆️ Show earlier messages ({first_shown} more)"):
+            st.session_state.display_count += 20
+            st.rerun()
+    
     # Display chat messages
-    for message in st.session_state.messages:
+    for message in conversation.page(first_shown):
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
     
@@ -648,145 +483,224 @@ if st.session_state.show_chat or st.session_state.messages:
 # Chat Input
 if prompt := st.chat_input("Ask anything or request 'generate question paper on [topic]'..."):
     if not st.session_state.llm and os.getenv("GROQ_API_KEY"):
-        st.session_state.llm = ChatGroq(
-            model="llama-3.3-70b-versatile",
-            groq_api_key=os.getenv("GROQ_API_KEY"),
-            temperature=0.7
-        )
+        st.session_state.llm = make_llm(os.getenv("GROQ_API_KEY"))
     
     if not st.session_state.llm:
         st.warning("⚠️ Please configure your Groq API key first!")
     else:
         st.session_state.show_chat = True
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        conversation.log("user", prompt)
         
         with st.chat_message("user"):
             st.markdown(prompt)
         
-        with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                try:
-                    is_qp_request = detect_question_paper_request(prompt)
-                    
-                    if is_qp_request:
-                        qp_template = """You are an expert educator. Generate a comprehensive question paper based on the user's request.
-Include various types of questions (MCQ, short answer, long answer) with clear instructions.
-Format it professionally with proper numbering and sections.
-
-User Request: {question}
-
-Context from documents (if available):
-{context}
-
-Generate a well-structured question paper:"""
-                        
-                        context = ""
-                        if st.session_state.retriever:
-                            retrieved_docs = st.session_state.retriever.invoke(prompt)
-                            context = format_docs(retrieved_docs)
-                        
-                        qp_prompt = ChatPromptTemplate.from_template(qp_template)
+        profile_turn = st.session_state.profile_next
+        st.session_state.profile_next = False
+        with st.chat_message("assistant"), tracing("chat", question_chars=len(prompt)) as trace, \
+                (profiled() if profile_turn else contextlib.nullcontext({})) as profile:
+            try:
+                is_qp_request = detect_question_paper_request(prompt)
+                if is_qp_request:
+                    trace.kind = "question_paper"
+                elif st.session_state.retriever:
+                    trace.kind = "rag"
+                
+                if is_qp_request:
+                    if QUESTION_PAPER_MODE == "sections":
+                        sections = plan_sections(prompt)
+                        # One status box per section, its questions streaming in as they are written
+                        section_views = []
+                        for section in sections:
+                            section_status = st.status(f"📝 {section['title']}...", expanded=True)
+                            section_views.append((section_status, section_status.empty(), []))
                         
-                        chain = (
-                            {
-                                "context": lambda x: context,
-                                "question": RunnablePassthrough()
-                            }
-                            | qp_prompt
-                            | st.session_state.llm
-                            | StrOutputParser()
-                        )
-                        
-                        answer = chain.invoke(prompt)
-                        st.markdown(answer)
-                        
-                        # Generate both PDF and DOCX
-                        pdf_path = generate_question_paper_pdf(answer)
-                        docx_path = generate_question_paper_docx(answer)
+                        def show_section_tokens(i, token):
+                            _, placeholder, parts = section_views[i]
+                            parts.append(token)
+                            placeholder.markdown("".join(parts))
                         
-                        # Create two download buttons side by side
-                        download_col1, download_col2 = st.columns(2)
-                        
-                        with download_col1:
-                            with open(pdf_path, "rb") as pdf_file:
-                                st.download_button(
-                                    label="📥 Download PDF",
-                                    data=pdf_file,
-                                    file_name=f"question_paper_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
-                                    mime="application/pdf",
-                                    use_container_width=True
+                        def finish_section(report):
+                            section_status, placeholder, _ = section_views[report["index"]]
+                            if report["questions"]:
+                                section_status.update(
+                                    label=f"✓ {report['title']}: {report['questions']} questions in "
+                                          f"{report['seconds']:.1f}s" + (" (cached)" if report["cached"] else ""),
+                                    state="complete",
+                                    expanded=False
                                 )
-                        
-                        with download_col2:
-                            with open(docx_path, "rb") as docx_file:
-                                st.download_button(
-                                    label="📄 Download DOCX",
-                                    data=docx_file,
-                                    file_name=f"question_paper_{datetime.now().strftime('%Y%m%d_%H%M%S')}.docx",
-                                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                                    type="primary",
-                                    use_container_width=True
+                            else:
+                                placeholder.error(
+                                    f"⚠️ No {report['title'].lower()} could be read from the model's reply, "
+                                    "so this section is left out of the paper."
                                 )
+                                section_status.update(label=f"⚠️ {report['title']}: no questions", state="error")
                         
-                        # Clean up temporary files
-                        os.unlink(pdf_path)
-                        os.unlink(docx_path)
-                        
-                    else:
-                        if st.session_state.retriever:
-                            template = """You are a helpful AI assistant for IIIT Sri City students. 
-Answer the question using the context from documents if relevant, otherwise use your general knowledge.
-Be friendly, professional, and detailed.
-
-Context from documents:
-{context}
-
-Chat History:
-{chat_history}
-
-Current Question: {question}
-
-Answer:"""
-                            
-                            prompt_template = ChatPromptTemplate.from_template(template)
-                            retrieved_docs = st.session_state.retriever.invoke(prompt)
-                            context = format_docs(retrieved_docs)
-                            chat_history_text = format_chat_history(st.session_state.chat_history[-6:])
-                            
-                            rag_chain = (
-                                {
-                                    "context": lambda x: context,
-                                    "chat_history": lambda x: chat_history_text,
-                                    "question": RunnablePassthrough()
-                                }
-                                | prompt_template
-                                | st.session_state.llm
-                                | StrOutputParser()
+                        paper = generate_question_paper(
+                            prompt,
+                            st.session_state.llm,
+                            retriever=st.session_state.retriever,
+                            cache=get_answer_cache(),
+                            on_section=finish_section,
+                            on_token=show_section_tokens,
+                            sections=sections
+                        )
+                        for report in paper["sections"]:
+                            trace.add(
+                                f"section: {report['title']}", report["seconds"],
+                                questions=report["questions"], cached=report["cached"]
                             )
-                            
-                            answer = rag_chain.invoke(prompt)
-                            
-                            if retrieved_docs:
-                                with st.expander("📚 View Sources"):
-                                    for i, doc in enumerate(retrieved_docs, 1):
-                                        st.markdown(f"**Source {i}:**")
-                                        st.text(doc.page_content[:300] + "...")
-                                        if hasattr(doc, 'metadata') and 'source' in doc.metadata:
-                                            st.caption(f"From: {Path(doc.metadata['source']).name}")
-                                        st.markdown("---")
+                        if any(report["questions"] for report in paper["sections"]):
+                            answer = paper["text"]
+                            st.markdown(answer)
                         else:
-                            answer = st.session_state.llm.invoke([HumanMessage(content=prompt)]).content
+                            answer = "⚠️ No questions could be written for this paper. Please try again."
+                            st.error(answer)
+                        st.session_state.turn_timings.append({
+                            "kind": "question_paper",
+                            "total_seconds": paper["total_seconds"],
+                            "sections": paper["sections"]
+                        })
+                        st.caption(f"Question paper ready in {paper['total_seconds']:.1f}s · " + " · ".join(
+                            f"{report['title']} {report['seconds']:.1f}s" for report in paper["sections"]
+                        ))
+                    
+                    else:
+                        context = ""
+                        retrieved_docs = []
+                        if st.session_state.retriever:
+                            with st.spinner("Searching your documents..."):
+                                retrieved_docs, packed = retrieve(st.session_state.doc_index, prompt)
+                            context = packed["text"]
                         
-                        st.markdown(answer)
+                        answer = answer_from_cache_or_llm(
+                            prompt, "question_paper", QUESTION_PAPER_TEMPLATE, retrieved_docs, "",
+                            stream_llm(
+                                st.session_state.llm,
+                                QUESTION_PAPER_TEMPLATE.format(question=prompt, context=context),
+                                priority=PRIORITY_QUESTION_PAPER,
+                                completion_tokens=2048
+                            )
+                        )
                     
-                    st.session_state.chat_history.append(HumanMessage(content=prompt))
-                    st.session_state.chat_history.append(AIMessage(content=answer))
-                    st.session_state.messages.append({"role": "assistant", "content": answer})
+                    # Each file is rendered in memory only when its button is clicked
+                    download_col1, download_col2 = st.columns(2)
+                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
                     
-                except Exception as e:
-                    error_msg = f"❌ Error: {str(e)}"
-                    st.error(error_msg)
-                    st.session_state.messages.append({"role": "assistant", "content": error_msg})
+                    with download_col1:
+                        st.download_button(
+                            label="📥 Download PDF",
+                            data=lambda: paper_download(answer, "pdf"),
+                            file_name=f"question_paper_{timestamp}.pdf",
+                            mime="application/pdf",
+                            use_container_width=True
+                        )
+                    
+                    with download_col2:
+                        st.download_button(
+                            label="📄 Download DOCX",
+                            data=lambda: paper_download(answer, "docx"),
+                            file_name=f"question_paper_{timestamp}.docx",
+                            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                            type="primary",
+                            use_container_width=True
+                        )
+                    
+                else:
+                    if st.session_state.retriever:
+                        with st.spinner("Searching your documents..."):
+                            retrieved_docs, packed = retrieve(st.session_state.doc_index, prompt)
+                        chat_history_text = conversation.chat_history_text()
+                        
+                        answer = answer_from_cache_or_llm(
+                            prompt, "rag", RAG_TEMPLATE, retrieved_docs, chat_history_text,
+                            stream_llm(
+                                st.session_state.llm,
+                                RAG_TEMPLATE.format(
+                                    context=packed["text"], chat_history=chat_history_text, question=prompt
+                                ),
+                                priority=PRIORITY_CHAT
+                            )
+                        )
+                        
+                        if packed["sources"]:
+                            with st.expander("📚 View Sources"):
+                                st.caption(
+                                    f"Sent {packed['tokens_sent']} of {packed['tokens_retrieved']} "
+                                    f"retrieved context tokens"
+                                )
+                                for i, (doc, excerpt) in enumerate(packed["sources"], 1):
+                                    st.markdown(f"**Source {i}:**")
+                                    st.text(excerpt[:300] + "...")
+                                    if hasattr(doc, 'metadata') and 'source' in doc.metadata:
+                                        also_in = sorted({
+                                            Path(entry["source"]).name for entry in doc.metadata.get("also_in", [])
+                                            if entry["source"] != doc.metadata["source"]
+                                        })
+                                        st.caption(
+                                            f"From: {Path(doc.metadata['source']).name}"
+                                            + (f" (also in {', '.join(also_in)})" if also_in else "")
+                                        )
+                                    st.markdown("---")
+                    else:
+                        answer = answer_from_cache_or_llm(
+                            prompt, "chat", "", [], "",
+                            stream_llm(st.session_state.llm, prompt, priority=PRIORITY_CHAT)
+                        )
+                
+                conversation.log("assistant", answer)
+                conversation.remember(prompt, answer, llm=st.session_state.llm)
+                
+            except LLMBusyError as e:
+                trace.attrs["error"] = type(e).__name__
+                error_msg = f"⏳ {str(e)}"
+                st.warning(error_msg)
+                conversation.log("assistant", error_msg)
+                
+            except Exception as e:
+                trace.attrs["error"] = type(e).__name__
+                error_msg = f"❌ Error: {str(e)}"
+                st.error(error_msg)
+                conversation.log("assistant", error_msg)
+        
+        st.session_state.traces.append(trace.record)
+        if profile_turn:
+            st.session_state.last_profile = profile.get("text")
+
+# Per-stage timings of recent requests, and an on-demand profile of the next one
+if DEBUG_PANEL or st.query_params.get("debug") == "1":
+    with st.expander("🔬 Debug"):
+        if st.session_state.profile_next:
+            st.caption("The next question will be profiled.")
+        elif st.button("🧪 Profile next question"):
+            st.session_state.profile_next = True
+            st.rerun()
+        
+        for record in reversed(st.session_state.traces):
+            st.markdown(
+                f"**{record['kind']}** · {record['seconds'] * 1000:.0f} ms · "
+                f"memory Δ {record['rss_delta_bytes'] / 1024 ** 2:+.1f} MB · trace `{record['trace_id']}`"
+            )
+            if record["stages"]:
+                st.dataframe(
+                    [
+                        {
+                            "stage": name,
+                            "ms": round(entry["seconds"] * 1000, 1),
+                            "calls": entry["calls"],
+                            "memory Δ (MB)": round(entry["rss_delta_bytes"] / 1024 ** 2, 2),
+                            **{key: value for key, value in entry.items()
+                               if key not in ("seconds", "calls", "rss_delta_bytes")},
+                        }
+                        for name, entry in record["stages"].items()
+                    ],
+                    use_container_width=True
+                )
+        
+        if st.session_state.last_profile:
+            st.markdown("**Profile of the last profiled question**")
+            st.code(st.session_state.last_profile)
+            st.download_button("📥 Download profile", st.session_state.last_profile, file_name="profile.txt")
+        st.download_button("📈 Download metrics (Prometheus)", registry.render(), file_name="metrics.prom")
 
 # Footer
 st.markdown("<br><br>", unsafe_allow_html=True)
@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+# Two-stage retrieval: over-fetch RERANK_CANDIDATES chunks, rescore them with a cross-encoder
+RERANK = os.getenv("RERANK", "0") == "1"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "300"))
+RERANK_BATCH_SIZE = 16
+
+
+class Reranker:
+    """Local CPU cross-encoder shared by every session, with a hard per-query time budget.
+
+    Candidate pairs are scored in batches on a worker thread. If scoring does
+    not finish within ``budget_ms`` (or the model is still loading) the
+    candidates come back in their original retrieval order and the rest of
+    the scoring is abandoned.
+    """
+
+    def __init__(self, model_name=RERANK_MODEL, budget_ms=RERANK_BUDGET_MS,
+                 batch_size=RERANK_BATCH_SIZE):
+        self.model_name = model_name
+        self.budget_ms = budget_ms
+        self.batch_size = batch_size
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._warmup_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._warmup_thread = None
+        # One scoring thread: the cross-encoder already uses every core per batch
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+        self.calls = 0
+        self.fallbacks = 0
+        self.total_seconds = 0.0
+        self.last_seconds = None
+
+    def load(self):
+        if self._model is not None:
+            return self._model
+        with self._load_lock:
+            if self._model is None:
+                # Imported here so torch is only loaded when reranking is switched on
+                from sentence_transformers import CrossEncoder
+                self._model = CrossEncoder(self.model_name, device="cpu")
+        return self._model
+
+    def warm_up(self):
+        """Start loading the model on a daemon thread; never waits for the load."""
+        # Checked without a lock: the load holds _load_lock for its whole duration
+        if self._model is not None or self._warmup_thread is not None:
+            return
+        with self._warmup_lock:
+            if self._warmup_thread is None:
+                self._warmup_thread = threading.Thread(
+                    target=self.load, name=f"warm-up {self.model_name}", daemon=True
+                )
+                self._warmup_thread.start()
+
+    def _score(self, query, docs, cancelled):
+        scores = []
+        for start in range(0, len(docs), self.batch_size):
+            if cancelled.is_set():
+                return None
+            pairs = [(query, doc.page_content) for doc in docs[start:start + self.batch_size]]
+            scores.extend(
+                self._model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+            )
+        return scores
+
+    def rerank(self, query, docs, k):
+        """Return ``(the k best of docs, fell_back)`` by cross-encoder score, within the time budget.
+
+        ``fell_back`` is True when the model was still loading or ran over
+        the budget and the first ``k`` of ``docs`` came back unchanged.
+        """
+        start = time.perf_counter()
+        reranked = None
+        if self._model is None:
+            self.warm_up()
+        elif docs:
+            cancelled = threading.Event()
+            future = self._executor.submit(self._score, query, docs, cancelled)
+            try:
+                scores = future.result(timeout=self.budget_ms / 1000)
+            except TimeoutError:
+                cancelled.set()
+                scores = None
+            if scores is not None:
+                order = sorted(range(len(docs)), key=lambda i: scores[i], reverse=True)
+                reranked = [docs[i] for i in order[:k]]
+
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self.calls += 1
+            self.total_seconds += elapsed
+            self.last_seconds = elapsed
+            if reranked is None:
+                self.fallbacks += 1
+        if reranked is None:
+            return docs[:k], True
+        return reranked, False
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "model": self.model_name,
+                "loaded": self._model is not None,
+                "calls": self.calls,
+                "fallbacks": self.fallbacks,
+                "avg_ms": self.total_seconds / self.calls * 1000 if self.calls else 0.0,
+                "last_ms": self.last_seconds * 1000 if self.last_seconds is not None else None,
+            }
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker():
+    """Return the process-wide reranker, or None when RERANK is off."""
+    global _reranker
+    if not RERANK:
+        return None
+    with _reranker_lock:
+        if _reranker is None:
+            _reranker = Reranker()
+        return _reranker
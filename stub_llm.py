@@ -0,0 +1,101 @@
+import collections
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Iterator, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+STUB_PAPER = """SECTION A - Multiple Choice Questions (1 mark each)
+1. Which statement about {topic} is correct?
+   a) Option one  b) Option two  c) Option three  d) Option four
+
+SECTION B - Short Answer Questions (5 marks each)
+2. Define {topic} and give an example.
+
+SECTION C - Long Answer Questions (10 marks each)
+3. Explain {topic} in detail with a suitable diagram."""
+
+
+class StubRateLimitError(Exception):
+    """Shaped like the Groq client's 429 error: ``status_code`` and a ``Retry-After`` header."""
+
+    status_code = 429
+
+    def __init__(self, retry_after):
+        super().__init__("Rate limit reached (stub LLM)")
+        self.response = SimpleNamespace(headers={"retry-after": f"{retry_after:.2f}"})
+
+
+class StubChatModel(BaseChatModel):
+    """Local stand-in for ChatGroq with provider-like latency and rate limits.
+
+    Replies are canned text built from the prompt and streamed word by word
+    after ``first_token_seconds``, at ``tokens_per_second``. When
+    ``requests_per_minute`` is set, calls beyond it within a sliding minute
+    fail with ``StubRateLimitError``. Set ``LLM_STUB=1`` to run the app on it.
+    """
+
+    first_token_seconds: float = 0.2
+    tokens_per_second: float = 200.0
+    requests_per_minute: float = 0.0
+    reply: Optional[str] = None
+
+    _calls: Any = PrivateAttr(default_factory=collections.deque)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self):
+        return "stub"
+
+    def _admit(self):
+        if self.requests_per_minute <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            while self._calls and now - self._calls[0] >= 60:
+                self._calls.popleft()
+            if len(self._calls) >= self.requests_per_minute:
+                raise StubRateLimitError(60 - (now - self._calls[0]))
+            self._calls.append(now)
+
+    def _reply(self, messages):
+        if self.reply is not None:
+            return self.reply
+        prompt = str(messages[-1].content)
+        request = re.search(r"User Request: (.*)", prompt)
+        section = re.search(r"Write exactly (\d+) (.+?) questions", prompt)
+        if section:
+            topic = request.group(1).strip() if request else "the topic"
+            return "\n".join(
+                f"{i}. {section.group(2).capitalize()} question {i} about {topic}?"
+                for i in range(1, int(section.group(1)) + 1)
+            )
+        if request or "question paper" in prompt.lower():
+            topic = request.group(1).strip() if request else "the topic"
+            return STUB_PAPER.format(topic=topic)
+        words = prompt.split()[-40:]
+        return "Here is what the documents say: " + " ".join(words)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self._admit()
+        text = self._reply(messages)
+        time.sleep(self.first_token_seconds + len(text.split()) / self.tokens_per_second)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        self._admit()
+        time.sleep(self.first_token_seconds)
+        for token in re.split(r"(\s+)", self._reply(messages)):
+            if not token:
+                continue
+            if not token.isspace():
+                time.sleep(1 / self.tokens_per_second)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
@@ -0,0 +1,22 @@
+from langchain_core.documents import Document
+
+from answer_cache import AnswerCache
+
+DOCS = [Document(page_content="A min-heap keeps the smallest key at the root.")]
+TEMPLATE = "{context}\n{chat_history}\n{question}"
+
+
+def test_follow_up_with_other_history_misses():
+    cache = AnswerCache()
+    cache.put("Explain more", DOCS, TEMPLATE, "about heaps", chat_history="User: What is a heap?")
+
+    assert cache.get("explain more?", DOCS, TEMPLATE, "User: What is a heap?") == "about heaps"
+    assert cache.get("Explain more", DOCS, TEMPLATE, "User: What is a trie?") is None
+
+
+def test_answers_without_documents_are_not_cached():
+    cache = AnswerCache()
+    cache.put("Tell me a joke", [], "", "a joke")
+
+    assert cache.get("Tell me a joke", [], "") is None
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,15 @@
+import json
+
+from batch_qa import read_questions
+
+
+def test_falsy_ids_are_kept(tmp_path):
+    path = tmp_path / "questions.jsonl"
+    path.write_text("\n".join(json.dumps(record) for record in [
+        {"id": 0, "question": "What is a heap?"},
+        {"id": "", "question": "What is a trie?"},
+        {"question": "What is a graph?"},
+        "What is a tree?",
+    ]), encoding="utf-8")
+
+    assert [row["id"] for row in read_questions(str(path))] == ["0", "", "3", "4"]
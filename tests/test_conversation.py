@@ -0,0 +1,34 @@
+import time
+from types import SimpleNamespace
+
+from conversation import ConversationStore
+
+
+class CountingLLM:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, prompt):
+        self.calls += 1
+        return SimpleNamespace(content=f"summary {self.calls}")
+
+
+def test_summary_runs_once_per_batch_of_overflow(tmp_path):
+    llm = CountingLLM()
+    store = ConversationStore("session", root=tmp_path, window_messages=2, batch_chars=200)
+    for turn in range(3):
+        store.remember(f"question {turn} ".ljust(50, "q"), f"answer {turn} ".ljust(50, "a"), llm=llm)
+        if turn < 2:
+            assert llm.calls == 0
+            # Turns out of the window still reach the prompt until summarized
+            assert "question 0" in store.chat_history_text()
+
+    deadline = time.time() + 5
+    while store.summary != "summary 1":
+        assert time.time() < deadline
+        time.sleep(0.01)
+    assert llm.calls == 1
+    history = store.chat_history_text()
+    assert "summary 1" in history
+    assert "question 0" not in history
+    assert "question 2" in history
@@ -0,0 +1,26 @@
+import threading
+import time
+
+from embedding_engine import EmbeddingEngine
+
+
+def test_warm_up_returns_while_the_model_loads():
+    engine = EmbeddingEngine()
+    loading = threading.Event()
+    release = threading.Event()
+
+    def slow_load():
+        with engine._load_lock:
+            loading.set()
+            release.wait(10)
+
+    engine.load = slow_load
+    engine.warm_up()
+    assert loading.wait(5)
+    try:
+        start = time.perf_counter()
+        engine.warm_up()
+        elapsed = time.perf_counter() - start
+    finally:
+        release.set()
+    assert elapsed < 0.1
@@ -0,0 +1,36 @@
+from index_registry import IndexRegistry
+
+
+class FakeIndex:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_releasing_older_lease_on_same_key_keeps_entry():
+    registry = IndexRegistry()
+    index = FakeIndex()
+    first = registry.lease("key", "session", index)
+    second = registry.lease("key", "session")
+    assert second.doc_index is index
+
+    first.release()
+    assert registry.get("key") is index
+
+    assert not index.closed
+    second.release()
+    assert len(registry) == 0
+    assert index.closed
+
+
+def test_entry_lives_until_last_session_releases():
+    registry = IndexRegistry()
+    index = FakeIndex()
+    a = registry.lease("key", "a", index)
+    b = registry.lease("key", "b")
+    a.release()
+    a.release()
+    assert registry.get("key") is index
+    b.release()
+    assert registry.get("key") is None
@@ -0,0 +1,96 @@
+import io
+import os
+from concurrent.futures import Future
+
+import pytest
+
+import ingest
+
+pytest.importorskip("pypdf")
+
+
+def make_pdf(page_count):
+    from pypdf import PdfWriter
+    from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    }))
+    for number in range(page_count):
+        page = writer.add_blank_page(200, 200)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})
+        })
+        content = DecodedStreamObject()
+        content.set_data(f"BT /F1 12 Tf 20 100 Td (page {number}) Tj ET".encode())
+        page[NameObject("/Contents")] = writer._add_object(content)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def test_page_tasks_read_the_pdf_from_one_spilled_file(monkeypatch):
+    data = make_pdf(7)
+    files = [("notes.txt", b"plain text"), ("slides.pdf", data)]
+    tasks, total_pages = ingest.plan_parse_tasks(files, pages_per_task=2)
+    assert total_pages == 8
+
+    submitted = []
+
+    class InlinePool:
+        def submit(self, fn, *args):
+            submitted.append((fn, args))
+            future = Future()
+            future.set_result(fn(*args))
+            return future
+
+    monkeypatch.setattr(ingest, "_get_pool", lambda workers: InlinePool())
+    parsed = list(ingest.iter_parsed(tasks, workers=2))
+
+    assert [(index, doc.page_content.strip()) for index, doc in parsed] == (
+        [(0, "plain text")] + [(1, f"page {number}") for number in range(7)]
+    )
+    pdf_args = [args for fn, args in submitted if fn is ingest._parse_pdf_file]
+    assert len(pdf_args) == 4
+    assert not any(isinstance(arg, bytes) for args in pdf_args for arg in args)
+    paths = {args[1] for args in pdf_args}
+    assert len(paths) == 1
+    # Removed once the file's last task is consumed
+    assert not os.path.exists(os.path.dirname(paths.pop()))
+
+
+def test_parse_files_matches_in_process_parsing():
+    files = [("a.pdf", make_pdf(5)), ("b.txt", b"text file"), ("c.pdf", make_pdf(3))]
+    serial = ingest.parse_files(files, workers=1, pages_per_task=2)
+    pooled = ingest.parse_files(files, workers=2, pages_per_task=2)
+    assert [[doc.page_content for doc in docs] for docs in pooled] == (
+        [[doc.page_content for doc in docs] for docs in serial]
+    )
+    assert [len(docs) for docs in pooled] == [5, 1, 3]
+
+
+def test_upper_case_pdf_extension_is_parsed_as_pdf():
+    files = [("SLIDES.PDF", make_pdf(3)), ("Notes.Pdf", make_pdf(1))]
+    tasks, total_pages = ingest.plan_parse_tasks(files, pages_per_task=2)
+    assert total_pages == 4
+
+    parsed = ingest.parse_files(files, workers=1)
+    assert [[doc.page_content.strip() for doc in docs] for docs in parsed] == [
+        ["page 0", "page 1", "page 2"], ["page 0"]
+    ]
+    assert all(doc.metadata["page"] == number for number, doc in enumerate(parsed[0]))
+
+
+def test_binary_file_is_rejected_by_name():
+    files = [("notes.txt", b"plain text"), ("lecture.txt", bytes(range(256)) * 4)]
+    with pytest.raises(ingest.UnreadableFileError, match="lecture.txt"):
+        ingest.plan_parse_tasks(files)
+
+
+def test_mostly_utf8_text_keeps_its_text():
+    data = "Dijkstra’s algorithm".encode() + b" \xe9t\xe9 " + b"shortest paths " * 20
+    [docs] = ingest.parse_files([("notes.txt", data)], workers=1)
+    assert docs[0].page_content.startswith("Dijkstra’s algorithm �t� shortest paths")
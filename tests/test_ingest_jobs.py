@@ -0,0 +1,33 @@
+import time
+
+from ingest_jobs import IngestWorker
+
+
+class FakeIndex:
+    def add_files(self, files, on_progress=None, should_stop=None):
+        return {name: 1 for name, _ in files}
+
+
+def wait_finished(job):
+    deadline = time.time() + 5
+    while not job.finished_running:
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_uncollected_job_is_dropped_after_ttl():
+    worker = IngestWorker(max_jobs=1, job_ttl=0.05)
+    job = worker.submit(FakeIndex(), [("a.txt", b"text")])
+    wait_finished(job)
+    assert worker.get(job.id) is job
+
+    time.sleep(0.1)
+    assert worker.get(job.id) is None
+
+
+def test_collected_before_ttl():
+    worker = IngestWorker(max_jobs=1, job_ttl=60)
+    job = worker.submit(FakeIndex(), [("a.txt", b"text")])
+    wait_finished(job)
+    assert worker.collect(job.id) is job
+    assert job.added == {"a.txt": 1}
@@ -0,0 +1,133 @@
+import threading
+import time
+
+import pytest
+
+from llm_scheduler import LLMBusyError, LLMScheduler
+from stub_llm import StubChatModel, StubRateLimitError
+
+
+def make_scheduler(**kwargs):
+    options = dict(
+        max_concurrency=4, requests_per_minute=0, tokens_per_minute=0,
+        max_retries=3, queue_timeout=5, retry_base=0.01, retry_max=0.05
+    )
+    options.update(kwargs)
+    return LLMScheduler(**options)
+
+
+def test_calls_never_exceed_max_concurrency():
+    scheduler = make_scheduler(max_concurrency=2)
+    llm = StubChatModel(first_token_seconds=0.05, reply="ok")
+    lock = threading.Lock()
+    active = 0
+    peak = 0
+
+    def call():
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        try:
+            return llm.invoke("question")
+        finally:
+            with lock:
+                active -= 1
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(scheduler.call(call).content))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == ["ok"] * 8
+    assert peak == 2
+    assert scheduler.stats()["completed"] == 8
+    assert scheduler.stats()["active"] == 0
+
+
+def test_rate_limit_is_retried_after_retry_after():
+    scheduler = make_scheduler()
+    llm = StubChatModel(first_token_seconds=0, reply="answer")
+    attempts = []
+
+    def call():
+        attempts.append(time.monotonic())
+        if len(attempts) <= 2:
+            raise StubRateLimitError(0.1)
+        return llm.invoke("question")
+
+    assert scheduler.call(call).content == "answer"
+    assert len(attempts) == 3
+    assert attempts[1] - attempts[0] >= 0.1
+    assert attempts[2] - attempts[1] >= 0.1
+    stats = scheduler.stats()
+    assert stats["retries"] == 2
+    assert stats["rate_limited"] == 2
+
+
+def test_rate_limit_pauses_other_callers():
+    scheduler = make_scheduler()
+    llm = StubChatModel(first_token_seconds=0, reply="ok")
+    limited = threading.Event()
+
+    def first():
+        if not limited.is_set():
+            limited.set()
+            raise StubRateLimitError(0.2)
+        return llm.invoke("question")
+
+    thread = threading.Thread(target=scheduler.call, args=(first,))
+    thread.start()
+    limited.wait(1)
+    time.sleep(0.01)
+    start = time.monotonic()
+    scheduler.call(lambda: llm.invoke("question"))
+    assert time.monotonic() - start >= 0.15
+    thread.join(5)
+
+
+def test_stub_rate_limit_beyond_queue_timeout_raises_busy():
+    scheduler = make_scheduler(queue_timeout=1)
+    llm = StubChatModel(first_token_seconds=0, requests_per_minute=1, reply="ok")
+    scheduler.call(lambda: llm.invoke("question"))
+
+    # The stub's window stays full for about a minute, longer than the queue timeout
+    start = time.monotonic()
+    with pytest.raises(LLMBusyError):
+        scheduler.call(lambda: llm.invoke("question"))
+    assert time.monotonic() - start < 1
+    assert scheduler.stats()["failed"] == 1
+
+
+def test_retries_give_up_after_max_retries():
+    scheduler = make_scheduler(max_retries=2)
+    attempts = []
+
+    def call():
+        attempts.append(1)
+        raise StubRateLimitError(0.01)
+
+    with pytest.raises(LLMBusyError):
+        scheduler.call(call)
+    assert len(attempts) == 3
+
+
+def test_stream_retries_before_the_first_token():
+    scheduler = make_scheduler()
+    llm = StubChatModel(first_token_seconds=0, reply="streamed answer")
+    attempts = []
+
+    def make_stream():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise StubRateLimitError(0.05)
+        return (chunk.content for chunk in llm.stream("question"))
+
+    assert "".join(scheduler.stream(make_stream)) == "streamed answer"
+    assert len(attempts) == 2
+    assert scheduler.stats()["active"] == 0
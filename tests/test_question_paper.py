@@ -0,0 +1,50 @@
+from question_paper import generate_question_paper, merge_sections, plan_sections
+from stub_llm import StubChatModel
+
+
+def test_only_named_sections_are_planned():
+    plan = plan_sections("Generate 15 MCQs on graph theory")
+    assert [(section["key"], section["count"]) for section in plan] == [("mcq", 15)]
+
+    plan = plan_sections("question paper with MCQs and 2 long answer questions")
+    assert [(section["key"], section["count"]) for section in plan] == [("mcq", 10), ("long", 2)]
+
+    plan = plan_sections("question paper on chapter 3 long division, unit 4 short notes")
+    assert [(section["key"], section["count"]) for section in plan] == [("mcq", 10), ("short", 5), ("long", 3)]
+
+
+def test_sections_stream_tokens_and_empty_ones_are_reported():
+    llm = StubChatModel(first_token_seconds=0, tokens_per_second=10000)
+    tokens = {}
+    reports = []
+    paper = generate_question_paper(
+        "Generate 3 MCQs and 2 short questions on heaps",
+        llm,
+        on_token=lambda i, token: tokens.setdefault(i, []).append(token),
+        on_section=reports.append,
+    )
+
+    assert sorted(tokens) == [0, 1]
+    assert "".join(tokens[0]).startswith("1. Multiple choice question 1 about")
+    assert sorted(report["questions"] for report in reports) == [2, 3]
+    assert "SECTION B - Short Answer Questions (2 x 5 = 10 marks)" in paper["text"]
+
+    empty = generate_question_paper(
+        "Generate 3 MCQs on heaps", StubChatModel(first_token_seconds=0, reply="Sorry, I can't help.")
+    )
+    assert [report["questions"] for report in empty["sections"]] == [0]
+    assert "SECTION" not in empty["text"]
+
+
+def test_empty_sections_are_left_out_of_the_paper():
+    sections = plan_sections("question paper on trees")
+    text = merge_sections(sections, [[["What is a tree?"]], [], [["Prove it."]]])
+    assert text.splitlines() == [
+        "Total Marks: 11",
+        "",
+        "SECTION A - Multiple Choice Questions (1 x 1 = 1 marks)",
+        "1. What is a tree?",
+        "",
+        "SECTION B - Long Answer Questions (1 x 10 = 10 marks)",
+        "2. Prove it.",
+    ]
@@ -0,0 +1,33 @@
+import threading
+import time
+
+from langchain_core.documents import Document
+
+from reranker import Reranker
+
+
+def test_rerank_falls_back_without_waiting_for_the_model_load():
+    reranker = Reranker(budget_ms=300)
+    loading = threading.Event()
+    release = threading.Event()
+
+    def slow_load():
+        with reranker._load_lock:
+            loading.set()
+            release.wait(10)
+
+    reranker.load = slow_load
+    reranker.warm_up()
+    assert loading.wait(5)
+    docs = [Document(page_content=f"chunk {i}") for i in range(6)]
+    try:
+        start = time.perf_counter()
+        reranked, fell_back = reranker.rerank("query", docs, 4)
+        elapsed = time.perf_counter() - start
+    finally:
+        release.set()
+
+    assert reranked == docs[:4]
+    assert fell_back
+    assert elapsed < 0.3
+    assert reranker.stats()["fallbacks"] == 1
@@ -0,0 +1,189 @@
+import random
+import sqlite3
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import ann_index
+from index_cache import IndexCache
+from vector_index import DocumentIndex
+
+WORDS = ["alpha", "beta", "gamma", "delta", "heap", "graph", "tree", "sort", "proof", "lemma"]
+
+
+def paragraph(rng):
+    # About 2,600 characters: one chunk per paragraph
+    return " ".join(f"{rng.choice(WORDS)}{rng.randint(0, 999)}" for _ in range(330))
+
+
+@pytest.fixture
+def rng():
+    return random.Random(1)
+
+
+@pytest.fixture
+def new_index(tmp_path):
+    def make(**kwargs):
+        kwargs.setdefault("index_cache", IndexCache(tmp_path / "cache"))
+        return DocumentIndex(DeterministicFakeEmbedding(size=32), "fake", **kwargs)
+    return make
+
+
+def test_duplicate_into_trained_ivf_index(new_index, rng, monkeypatch):
+    monkeypatch.setattr(ann_index, "MIN_TRAIN_VECTORS", 64)
+    paragraphs = [paragraph(rng) for _ in range(80)]
+    doc_index = new_index(index_type="ivf")
+    doc_index.add_files([("course.txt", "\n\n".join(paragraphs).encode())])
+    assert doc_index._ann_built
+
+    notes = f"{paragraphs[5]}\n\n{paragraph(rng)}".encode()
+    added = doc_index.add_files([("notes.txt", notes)])
+
+    assert added == {"notes.txt": 2}
+    assert doc_index.dedup_report()["duplicates"] == 1
+    assert doc_index.vectorstore.index.ntotal == 81
+    # The file's cache entry still holds both of its chunks
+    fresh = new_index(index_cache=doc_index.index_cache)
+    assert fresh.add_files([("notes.txt", notes)]) == {"notes.txt": 2}
+    assert fresh.vectorstore.index.ntotal == 2
+
+
+@pytest.mark.parametrize("same_run", [False, True])
+def test_copy_under_another_name_is_merged_not_dropped(new_index, rng, same_run):
+    data = "\n\n".join(paragraph(rng) for _ in range(3)).encode()
+    doc_index = new_index()
+    if same_run:
+        added = doc_index.add_files([("slides.txt", data), ("copy.txt", data)])
+    else:
+        doc_index.add_files([("slides.txt", data)])
+        added = doc_index.add_files([("copy.txt", data)])
+
+    assert added["copy.txt"] == 0
+    assert doc_index.chunk_counts() == {"slides.txt": 3, "copy.txt": 3}
+    docs = doc_index.vectorstore.docstore._dict.values()
+    assert all(doc.metadata["also_in"] == [{"source": "copy.txt"}] for doc in docs)
+
+    doc_index.remove_source("slides.txt")
+    assert doc_index.chunk_counts() == {"copy.txt": 3}
+    assert doc_index.vectorstore.index.ntotal == 3
+    assert all(doc.metadata == {"source": "copy.txt"} for doc in doc_index.vectorstore.docstore._dict.values())
+
+
+def test_mapped_index_searches_like_in_memory_and_closes(new_index, rng, tmp_path):
+    doc_index = new_index(index_cache=None)
+    doc_index.add_files([
+        ("course.txt", "\n\n".join(paragraph(rng) for _ in range(6)).encode()),
+        ("notes.txt", paragraph(rng).encode()),
+    ])
+    doc_index.save(tmp_path / "saved")
+    in_memory = DocumentIndex.load(tmp_path / "saved", doc_index.embeddings, mmap=False)
+    mapped = DocumentIndex.load(tmp_path / "saved", doc_index.embeddings, mmap=True)
+    assert mapped.mapped and not in_memory.mapped
+
+    query = mapped.vectorstore.docstore.search(mapped.vectorstore.index_to_docstore_id[2]).page_content[:80]
+    assert mapped.search(query, k=3) == in_memory.search(query, k=3)
+
+    # Changing a mapped index copies it into memory and lets go of the file
+    store = mapped.vectorstore.docstore
+    mapped.remove_source("course.txt")
+    assert not mapped.mapped
+    assert mapped.chunk_counts() == {"notes.txt": 1}
+    with pytest.raises(sqlite3.ProgrammingError):
+        len(store)
+
+
+def test_unrelated_non_latin_files_are_both_indexed(new_index):
+    hindi = "भारत एक विशाल देश है। यहाँ अनेक भाषाएँ बोली जाती हैं और अनेक त्योहार मनाए जाते हैं।"
+    telugu = "హైదరాబాద్ తెలంగాణ రాజధాని. ఇక్కడ చారిత్రక కట్టడాలు చాలా ఉన్నాయి."
+    doc_index = new_index()
+    added = doc_index.add_files([("hindi.txt", hindi.encode()), ("telugu.txt", telugu.encode())])
+
+    assert added == {"hindi.txt": 1, "telugu.txt": 1}
+    assert doc_index.vectorstore.index.ntotal == 2
+    assert doc_index.dedup_report()["duplicates"] == 0
+    # A real copy is still caught
+    assert doc_index.add_files([("hindi copy.txt", hindi.encode())]) == {"hindi copy.txt": 0}
+    assert doc_index.vectorstore.index.ntotal == 2
+
+
+def test_fallback_ranking_is_not_cached(new_index, rng):
+    class FakeReranker:
+        # Falls back on the first call, as if the model were still loading
+        calls = 0
+
+        def rerank(self, query, docs, k):
+            self.calls += 1
+            if self.calls == 1:
+                return docs[:k], True
+            return list(reversed(docs))[:k], False
+
+    reranker = FakeReranker()
+    doc_index = new_index(reranker=reranker, rerank_candidates=4)
+    doc_index.add_files([("course.txt", "\n\n".join(paragraph(rng) for _ in range(6)).encode())])
+
+    first = doc_index.search("heap proof", k=2)
+    second = doc_index.search("heap proof", k=2)
+    assert second != first
+    assert doc_index.search("heap proof", k=2) == second
+    assert reranker.calls == 2
+
+
+@pytest.mark.parametrize("hybrid", [False, True])
+def test_loaded_index_builds_bm25_only_for_hybrid_search(new_index, rng, tmp_path, hybrid):
+    paragraphs = [paragraph(rng) for _ in range(4)]
+    doc_index = new_index(index_cache=None, hybrid=hybrid)
+    doc_index.add_files([("course.txt", "\n\n".join(paragraphs).encode())])
+    doc_index.save(tmp_path / "saved")
+    query = paragraphs[2][:80]
+
+    mapped = DocumentIndex.load(tmp_path / "saved", doc_index.embeddings, mmap=True)
+    assert mapped._lexical is None
+    assert mapped.search(query, k=2) == doc_index.search(query, k=2)
+    assert (mapped._lexical is not None) == hybrid
+
+    # Chunks added before the first search are in the postings built for it
+    loaded = DocumentIndex.load(tmp_path / "saved", doc_index.embeddings, mmap=False)
+    extra = paragraph(rng)
+    loaded.add_files([("notes.txt", extra.encode())])
+    doc_index.add_files([("notes.txt", extra.encode())])
+    assert [doc.page_content for doc in loaded.search(extra[:80], k=2)] == (
+        [doc.page_content for doc in doc_index.search(extra[:80], k=2)]
+    )
+
+
+@pytest.mark.parametrize("cached", [True, False])
+def test_quantized_index_rebuilds_from_original_vectors(new_index, rng, monkeypatch, cached):
+    import numpy as np
+    monkeypatch.setattr(ann_index, "MIN_TRAIN_VECTORS", 32)
+    kwargs = {} if cached else {"index_cache": None}
+    doc_index = new_index(index_type="pq", index_params={"m": 4, "nbits": 4}, **kwargs)
+    for name in ("a.txt", "b.txt", "c.txt"):
+        doc_index.add_files([(name, "\n\n".join(paragraph(rng) for _ in range(20)).encode())])
+    assert doc_index._ann_built
+
+    doc_index.remove_source("b.txt")
+    doc_index._flatten()
+    store = doc_index.vectorstore
+    texts = [store.docstore.search(store.index_to_docstore_id[i]).page_content for i in range(store.index.ntotal)]
+    assert len(texts) == 40
+    assert np.allclose(ann_index.index_vectors(store.index), doc_index.embeddings.embed_documents(texts))
+
+
+def test_recall_report_queries_are_held_out(monkeypatch):
+    import numpy as np
+    vectors = np.random.default_rng(0).normal(size=(500, 16)).astype("float32")
+    indexed = []
+    build_index = ann_index.build_index
+
+    def recording_build_index(vectors, index_type="flat", **params):
+        indexed.append(vectors)
+        return build_index(vectors, index_type, **params)
+
+    monkeypatch.setattr(ann_index, "build_index", recording_build_index)
+    rows = ann_index.recall_report(vectors, configs=[("flat", {})], n_queries=50)
+
+    assert rows[0]["recall"] == 1.0
+    # A fifth at most is held out as queries, and none of those are indexed
+    assert all(len(built) == 450 for built in indexed)
+    kept = {row.tobytes() for row in indexed[0]}
+    assert sum(row.tobytes() in kept for row in vectors) == 450
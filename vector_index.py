@@ -0,0 +1,865 @@
+import copy
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+from chunk_store import CHUNKS_NAME, ChunkStore
+from dedup import DEDUP, ChunkDeduplicator
+from index_cache import IndexCache
+from lexical_index import LexicalIndex
+from metrics import registry, stage, timed_iter
+from reranker import RERANK_CANDIDATES
+from ingest import (
+    CHUNK_OVERLAP, CHUNK_SIZE, iter_parsed, plan_parse_tasks, split_documents
+)
+
+# faiss, numpy, LangChain's FAISS store and ann_index are imported where used, keeping app startup cheap
+
+# Chunks embedded per call while streaming a file into the index
+EMBED_BATCH_SIZE = 64
+# Top-k results remembered per index until its contents change
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "256"))
+# Fuse BM25 keyword hits with vector hits; HYBRID_FETCH_K candidates come from each side
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+HYBRID_FETCH_K = 20
+RRF_K = 60
+# Bump when the layout written by ``DocumentIndex.save`` changes
+SAVED_INDEX_VERSION = 3
+MANIFEST_NAME = "manifest.json"
+INDEX_FILE_NAME = "index.faiss"
+# Open saved indexes memory-mapped, reading chunk text from disk per hit
+INDEX_MMAP = os.getenv("INDEX_MMAP", "0") == "1"
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Merge ranked ID lists into one, scoring each ID by the sum of 1 / (k + rank)."""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def read_manifest(path):
+    """The manifest of an index saved with ``DocumentIndex.save``, without loading the index."""
+    with open(Path(path) / MANIFEST_NAME) as f:
+        manifest = json.load(f)
+    if manifest.get("version") != SAVED_INDEX_VERSION:
+        raise ValueError(f"{path} was saved in an unsupported format (version {manifest.get('version')})")
+    return manifest
+
+
+class IndexRetriever:
+    """Retriever over a ``DocumentIndex`` that serves repeated queries from its result cache."""
+
+    def __init__(self, doc_index, k=4):
+        self.doc_index = doc_index
+        self.k = k
+
+    def invoke(self, query):
+        return self.doc_index.search(query, k=self.k)
+
+
+class DocumentIndex:
+    """Session vector store that grows and shrinks one source file at a time.
+
+    Each file is embedded into its own FAISS index (or loaded from the
+    ``IndexCache``) and merged into the live store, so adding a lecture only
+    embeds that lecture and removing one deletes just its chunks.
+
+    With an ``index_type`` other than ``"flat"`` the live store's FAISS index
+    is rebuilt as that type (see ``ann_index.INDEX_TYPES``) once it holds at
+    least ``MIN_TRAIN_VECTORS`` chunks. Per-file cache entries stay flat.
+
+    A BM25 ``LexicalIndex`` is kept in step with the vector store; with
+    ``hybrid`` on, searches fuse both rankings. Given a ``reranker``, searches
+    over-fetch ``rerank_candidates`` chunks and let it pick the final k.
+
+    With ``dedup`` on, a chunk that repeats one already indexed (exactly or
+    nearly, see ``ChunkDeduplicator``) is not embedded or stored; its
+    metadata is appended to the kept chunk's ``also_in`` list instead.
+
+    An index opened with ``load(..., mmap=True)`` searches vectors mapped
+    from disk and reads chunks from a ``ChunkStore``; the first change to it
+    copies everything into memory.
+    """
+
+    def __init__(self, embeddings, model_name, index_cache=None, index_type="flat",
+                 index_params=None, hybrid=HYBRID_SEARCH, reranker=None,
+                 rerank_candidates=RERANK_CANDIDATES, dedup=DEDUP):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.index_cache = index_cache
+        self.index_type = index_type
+        self.index_params = index_params or {}
+        self.vectorstore = None
+        self.hybrid = hybrid
+        self.reranker = reranker
+        self.rerank_candidates = rerank_candidates
+        # BM25 postings; after a load, built from the chunk text on the first hybrid search
+        self._lexical = LexicalIndex()
+        self.dedup = dedup
+        # Built from the chunk text on first use after a load
+        self._deduplicator = None
+        # source name -> IDs of other files' chunks its duplicate chunks were merged into
+        self._merged = {}
+        self._dedup_stats = {
+            "exact": 0, "near": 0, "embeds_skipped": 0, "text_bytes": 0,
+            "embed_seconds": 0.0, "embedded": 0,
+        }
+        # Whether the live store's index has been rebuilt as ``index_type``
+        self._ann_built = False
+        # Bumped on every change to the live store; cached results from older versions are stale
+        self.version = 0
+        self._results = OrderedDict()
+        self._results_version = 0
+        self._results_lock = threading.Lock()
+        self.result_cache_hits = 0
+        self.result_cache_misses = 0
+        # source name -> (content key, docstore ids of its chunks)
+        self._sources = {}
+
+    def _file_key(self, data):
+        return IndexCache.key(data, self.model_name, CHUNK_SIZE, CHUNK_OVERLAP)
+
+    def _set_key(self, content_keys):
+        digest = hashlib.sha256(
+            f"{self.model_name}\n{self.index_type}\n{self.hybrid}\n{self.dedup}".encode("utf-8")
+        )
+        for key in sorted(content_keys):
+            digest.update(key.encode("utf-8"))
+        return digest.hexdigest()
+
+    def set_key(self):
+        """Hash of the indexed document set, or None while a file is only partly indexed."""
+        keys = [key for key, _ in self._sources.values()]
+        if not keys or None in keys:
+            return None
+        return self._set_key(set(keys))
+
+    def planned_set_key(self, files):
+        """The ``set_key`` this index would have after ``add_files(files)``."""
+        keys = {name: key for name, (key, _) in self._sources.items()}
+        if None in keys.values():
+            return None
+        for name, data in files:
+            keys[name] = self._file_key(data)
+        return self._set_key(set(keys.values())) if keys else None
+
+    @property
+    def mapped(self):
+        """Whether vectors and chunks are read from disk (see ``load``)."""
+        return self.vectorstore is not None and isinstance(self.vectorstore.docstore, ChunkStore)
+
+    def _in_memory_store(self):
+        """A copy of the live store held entirely in memory."""
+        import faiss
+        from langchain_community.docstore.in_memory import InMemoryDocstore
+        from langchain_community.vectorstores import FAISS
+        docstore = self.vectorstore.docstore
+        if self.mapped:
+            # clone_index would keep viewing the mapped file, which can't be appended to
+            index = faiss.deserialize_index(faiss.serialize_index(self.vectorstore.index))
+            docs = dict(docstore.iter_documents())
+        else:
+            index = faiss.clone_index(self.vectorstore.index)
+            docs = dict(docstore._dict)
+        return FAISS(self.embeddings, index, InMemoryDocstore(docs), dict(self.vectorstore.index_to_docstore_id))
+
+    def _materialize(self):
+        """Load a mapped index into memory before changing it."""
+        if self.mapped:
+            docstore = self.vectorstore.docstore
+            self.vectorstore = self._in_memory_store()
+            docstore.close()
+
+    def close(self):
+        """Close the chunk store of a mapped index; it can't be searched afterwards."""
+        if self.mapped:
+            self.vectorstore.docstore.close()
+
+    def clone(self):
+        """Independent copy that can be changed without affecting sessions sharing this one."""
+        clone = DocumentIndex(
+            self.embeddings, self.model_name, self.index_cache, self.index_type,
+            self.index_params, self.hybrid, self.reranker, self.rerank_candidates, self.dedup
+        )
+        if self.vectorstore is not None:
+            clone.vectorstore = self._in_memory_store()
+        clone._lexical = copy.deepcopy(self._lexical)
+        clone._deduplicator = copy.deepcopy(self._deduplicator)
+        clone._merged = {name: list(ids) for name, ids in self._merged.items()}
+        clone._dedup_stats = dict(self._dedup_stats)
+        clone._ann_built = self._ann_built
+        clone._sources = {name: (key, list(ids)) for name, (key, ids) in self._sources.items()}
+        return clone
+
+    def memory_bytes(self):
+        """Approximate resident size: vectors, chunk text and the lexical index.
+
+        A mapped index only counts its lexical index, if built; its vectors
+        and text stay on disk and in the OS page cache.
+        """
+        if self.vectorstore is None:
+            return 0
+        lexical_bytes = self._lexical.memory_bytes() if self._lexical is not None else 0
+        if self.mapped:
+            return lexical_bytes
+        text_bytes = sum(
+            len(doc.page_content) for doc in self.vectorstore.docstore._dict.values()
+        )
+        from ann_index import index_memory_bytes
+        dedup_bytes = self._deduplicator.memory_bytes() if self._deduplicator is not None else 0
+        return index_memory_bytes(self.vectorstore.index) + text_bytes + lexical_bytes + dedup_bytes
+
+    def save(self, path):
+        """Write the index to the folder ``path``, replacing any index saved there.
+
+        The folder holds the FAISS index, the chunks in a ``ChunkStore`` and
+        a ``manifest.json`` with the settings and per-file content keys, so
+        ``load`` restores an index that skips unchanged files when the same
+        documents are added again.
+        """
+        if self.vectorstore is None:
+            raise ValueError("Cannot save an empty index")
+        import faiss
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.parent / f".tmp-{path.name}-{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        tmp_path.mkdir()
+        faiss.write_index(self.vectorstore.index, str(tmp_path / INDEX_FILE_NAME))
+        docstore = self.vectorstore.docstore
+        if self.mapped:
+            chunks = docstore.iter_documents()
+        else:
+            index_to_id = self.vectorstore.index_to_docstore_id
+            chunks = (
+                (index_to_id[position], docstore._dict[index_to_id[position]])
+                for position in range(self.vectorstore.index.ntotal)
+            )
+        ChunkStore.write(tmp_path / CHUNKS_NAME, chunks)
+        manifest = {
+            "version": SAVED_INDEX_VERSION,
+            "created": time.time(),
+            "model": self.model_name,
+            "index_type": self.index_type,
+            "index_params": self.index_params,
+            "hybrid": self.hybrid,
+            "ann_built": self._ann_built,
+            "set_key": self.set_key(),
+            "chunks": self.vectorstore.index.ntotal,
+            "sources": {name: [key, ids] for name, (key, ids) in self._sources.items()},
+            "dedup": self.dedup,
+            "merged": self._merged,
+            "dedup_stats": self._dedup_stats,
+        }
+        with open(tmp_path / MANIFEST_NAME, "w") as f:
+            json.dump(manifest, f)
+        # Swap folders so a reader never sees a half-written index
+        old_path = path.parent / f".old-{path.name}-{os.getpid()}"
+        if path.exists():
+            os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path, embeddings, index_cache=None, reranker=None,
+             rerank_candidates=RERANK_CANDIDATES, mmap=INDEX_MMAP):
+        """Restore an index written by ``save``; ``embeddings`` must be the model it was built with.
+
+        With ``mmap`` the vectors stay in the saved file, mapped into memory
+        by the OS, and chunk text and metadata are read from the folder's
+        ``ChunkStore`` only for the hits a search returns. What stays
+        resident is the FAISS position -> chunk ID map (roughly 100 bytes a
+        chunk) and, once the first hybrid search builds them from the store,
+        the BM25 postings; an index saved without ``hybrid`` never builds them.
+        """
+        import faiss
+        from langchain_community.docstore.in_memory import InMemoryDocstore
+        from langchain_community.vectorstores import FAISS
+        manifest = read_manifest(path)
+        doc_index = cls(
+            embeddings, manifest["model"], index_cache, manifest["index_type"],
+            manifest["index_params"], manifest["hybrid"], reranker, rerank_candidates, manifest["dedup"]
+        )
+        path = Path(path)
+        store = ChunkStore(path / CHUNKS_NAME)
+        if mmap:
+            index = faiss.read_index(
+                str(path / INDEX_FILE_NAME), faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+            )
+        else:
+            index = faiss.read_index(str(path / INDEX_FILE_NAME))
+        docs = {} if mmap else dict(store.iter_documents())
+        doc_index.vectorstore = FAISS(
+            embeddings, index, store if mmap else InMemoryDocstore(docs), dict(enumerate(store.ids()))
+        )
+        # BM25 postings are rebuilt from the chunk text when first needed rather than stored
+        doc_index._lexical = None
+        if not mmap:
+            store.close()
+        doc_index._ann_built = manifest["ann_built"]
+        doc_index._sources = {name: (key, ids) for name, (key, ids) in manifest["sources"].items()}
+        doc_index._merged = manifest["merged"]
+        doc_index._dedup_stats.update(manifest["dedup_stats"])
+        doc_index.version += 1
+        return doc_index
+
+    def _load_cached(self, name, key):
+        if self.index_cache is None:
+            return None
+        vectorstore = self.index_cache.get(key, self.embeddings)
+        if vectorstore is not None:
+            for doc in vectorstore.docstore._dict.values():
+                doc.metadata["source"] = name
+        return vectorstore
+
+    def _attach(self, name, key, file_store):
+        if file_store is None:
+            return 0
+        self._materialize()
+        ids = list(file_store.index_to_docstore_id.values())
+        docs = [file_store.docstore.search(doc_id) for doc_id in ids]
+        ids, docs, duplicates = self._deduplicate(ids, docs)
+        if duplicates:
+            # Keep only the file's new chunks, reading their vectors back out of the cached index
+            from langchain_community.vectorstores import FAISS
+            from ann_index import index_vectors
+            vectors = index_vectors(file_store.index)
+            positions = {doc_id: position for position, doc_id in file_store.index_to_docstore_id.items()}
+            file_store = FAISS.from_embeddings(
+                [(doc.page_content, vectors[positions[doc_id]]) for doc_id, doc in zip(ids, docs)],
+                self.embeddings, metadatas=[doc.metadata for doc in docs], ids=ids
+            ) if ids else None
+        if file_store is not None:
+            self._attach_store(file_store, ids, docs)
+        self._sources[name] = (key, ids)
+        self._merge_duplicates(name, [(doc.metadata, kept_id) for doc, kept_id in duplicates])
+        self.version += 1
+        return len(ids) + len(duplicates)
+
+    def _attach_store(self, file_store, ids, docs):
+        if self._lexical is not None:
+            self._lexical.add_many(ids, [doc.page_content for doc in docs])
+        if self.vectorstore is None:
+            self.vectorstore = file_store
+            self._ann_built = False
+        elif self._ann_built:
+            # FAISS can only merge indexes of the same type, so add the vectors instead
+            from ann_index import index_vectors
+            self.vectorstore.add_embeddings(
+                zip([doc.page_content for doc in docs], index_vectors(file_store.index)),
+                metadatas=[doc.metadata for doc in docs],
+                ids=ids
+            )
+        else:
+            self.vectorstore.merge_from(file_store)
+
+    def _build_ann(self):
+        """Rebuild the live index as ``index_type`` once there are enough vectors to train it."""
+        if self.index_type == "flat" or self._ann_built or self.vectorstore is None:
+            return
+        from ann_index import MIN_TRAIN_VECTORS, build_index, index_vectors
+        if self.vectorstore.index.ntotal < MIN_TRAIN_VECTORS:
+            return
+        self.vectorstore.index = build_index(
+            index_vectors(self.vectorstore.index), self.index_type, **self.index_params
+        )
+        self._ann_built = True
+        self.version += 1
+
+    def _flatten(self):
+        """Turn the live index back into an exact flat one."""
+        if self._ann_built:
+            from ann_index import build_index
+            self.vectorstore.index = build_index(self._original_vectors(), "flat")
+            self._ann_built = False
+
+    def _original_vectors(self):
+        """The live chunks' vectors in position order, as embedded.
+
+        A quantized index only gives back approximations, and retraining on
+        those would compound the error with every rebuild. Its vectors are
+        read from each file's cache entry instead, and chunks without one
+        are embedded again.
+        """
+        import numpy as np
+        from ann_index import QUANTIZED_TYPES, index_vectors
+        if self.index_type not in QUANTIZED_TYPES:
+            return index_vectors(self.vectorstore.index)
+        positions = self.vectorstore.index_to_docstore_id
+        ids = [positions[position] for position in range(self.vectorstore.index.ntotal)]
+        wanted = set(ids)
+        vectors = {}
+        if self.index_cache is not None:
+            for key, _ in self._sources.values():
+                cached = self.index_cache.get(key, self.embeddings) if key is not None else None
+                if cached is None:
+                    continue
+                cached_vectors = index_vectors(cached.index)
+                for position, doc_id in cached.index_to_docstore_id.items():
+                    if doc_id in wanted:
+                        vectors[doc_id] = cached_vectors[position]
+        missing = [doc_id for doc_id in ids if doc_id not in vectors]
+        if missing:
+            docstore = self.vectorstore.docstore
+            embedded = self.embeddings.embed_documents([docstore.search(doc_id).page_content for doc_id in missing])
+            vectors.update(zip(missing, embedded))
+        return np.array([vectors[doc_id] for doc_id in ids], dtype="float32")
+
+    def _iter_chunks(self):
+        """``(chunk ID, Document)`` for every chunk in the live store."""
+        docstore = self.vectorstore.docstore
+        if isinstance(docstore, ChunkStore):
+            return docstore.iter_documents()
+        return docstore._dict.items()
+
+    def _get_lexical(self):
+        if self._lexical is None:
+            lexical = LexicalIndex()
+            for doc_id, doc in self._iter_chunks():
+                lexical.add(doc_id, doc.page_content)
+            # Assigned once complete: concurrent searches on a shared index may both build it
+            self._lexical = lexical
+        return self._lexical
+
+    def _get_deduplicator(self):
+        if self._deduplicator is None:
+            self._deduplicator = ChunkDeduplicator()
+            if self.vectorstore is not None:
+                for doc_id, doc in self._iter_chunks():
+                    self._deduplicator.add(doc_id, doc.page_content)
+        return self._deduplicator
+
+    def _deduplicate(self, ids, docs):
+        """Split chunks into new ones and ``(doc, kept chunk ID)`` repeats of indexed or earlier ones."""
+        if not self.dedup:
+            return ids, docs, []
+        with stage("dedup", chunks=len(docs)) as dedup_stage:
+            deduplicator = self._get_deduplicator()
+            new_ids, new_docs, duplicates = [], [], []
+            for doc_id, doc in zip(ids, docs):
+                match = deduplicator.find(doc.page_content)
+                if match is None:
+                    deduplicator.add(doc_id, doc.page_content)
+                    new_ids.append(doc_id)
+                    new_docs.append(doc)
+                else:
+                    duplicates.append((doc, match[0]))
+                    self._dedup_stats[match[1]] += 1
+                    self._dedup_stats["text_bytes"] += len(doc.page_content)
+            dedup_stage.update(duplicates=len(duplicates))
+        return new_ids, new_docs, duplicates
+
+    def _set_also_in(self, doc_id, also_in, metadata=None):
+        """Replace a chunk's ``also_in`` list (and optionally the rest of its metadata)."""
+        from langchain_core.documents import Document
+        docstore = self.vectorstore.docstore
+        doc = docstore.search(doc_id)
+        metadata = {key: value for key, value in (metadata or doc.metadata).items() if key != "also_in"}
+        if also_in:
+            metadata["also_in"] = also_in
+        # A new Document: sessions sharing the index this one was cloned from hold the old one
+        docstore._dict[doc_id] = Document(id=doc_id, page_content=doc.page_content, metadata=metadata)
+
+    def _merge_duplicates(self, name, duplicates):
+        """Record each ``(metadata, kept chunk ID)`` duplicate's metadata on the chunk it repeats."""
+        if not duplicates:
+            return
+        self._materialize()
+        docstore = self.vectorstore.docstore
+        for metadata, kept_id in duplicates:
+            also_in = docstore.search(kept_id).metadata.get("also_in", [])
+            self._set_also_in(kept_id, also_in + [{**metadata, "source": name}])
+            self._merged.setdefault(name, []).append(kept_id)
+        self._sources.setdefault(name, (None, []))
+        self.version += 1
+
+    def _add_alias(self, name, key):
+        """Record ``name`` as another copy of the indexed file with content ``key``; returns its chunks."""
+        original = next(
+            (source for source, (source_key, _) in self._sources.items() if source_key == key and source != name),
+            None
+        )
+        if original is None:
+            return 0
+        docstore = self.vectorstore.docstore
+        duplicates = []
+        for doc_id in self._sources[original][1]:
+            metadata = {k: v for k, v in docstore.search(doc_id).metadata.items() if k != "also_in"}
+            duplicates.append((metadata, doc_id))
+        # The original's own repeats of other files' chunks are repeated by the copy too
+        for doc_id in dict.fromkeys(self._merged.get(original, [])):
+            for entry in docstore.search(doc_id).metadata.get("also_in", []):
+                if entry["source"] == original:
+                    duplicates.append((entry, doc_id))
+        self._merge_duplicates(name, duplicates)
+        self._sources[name] = (key, [])
+        self.version += 1
+        return len(duplicates)
+
+    def _add_batch(self, name, batch, file_store):
+        """Embed one batch of chunks, minus repeats of chunks already indexed, and store it."""
+        ids, batch, duplicates = self._deduplicate([str(uuid.uuid4()) for _ in batch], batch)
+        if batch:
+            texts = [doc.page_content for doc in batch]
+            start = time.perf_counter()
+            try:
+                with stage("embed", chunks=len(texts)):
+                    text_embeddings = list(zip(texts, self.embeddings.embed_documents(texts)))
+            except BaseException:
+                # The chunks never made it in, so later ones must not be matched against them
+                if self._deduplicator is not None:
+                    self._deduplicator.remove(ids)
+                raise
+            self._dedup_stats["embed_seconds"] += time.perf_counter() - start
+            self._dedup_stats["embedded"] += len(texts)
+            with stage("index"):
+                file_store = self._store_batch(name, batch, texts, text_embeddings, file_store, ids)
+        if duplicates:
+            self._dedup_stats["embeds_skipped"] += len(duplicates)
+            with stage("index"):
+                file_store = self._store_duplicates(name, duplicates, file_store)
+        return file_store
+
+    def _store_duplicates(self, name, duplicates, file_store):
+        """Merge duplicate chunks into the ones they repeat; the file's own store still gets them."""
+        self._merge_duplicates(name, [(doc.metadata, kept_id) for doc, kept_id in duplicates])
+        if self.index_cache is None:
+            return file_store
+        # The per-file cache entry must hold the whole file, so reuse the kept chunk's vector
+        from langchain_community.vectorstores import FAISS
+        from ann_index import index_vector
+        kept_ids = {kept_id for _, kept_id in duplicates}
+        positions = {
+            doc_id: position for position, doc_id in self.vectorstore.index_to_docstore_id.items()
+            if doc_id in kept_ids
+        }
+        text_embeddings = [
+            (doc.page_content, index_vector(self.vectorstore.index, positions[kept_id]))
+            for doc, kept_id in duplicates
+        ]
+        metadatas = [doc.metadata for doc, _ in duplicates]
+        ids = [str(uuid.uuid4()) for _ in duplicates]
+        if file_store is None:
+            return FAISS.from_embeddings(text_embeddings, self.embeddings, metadatas=metadatas, ids=ids)
+        file_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        return file_store
+
+    def _store_batch(self, name, batch, texts, text_embeddings, file_store, ids=None):
+        """Append embedded chunks to the live store and the file's own store."""
+        from langchain_community.vectorstores import FAISS
+        metadatas = [doc.metadata for doc in batch]
+        ids = ids or [str(uuid.uuid4()) for _ in batch]
+        self._materialize()
+
+        if self.vectorstore is None:
+            self.vectorstore = FAISS.from_embeddings(
+                text_embeddings, self.embeddings, metadatas=metadatas, ids=ids
+            )
+            self._ann_built = False
+        else:
+            self.vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        if self._lexical is not None:
+            self._lexical.add_many(ids, texts)
+        # Until the whole file is in, its entry has no content key so a re-add redoes it
+        _, source_ids = self._sources.setdefault(name, (None, []))
+        source_ids.extend(ids)
+        self.version += 1
+
+        if self.index_cache is None:
+            return file_store
+        if file_store is None:
+            return FAISS.from_embeddings(
+                text_embeddings, self.embeddings, metadatas=metadatas, ids=ids
+            )
+        file_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        return file_store
+
+    def add_file(self, name, data, **kwargs):
+        """Index one file and return the number of chunks added."""
+        return self.add_files([(name, data)], **kwargs)[name]
+
+    def add_files(self, files, workers=None, batch_size=EMBED_BATCH_SIZE,
+                  on_progress=None, should_stop=None):
+        """Index ``(name, data)`` pairs and return chunks added per file name.
+
+        Re-adding a file with unchanged content is a no-op and a file whose
+        content changed replaces its previous chunks. Files missing from the
+        cache stream through parse -> split -> embed in batches of
+        ``batch_size`` chunks, each batch going into the live index as soon
+        as it is embedded, so memory stays bounded by the batch rather than
+        the corpus.
+
+        ``on_progress(stage, done, total)`` is called with stage ``"pages"``
+        (pages parsed), ``"files"`` (files fully indexed) and ``"chunks"``
+        (chunks embedded; total is None). If ``should_stop()`` returns True
+        the run ends after the current batch and everything indexed so far
+        is kept. An exception raised mid-run leaves the index in the same
+        consistent state.
+        """
+        files = list(files)
+        report = on_progress or (lambda stage, done, total: None)
+        added = {}
+        pending = []
+        pending_keys = set()
+        aliases = []
+        for name, data in files:
+            key = self._file_key(data)
+            existing = self._sources.get(name)
+            if existing is not None:
+                if existing[0] == key:
+                    added[name] = 0
+                    continue
+                self.remove_source(name)
+            # Identical content under another name is indexed once; the copy is merged into it
+            if key in pending_keys or any(
+                source_key == key for source_key, _ in self._sources.values()
+            ):
+                added[name] = 0
+                aliases.append((name, key))
+                continue
+
+            cached = self._load_cached(name, key)
+            if cached is not None:
+                added[name] = self._attach(name, key, cached)
+            else:
+                pending.append((name, data, key))
+                pending_keys.add(key)
+
+        for name, _, _ in pending:
+            added[name] = 0
+        files_done = len(files) - len(pending)
+        report("files", files_done, len(files))
+        tasks, total_pages = plan_parse_tasks([(name, data) for name, data, _ in pending])
+        pages_done = 0
+        chunks_done = 0
+        current = None
+        file_store = None
+        batch = []
+
+        def flush(count):
+            nonlocal batch, file_store, chunks_done
+            name = pending[current][0]
+            chunk_batch, batch = batch[:count], batch[count:]
+            file_store = self._add_batch(name, chunk_batch, file_store)
+            added[name] += len(chunk_batch)
+            chunks_done += len(chunk_batch)
+            report("chunks", chunks_done, None)
+
+        def finish_file():
+            nonlocal files_done, file_store
+            if batch:
+                flush(len(batch))
+            name, _, key = pending[current]
+            if name in self._sources:
+                self._sources[name] = (key, self._sources[name][1])
+                if file_store is not None:
+                    with stage("cache_write"):
+                        self.index_cache.put(
+                            key, file_store, meta={"source": name, "chunks": added[name]}
+                        )
+            file_store = None
+            files_done += 1
+            report("files", files_done, len(files))
+
+        for index, page in timed_iter(iter_parsed(tasks, workers), "parse"):
+            if index != current:
+                if current is not None:
+                    finish_file()
+                current = index
+
+            pages_done += 1
+            report("pages", pages_done, total_pages)
+            with stage("split"):
+                batch.extend(split_documents([page]))
+            while len(batch) >= batch_size:
+                flush(batch_size)
+                if should_stop is not None and should_stop():
+                    self._add_aliases(aliases)
+                    self._build_ann()
+                    return added
+
+        if current is not None:
+            finish_file()
+        self._add_aliases(aliases)
+        self._build_ann()
+        return added
+
+    def _add_aliases(self, aliases):
+        # After the originals are in; an original cut short by should_stop leaves its copy out too
+        for name, key in aliases:
+            self._add_alias(name, key)
+
+    def remove_source(self, name):
+        """Delete every chunk that came from ``name`` and return how many were removed.
+
+        A chunk that another file repeated stays in the index as that file's.
+        """
+        entry = self._sources.pop(name, None)
+        if entry is None:
+            return 0
+        self.version += 1
+        _, ids = entry
+        merged = self._merged.pop(name, [])
+        if not self._sources:
+            self.close()
+            self.vectorstore = None
+            self._lexical = LexicalIndex()
+            self._deduplicator = None
+            self._merged = {}
+            return len(ids) + len(merged)
+        if not ids and not merged:
+            return 0
+        self._materialize()
+        removed = self._release_chunks(name, ids, merged)
+        if removed:
+            if self._lexical is not None:
+                self._lexical.remove(removed)
+            if self._deduplicator is not None:
+                self._deduplicator.remove(removed)
+            # HNSW can't remove vectors and IVF keeps stale positions, so delete on a flat index
+            self._flatten()
+            self.vectorstore.delete(removed)
+            self._build_ann()
+        return len(ids) + len(merged)
+
+    def _release_chunks(self, name, ids, merged):
+        """Drop ``name`` from the chunks' ``also_in`` lists; returns its chunks no other file repeated."""
+        docstore = self.vectorstore.docstore
+
+        def others(doc_id):
+            return [entry for entry in docstore.search(doc_id).metadata.get("also_in", [])
+                    if entry["source"] != name]
+
+        for doc_id in set(merged) - set(ids):
+            self._set_also_in(doc_id, others(doc_id))
+        removed = []
+        for doc_id in ids:
+            also_in = others(doc_id)
+            if not also_in:
+                removed.append(doc_id)
+                continue
+            # Hand the chunk to the first other file that had it
+            heir = also_in[0]["source"]
+            self._set_also_in(doc_id, also_in[1:], metadata=also_in[0])
+            self._sources[heir][1].append(doc_id)
+            self._merged[heir].remove(doc_id)
+            if not self._merged[heir]:
+                del self._merged[heir]
+        return removed
+
+    def chunk_counts(self):
+        """Chunks per source file, counting those merged into another file's copy."""
+        if self.vectorstore is None:
+            return {}
+        counts = {name: len(ids) + len(self._merged.get(name, ())) for name, (_, ids) in self._sources.items()}
+        return {name: count for name, count in counts.items() if count}
+
+    def dedup_report(self):
+        """Duplicate chunks merged so far and estimates of what skipping them saved.
+
+        Embedding time is estimated from this index's own average per chunk;
+        index size counts the vectors and text that were not stored.
+        """
+        stats = self._dedup_stats
+        per_chunk = stats["embed_seconds"] / stats["embedded"] if stats["embedded"] else 0.0
+        dim = self.vectorstore.index.d if self.vectorstore is not None else 0
+        duplicates = stats["exact"] + stats["near"]
+        return {
+            "duplicates": duplicates,
+            "exact": stats["exact"],
+            "near": stats["near"],
+            "embed_seconds_saved": stats["embeds_skipped"] * per_chunk,
+            "index_bytes_saved": duplicates * dim * 4 + stats["text_bytes"],
+        }
+
+    def _cached_result(self, key):
+        with self._results_lock:
+            if self._results_version != self.version:
+                self._results.clear()
+                self._results_version = self.version
+            docs = self._results.get(key)
+            if docs is None:
+                return None
+            self._results.move_to_end(key)
+            self.result_cache_hits += 1
+        registry.inc("study_buddy_result_cache_total", result="hit")
+        return list(docs)
+
+    def _store_result(self, key, docs, version, keep=True):
+        registry.inc("study_buddy_result_cache_total", result="miss")
+        with self._results_lock:
+            self.result_cache_misses += 1
+            # Don't store results computed against an index that changed meanwhile
+            if keep and version == self.version == self._results_version:
+                self._results[key] = docs
+                while len(self._results) > RESULT_CACHE_SIZE:
+                    self._results.popitem(last=False)
+
+    def search(self, query, k=4):
+        """Top-k chunks for ``query``, reusing results until the index changes."""
+        return self.search_many([query], k)[0]
+
+    def search_many(self, queries, k=4):
+        """Top-k chunks for each of ``queries``.
+
+        Queries missing from the result cache are embedded in one batch and
+        looked up with a single FAISS search; BM25 fusion and reranking then
+        run per query.
+        """
+        results = [self._cached_result((query, k)) for query in queries]
+        missing = [i for i, docs in enumerate(results) if docs is None]
+        vectorstore = self.vectorstore
+        if not missing or vectorstore is None:
+            return [docs if docs is not None else [] for docs in results]
+        version = self.version
+        texts = [queries[i] for i in missing]
+        fetch_k = max(k, self.rerank_candidates) if self.reranker is not None else k
+        with stage("search", chunks=fetch_k * len(texts)):
+            # The shared embedding engine caches query vectors itself
+            if hasattr(self.embeddings, "embed_queries"):
+                vectors = self.embeddings.embed_queries(texts)
+            else:
+                vectors = [self.embeddings.embed_query(text) for text in texts]
+            found = self._search_vectors(vectorstore, texts, vectors, fetch_k)
+        for i, query, docs in zip(missing, texts, found):
+            fell_back = False
+            if self.reranker is not None:
+                with stage("rerank", chunks=len(docs)):
+                    docs, fell_back = self.reranker.rerank(query, docs, k)
+            # A ranking the reranker didn't get to score isn't cached, so the next ask reranks it
+            self._store_result((query, k), docs, version, keep=not fell_back)
+            results[i] = list(docs)
+        return results
+
+    def _search_vectors(self, vectorstore, queries, vectors, k):
+        """Search ``vectorstore`` for every query at once, fusing in BM25 hits when hybrid."""
+        import numpy as np
+        fetch_k = max(k, HYBRID_FETCH_K) if self.hybrid else k
+        _, positions = vectorstore.index.search(np.array(vectors, dtype=np.float32), fetch_k)
+        rankings = []
+        for query, row in zip(queries, positions):
+            ids = [vectorstore.index_to_docstore_id[position] for position in row if position != -1]
+            if self.hybrid:
+                lexical_ids = [doc_id for doc_id, _ in self._get_lexical().search(query, fetch_k)]
+                ids = reciprocal_rank_fusion([ids, lexical_ids])[:k]
+            rankings.append(ids)
+        docstore = vectorstore.docstore
+        if isinstance(docstore, ChunkStore):
+            # One read for every hit in the batch
+            docs = docstore.get_many(doc_id for ids in rankings for doc_id in ids)
+            return [[docs[doc_id] for doc_id in ids] for ids in rankings]
+        return [[docstore.search(doc_id) for doc_id in ids] for ids in rankings]
+
+    def as_retriever(self, search_kwargs=None):
+        if self.vectorstore is None:
+            return None
+        return IndexRetriever(self, **(search_kwargs or {}))